@@ -1,3 +1,4 @@
+import torch
 import torch.nn as nn 
 from torch import nn, Tensor
 import positional_encoder as pe
@@ -46,7 +47,9 @@ class TimeSeriesTransformer(nn.Module):
         dropout_pos_enc: float=0.1,
         dim_feedforward_encoder: int=2048,
         dim_feedforward_decoder: int=2048,
-        num_predicted_features: int=1
+        num_predicted_features: int=1,
+        encoder_only: bool=False,
+        max_seq_len: int=5000
         ): 
 
         """
@@ -70,12 +73,18 @@ class TimeSeriesTransformer(nn.Module):
                                     only forecasting FCR-N prices in DK2, but in
                                     we wanted to also predict FCR-D with the same
                                     model, num_predicted_features should be 2.
+            encoder_only: bool, if True no decoder is built and forward maps the
+                          encoder output straight to num_predicted_features,
+                          tgt is then ignored.
+            max_seq_len: int, longest encoder input sequence, sizes the positional encoding
         """
 
         super().__init__() 
 
         self.dec_seq_len = dec_seq_len
 
+        self.encoder_only = encoder_only
+
         #print("input_size is: {}".format(input_size))
         #print("dim_val is: {}".format(dim_val))
 
@@ -98,7 +107,9 @@ class TimeSeriesTransformer(nn.Module):
         # Create positional encoder
         self.positional_encoding_layer = pe.PositionalEncoder(
             d_model=dim_val,
-            dropout=dropout_pos_enc
+            dropout=dropout_pos_enc,
+            max_seq_len=max_seq_len,
+            batch_first=batch_first
             )
 
         # The encoder layer used in the paper is identical to the one used by
@@ -122,6 +133,9 @@ class TimeSeriesTransformer(nn.Module):
             norm=None
             )
 
+        if encoder_only:
+            return
+
         decoder_layer = nn.TransformerDecoderLayer(
             d_model=dim_val,
             nhead=n_heads,
@@ -183,6 +197,9 @@ class TimeSeriesTransformer(nn.Module):
             )
         #print("From model.forward(): Size of src after encoder: {}".format(src.size()))
 
+        if self.encoder_only:
+            return self.linear_mapping(src) # shape [batch_size, src length, num_predicted_features]
+
         # Pass decoder input through decoder input layer
         decoder_output = self.decoder_input_layer(tgt) # src shape: [target sequence length, batch_size, dim_val] regardless of number of input features
         #print("From model.forward(): Size of decoder_output after linear decoder layer: {}".format(decoder_output.size()))
@@ -206,4 +223,124 @@ class TimeSeriesTransformer(nn.Module):
         decoder_output = self.linear_mapping(decoder_output) # shape [batch_size, target seq len]
         #print("From model.forward(): decoder_output size after linear_mapping = {}".format(decoder_output.size()))
 
-        return decoder_output
\ No newline at end of file
+        return decoder_output
+
+
+class TimeSeriesTransformerClassifier(nn.Module):
+
+    """
+    Encoder-only transformer for time series classification, selected with
+    pretraining.model_type: Transformer. Same input layer, positional encoding
+    and encoder stack as TimeSeriesTransformer, without the decoder: the encoder
+    output is pooled over time (mean) or read from a learnt CLS token prepended
+    to the sequence, then mapped to the class logits.
+    nn.TransformerEncoderLayer computes attention with
+    F.scaled_dot_product_attention, which dispatches to the fused / flash kernels
+    when the device supports them; with batch_first=True and the model in eval
+    mode the encoder also takes PyTorch's fast path.
+    """
+
+    def __init__(self,
+        input_size: int,
+        num_classes: int,
+        sequence_length: int,
+        batch_first: bool=True,
+        dim_val: int=64,
+        n_encoder_layers: int=2,
+        n_heads: int=4,
+        dropout_encoder: float=0.1,
+        dropout_pos_enc: float=0.1,
+        dim_feedforward_encoder: int=128,
+        pooling: str='mean'
+        ):
+
+        """
+        Args:
+            input_size: int, number of input variables. 1 if univariate.
+            num_classes: int, number of classes
+            sequence_length: int, length of the input series, sizes the positional encoding
+            batch_first: bool, input is [batch_size, seq_len, input_size] when True,
+                         [seq_len, batch_size, input_size] otherwise
+            dim_val: int, aka d_model
+            n_encoder_layers: int, number of stacked encoder layers
+            n_heads: int, the number of attention heads
+            dropout_encoder: float, the dropout rate of the encoder
+            dropout_pos_enc: float, the dropout rate of the positional encoder
+            dim_feedforward_encoder: int, number of neurons in the linear layer
+                                     of the encoder
+            pooling: str, 'mean' (average over time) or 'cls' (CLS token output)
+        """
+
+        super().__init__()
+
+        if pooling not in ('mean', 'cls'):
+            raise ValueError(f"pooling must be 'mean' or 'cls', got {pooling}")
+
+        self.batch_first = batch_first
+
+        self.pooling = pooling
+
+        self.time_dim = 1 if batch_first else 0
+
+        self.encoder_input_layer = nn.Linear(
+            in_features=input_size,
+            out_features=dim_val
+            )
+
+        if pooling == 'cls':
+            self.cls_token = nn.Parameter(torch.zeros(1, 1, dim_val))
+
+        # the CLS token takes one extra position
+        self.positional_encoding_layer = pe.PositionalEncoder(
+            d_model=dim_val,
+            dropout=dropout_pos_enc,
+            max_seq_len=sequence_length + (pooling == 'cls'),
+            batch_first=batch_first
+            )
+
+        encoder_layer = nn.TransformerEncoderLayer(
+            d_model=dim_val,
+            nhead=n_heads,
+            dim_feedforward=dim_feedforward_encoder,
+            dropout=dropout_encoder,
+            batch_first=batch_first
+            )
+
+        self.encoder = nn.TransformerEncoder(
+            encoder_layer=encoder_layer,
+            num_layers=n_encoder_layers,
+            norm=None,
+            enable_nested_tensor=False
+            )
+
+        self.classifier = nn.Linear(
+            in_features=dim_val,
+            out_features=num_classes
+            )
+
+    def forward(self, src: Tensor) -> Tensor:
+        """
+        Returns the class logits, shape [batch_size, num_classes]
+
+        Args:
+            src: Shape (N, S, E) if batch_first=True or (S, N, E) otherwise,
+                 S is the sequence length, N the batch size and E the number of features
+        """
+
+        src = self.encoder_input_layer(src)
+
+        if self.pooling == 'cls':
+            batch_size = src.size(1 - self.time_dim)
+            cls_token = self.cls_token.expand(batch_size, -1, -1) if self.batch_first else self.cls_token.expand(-1, batch_size, -1)
+            src = torch.cat([cls_token, src], dim=self.time_dim)
+
+        src = self.positional_encoding_layer(src)
+
+        src = self.encoder(src=src)
+
+        if self.pooling == 'cls':
+            pooled = src.select(self.time_dim, 0)
+        else:
+            pooled = src.mean(dim=self.time_dim)
+
+        return self.classifier(pooled)
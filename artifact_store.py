@@ -0,0 +1,104 @@
+import os
+import json
+import hashlib
+import datetime
+import numpy as np
+from synthetic_dataset import SyntheticDataset, write_link
+from conditional_dgan import ConditionalDGAN, CONDITIONAL_KEY
+
+STORE_VERSION = 1
+# DGAN_param keys that do not change the trained generator
+NON_TRAINING_KEYS = ('label', 'sample_len', 'max_sequence_len')
+
+
+def array_fingerprint(X, y=None):
+    '''
+    Content hash of the generator training data, independent of how the split was produced.
+    '''
+    sha1 = hashlib.sha1()
+    X = np.ascontiguousarray(X)
+    sha1.update(f'{X.shape}{X.dtype.str}'.encode('utf-8'))
+    sha1.update(X.tobytes())
+    if y is not None:
+        sha1.update('\x00'.join(np.asarray(y).astype(str).tolist()).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def _hash(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:20]
+
+
+class ArtifactStore:
+    '''
+    Content addressed store for trained generators and the data they generated.
+        <root>/<model_key>/manifest.json
+        <root>/<model_key>/models/model_<label>.pt
+        <root>/<model_key>/samples_<generate_n_sample>/manifest.json, X.npy, y.npy
+        <root>/../<dataset>/<percentage_of_original_data>/link.json
+    The link.json keeps the DGAN_data/<dataset>/<ratio> path of the layout before the store pointing at the
+    latest generated data of that dataset and ratio, load_synthetic_dataset follows it.
+    model_key hashes the training data fingerprint, the full DGAN config and the seed, so runs with
+    different epochs or hyperparameters never overwrite each other and identical runs are reused.
+    '''
+    def __init__(self, root='DGAN_data/store'):
+        self.root = root
+
+    def model_key(self, X, y, DGAN_param:dict):
+        params = {key: value for key, value in DGAN_param.items() if key not in NON_TRAINING_KEYS}
+        return _hash({'version': STORE_VERSION, 'data': array_fingerprint(X, y), 'DGAN_param': params})
+
+    def model_dir(self, model_key):
+        return os.path.join(self.root, model_key)
+
+    def samples_dir(self, model_key, generate_n_sample:int):
+        return os.path.join(self.root, model_key, f'samples_{int(generate_n_sample)}')
+
+    def model_path(self, model_key, label):
+        return os.path.join(self.model_dir(model_key), 'models', f'model_{label}.pt')
+
+    def write_manifest(self, model_key, **fields):
+        path = os.path.join(self.model_dir(model_key), 'manifest.json')
+        manifest = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                manifest = json.load(file)
+        manifest.update(fields)
+        manifest.setdefault('created', datetime.datetime.now().isoformat())
+        os.makedirs(self.model_dir(model_key), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(manifest, file, indent=2, default=str)
+
+    def has_models(self, model_key, labels):
+        # labels is [CONDITIONAL_KEY] for the single generator of generator_mode 'conditional'
+        return all(ConditionalDGAN.exists(self.model_path(model_key, label)) if label == CONDITIONAL_KEY else os.path.exists(self.model_path(model_key, label))
+                   for label in labels)
+
+    def save_models(self, model_key, models:dict):
+        os.makedirs(os.path.join(self.model_dir(model_key), 'models'), exist_ok=True)
+        for label, model in models.items():
+            model.save(self.model_path(model_key, label))
+        self.write_manifest(model_key, labels=[str(label) for label in models.keys()])
+
+    def load_models(self, model_key, labels, generator='dgan'):
+        # generator is the backend of the generators registry the models were trained with
+        from generators import load_generator
+        return {label: ConditionalDGAN.load(self.model_path(model_key, label)) if label == CONDITIONAL_KEY else load_generator(generator, self.model_path(model_key, label))
+                for label in labels}
+
+    def generated_data_path(self, model_key, generate_n_sample:int):
+        return self.samples_dir(model_key, generate_n_sample)
+
+    def has_generated_data(self, model_key, generate_n_sample:int):
+        return SyntheticDataset.exists(self.generated_data_path(model_key, generate_n_sample))
+
+    def load_generated_data(self, model_key, generate_n_sample:int, mmap_mode='r'):
+        return SyntheticDataset(self.generated_data_path(model_key, generate_n_sample), mmap_mode=mmap_mode)
+
+    def dataset_dir(self, dataset_name, ratio):
+        return os.path.join(os.path.dirname(self.root), str(dataset_name), str(ratio))
+
+    def link_generated_data(self, model_key, generate_n_sample:int, dataset_name, ratio):
+        # dataset / ratio -> model_key index, written as a link in the old DGAN_data/<dataset>/<ratio> directory
+        path = self.dataset_dir(dataset_name, ratio)
+        write_link(path, self.generated_data_path(model_key, generate_n_sample))
+        return path
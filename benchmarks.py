@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import yaml
+import copy
+import torch
+from sktime.datasets import load_from_tsfile
+from utilities_helper import *
+
+
+def read_yaml_config(CONFIG):
+    with open(CONFIG, 'r') as file:
+        try:
+            config = yaml.safe_load(file)
+            return config
+        except yaml.YAMLError as exc:
+            print(exc)
+            return None
+
+
+def timed(fn, *args, repeats=1, **kwargs):
+    # returns the best wall time over the repeats and the last result
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_datasets(config_data):
+    data = pd.read_csv(os.path.join(os.getcwd(), "all_experiments_param.csv"))
+    datasets_root = os.path.join(config_data['experiment_params']['root_path'], "Datasets")
+    for dataset_name in data['dataset_name'].unique():
+        train_path = os.path.join(datasets_root, dataset_name, f"{dataset_name}_TRAIN.ts")
+        if not os.path.exists(train_path):
+            print(f"Skipping {dataset_name}, {train_path} not found")
+            continue
+        yield dataset_name, train_path
+
+
+def benchmark_preprocess(config_data):
+    '''
+    preprocess_dgan vs nested_to_array on every UEA dataset of the experiment grid.
+    '''
+    results = []
+    for dataset_name, train_path in benchmark_datasets(config_data):
+        X, _ = load_from_tsfile(train_path)
+        try:
+            series_length = nested_to_array(X, dtype=np.float64, pad=False).shape[1]
+        except ValueError:
+            print(f"Skipping {dataset_name}, series have unequal length")
+            continue
+        old_time, old = timed(preprocess_dgan, X, series_length)
+        new_time, new = timed(nested_to_array, X, series_length, repeats=3)
+        identical = np.array_equal(old.astype(np.float32), new) and np.array_equal(old, nested_to_array(X, series_length, dtype=np.float64))
+        results.append({'dataset_name': dataset_name, 'shape': new.shape, 'preprocess_dgan_s': old_time,
+                        'nested_to_array_s': new_time, 'speedup': old_time / new_time, 'identical': identical})
+        print(results[-1])
+    return pd.DataFrame(results)
+
+
+def benchmark_config(config_data, n_samples=2048):
+    # random data shaped like the configured dataset, and concrete values for the 'Null' LSTM/GRU params
+    config_data = copy.deepcopy(config_data)
+    config_data['pretraining']['hidden_size'] = 64 if config_data['pretraining']['hidden_size'] in (None, 'Null') else config_data['pretraining']['hidden_size']
+    params = config_data['experiment_params']
+    X = np.random.randn(n_samples, params['sequence_length'], params['num_features']).astype(np.float32)
+    y = np.random.randint(0, params['num_classes'], n_samples)
+    return config_data, X, y
+
+
+def samples_per_second(data_loader, model, device, epochs=3):
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.CrossEntropyLoss()
+    model.train()
+    start = time.perf_counter()
+    seen = 0
+    for _ in range(epochs):
+        for X, y in data_loader:
+            X = X.to(device)
+            y = y.type(torch.LongTensor).to(device)
+            loss = criterion(model(X.float()), y)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            seen += len(y)
+    return seen / (time.perf_counter() - start)
+
+
+def benchmark_dataloader(config_data):
+    '''
+    TimeSeriesDataset + default collate vs TensorTimeSeriesDataset + BatchSampler, in samples/sec.
+    '''
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    config_data, X, y = benchmark_config(config_data)
+    batch_size = config_data['pretraining']['batch_size']
+    loaders = {'TimeSeriesDataset': DataLoader(TimeSeriesDataset(X.astype(np.float64), y), batch_size=batch_size, shuffle=True),
+               'TensorTimeSeriesDataset': create_batch_dataloader(X, y, batch_size=batch_size, shuffle=True)}
+    results = []
+    for name, data_loader in loaders.items():
+        start = time.perf_counter()
+        for _ in data_loader:
+            pass
+        loader_only = len(y) / (time.perf_counter() - start)
+        for model_type in ['LSTM', 'GRU', 'inceptionTime']:
+            model = create_model_based_on_config(model_type, config_data).to(device)
+            results.append({'dataset': name, 'model': model_type, 'loader_samples_per_s': loader_only,
+                            'train_samples_per_s': samples_per_second(data_loader, model, device)})
+            print(results[-1])
+    return pd.DataFrame(results)
+
+
+def saved_activation_bytes(model, X, precision):
+    # bytes autograd keeps for backward in one forward pass, the part of training memory autocast shrinks
+    saved = []
+    def pack(tensor):
+        saved.append(tensor.numel() * tensor.element_size())
+        return tensor
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        with precision.autocast():
+            model(X.float())
+    return sum(saved)
+
+
+def benchmark_amp(config_data):
+    '''
+    fp32 vs MixedPrecision (bfloat16 on CPU, float16 + GradScaler on CUDA) for the classifiers and the encoder-only Transformer:
+    ms per train_loop step, activation memory saved for backward and peak CUDA memory.
+    '''
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    config_data, X, y = benchmark_config(config_data)
+    data_loader = create_batch_dataloader(X, y, batch_size=config_data['pretraining']['batch_size'], shuffle=True, drop_last=True)
+    X_batch, _ = next(iter(data_loader))
+    results = []
+    for model_type in ['inceptionTime', 'LSTM', 'GRU', 'Transformer']:
+        for amp in [False, True]:
+            torch.manual_seed(0)
+            model = create_model_based_on_config(model_type, config_data).to(device)
+            optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+            precision = MixedPrecision(device, amp)
+            # one warm-up epoch so kernel selection is not timed
+            train_loop(data_loader, model, device, nn.CrossEntropyLoss(), optimizer, print_every_n=np.inf, precision=precision)
+            if device.type == 'cuda':
+                torch.cuda.reset_peak_memory_stats(device)
+            start = time.perf_counter()
+            train_loop(data_loader, model, device, nn.CrossEntropyLoss(), optimizer, print_every_n=np.inf, precision=precision)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            step_ms = 1000 * (time.perf_counter() - start) / len(data_loader)
+            results.append({'model': model_type, 'amp': str(precision.dtype) if amp else 'fp32', 'step_ms': step_ms,
+                            'activation_MB': saved_activation_bytes(model, X_batch.to(device), precision) / 2**20,
+                            'peak_cuda_MB': torch.cuda.max_memory_allocated(device) / 2**20 if device.type == 'cuda' else None})
+            print(results[-1])
+    return pd.DataFrame(results)
+
+
+def benchmark_inception(config_data, kernel_sizes=((5, 11, 23), (9, 19, 39)), steps=20):
+    '''
+    InceptionBlock with Inception vs FusedInception: forward and forward+backward samples/sec,
+    and the largest output difference after loading the Inception weights into the fused block.
+    '''
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    config_data, X, _ = benchmark_config(config_data)
+    X = torch.from_numpy(X[:config_data['pretraining']['batch_size']]).transpose(1, 2).contiguous().to(device)
+    results = []
+    for sizes in kernel_sizes:
+        torch.manual_seed(0)
+        blocks = {'Inception': InceptionBlock(X.shape[1], kernel_sizes=list(sizes)).to(device),
+                  'FusedInception': InceptionBlock(X.shape[1], kernel_sizes=list(sizes), fused=True).to(device)}
+        blocks['FusedInception'].load_state_dict(blocks['Inception'].state_dict())
+        blocks['Inception'].eval()
+        blocks['FusedInception'].eval()
+        with torch.no_grad():
+            max_abs_diff = (blocks['Inception'](X) - blocks['FusedInception'](X)).abs().max().item()
+        for name, block in blocks.items():
+            block.train()
+            def forward():
+                with torch.no_grad():
+                    for _ in range(steps):
+                        block(X)
+            def forward_backward():
+                for _ in range(steps):
+                    block.zero_grad()
+                    block(X).sum().backward()
+            forward()
+            forward_time, _ = timed(forward, repeats=3)
+            backward_time, _ = timed(forward_backward, repeats=3)
+            results.append({'kernel_sizes': sizes, 'module': name, 'forward_samples_per_s': steps * len(X) / forward_time,
+                            'train_samples_per_s': steps * len(X) / backward_time, 'max_abs_diff': max_abs_diff})
+            print(results[-1])
+    return pd.DataFrame(results)
+
+
+def benchmark_generators(config_data, n_generate=100000):
+    '''
+    Every backend of the generators registry on one class of the configured shape: training time,
+    generated samples/sec and generator_fidelity against the training data (lower is better).
+    Backends whose dependencies are missing (gretel for 'dgan') are skipped.
+    '''
+    config_data, X, _ = benchmark_config(config_data)
+    DGAN_param = create_dgan_param(config_data)
+    Experiment_param = create_experiment_param(config_data)
+    results = []
+    for generator in available_generators():
+        DGAN_param['generator'] = generator
+        DGAN_param[generator] = config_data['datageneration'].get(generator)
+        try:
+            train_time, model = timed(train_generator, generator, X, dict(DGAN_param, label=0), Experiment_param)
+        except ImportError as exc:
+            print(f"Skipping {generator}, {exc}")
+            continue
+        generate_time, (_, X_generated) = timed(model.generate_numpy, n_generate)
+        results.append({'generator': generator, 'train_s': train_time, 'generated_samples_per_s': n_generate / generate_time,
+                        'fidelity': generator_fidelity(X, X_generated[:len(X)])})
+        print(results[-1])
+    return pd.DataFrame(results)
+
+
+BENCHMARKS = {'preprocess': benchmark_preprocess,
+              'dataloader': benchmark_dataloader,
+              'amp': benchmark_amp,
+              'inception': benchmark_inception,
+              'generators': benchmark_generators}
+
+if __name__ == '__main__':
+    ROOT = os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    CONFIG = os.path.join(os.getcwd(), "config.yaml")
+    config_data = read_yaml_config(CONFIG)
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        print(f"Running benchmark : {name}")
+        print(BENCHMARKS[name](config_data).to_string())
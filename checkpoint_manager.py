@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import contextlib
+import datetime
+import torch
+
+# overridden from the 'checkpoints' section of config.yaml through configure_checkpoints
+CHECKPOINTS = {'db_path': 'dataset/checkpoints.sqlite',
+               'keep_top_k': 1,                  # checkpoints kept per (experiment, phase, model type), None keeps all
+               'mode': 'min'}                    # min: lower metric (validation loss) is better, max: higher is better
+
+
+def configure_checkpoints(checkpoints_config):
+    if checkpoints_config:
+        CHECKPOINTS.update(checkpoints_config)
+    return CHECKPOINTS
+
+
+class CheckpointManager:
+    '''
+    Index of every model checkpoint written by train_and_log / train_and_log_multi / pretrain_and_finetune.
+    One SQLite row per checkpoint file: dataset, experiment id, phase ('pretraining', 'fine-tuning', ...),
+    model type, epoch and metric. "best / latest checkpoint of an experiment" is one indexed lookup
+    instead of listing dataset/<name>/ and stat-ing every run directory and .pt file, and it is safe
+    with several jobs writing to the same dataset directory.
+        manager = CheckpointManager()
+        path = manager.save(model.state_dict(), directory_path, Experiment_param, epoch=3, metric=val_loss)
+        manager.best(Experiment_param['Experiment_id'], 'pretraining', 'LSTM')
+    With keep_top_k=1 the checkpoint keeps the old model_<type>_.pt name and is overwritten in place,
+    with keep_top_k > 1 every epoch gets model_<type>_epoch<N>.pt and only the k best files are kept.
+    '''
+    def __init__(self, db_path=None, keep_top_k=None, mode=None):
+        self.db_path = db_path or CHECKPOINTS['db_path']
+        self.keep_top_k = keep_top_k if keep_top_k is not None else CHECKPOINTS['keep_top_k']
+        self.mode = mode or CHECKPOINTS['mode']
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('''CREATE TABLE IF NOT EXISTS checkpoints (
+                                    path TEXT PRIMARY KEY, dataset TEXT, experiment_id TEXT, phase TEXT, model_type TEXT,
+                                    epoch INTEGER, metric REAL, created TEXT)''')
+            connection.execute('CREATE INDEX IF NOT EXISTS checkpoints_run ON checkpoints (experiment_id, phase, model_type, metric)')
+            connection.execute('CREATE INDEX IF NOT EXISTS checkpoints_dataset ON checkpoints (dataset, phase, created)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # one short lived connection per call (committed and closed), the manager can be shared by processes and threads
+        connection = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _order(self):
+        return 'ASC' if self.mode == 'min' else 'DESC'
+
+    def checkpoint_path(self, directory_path, model_type, epoch):
+        if self.keep_top_k == 1:
+            return os.path.join(directory_path, f'model_{model_type}_.pt')
+        return os.path.join(directory_path, f'model_{model_type}_epoch{epoch}.pt')
+
+    def save(self, state_dict, directory_path, Experiment_param:dict, epoch:int, metric:float, model_type=None, phase=None, file_name=None):
+        '''
+        Writes state_dict (atomically, readers never see a partial file), records it and applies the retention policy.
+        model_type and phase default to Experiment_param['model type'] / ['experiment state'],
+        file_name replaces the model_<type>_ naming. Returns the checkpoint path, or None when the retention policy
+        dropped the new checkpoint right away (keep_top_k better ones of the run are already indexed).
+        '''
+        model_type = model_type or Experiment_param['model type']
+        phase = phase or Experiment_param['experiment state']
+        path = os.path.join(directory_path, file_name) if file_name else self.checkpoint_path(directory_path, model_type, epoch)
+        temp_path = f'{path}.tmp'
+        torch.save(state_dict, temp_path)
+        os.replace(temp_path, path)
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (os.path.abspath(path), Experiment_param['Dataset name'], Experiment_param['Experiment_id'],
+                                phase, model_type, int(epoch), float(metric), datetime.datetime.now().isoformat()))
+        stale = self.apply_retention(Experiment_param['Experiment_id'], phase, model_type)
+        return None if os.path.abspath(path) in stale else path
+
+    def apply_retention(self, experiment_id, phase, model_type):
+        # drops every checkpoint of the run beyond the keep_top_k best, rows and files
+        if not self.keep_top_k:
+            return []
+        with self._connect() as connection:
+            stale = [row[0] for row in connection.execute(f'''SELECT path FROM checkpoints WHERE experiment_id = ? AND phase = ? AND model_type = ?
+                                                              ORDER BY metric {self._order()}, epoch DESC LIMIT -1 OFFSET ?''',
+                                                          (experiment_id, phase, model_type, int(self.keep_top_k)))]
+            connection.executemany('DELETE FROM checkpoints WHERE path = ?', [(path,) for path in stale])
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+        return stale
+
+    def _query(self, where:dict, order:str):
+        clauses = ' AND '.join(f'{column} = ?' for column in where)
+        with self._connect() as connection:
+            return connection.execute(f'''SELECT path, dataset, experiment_id, phase, model_type, epoch, metric, created FROM checkpoints
+                                          {"WHERE " + clauses if clauses else ""} ORDER BY {order}''', tuple(where.values())).fetchall()
+
+    @staticmethod
+    def _filters(**filters):
+        return {column: value for column, value in filters.items() if value is not None}
+
+    def best(self, experiment_id, phase=None, model_type=None):
+        # path of the best checkpoint of the experiment (optionally of one phase / model type), None when nothing was saved
+        rows = self._query(self._filters(experiment_id=experiment_id, phase=phase, model_type=model_type), f'metric {self._order()}, epoch DESC LIMIT 1')
+        return rows[0][0] if rows else None
+
+    def latest(self, experiment_id=None, phase=None, model_type=None, dataset=None):
+        # path of the most recently written checkpoint matching the filters
+        rows = self._query(self._filters(experiment_id=experiment_id, phase=phase, model_type=model_type, dataset=dataset), 'created DESC LIMIT 1')
+        return rows[0][0] if rows else None
+
+    def records(self, experiment_id=None, phase=None, model_type=None, dataset=None):
+        columns = ['path', 'dataset', 'experiment_id', 'phase', 'model_type', 'epoch', 'metric', 'created']
+        rows = self._query(self._filters(experiment_id=experiment_id, phase=phase, model_type=model_type, dataset=dataset), 'created')
+        return [dict(zip(columns, row)) for row in rows]
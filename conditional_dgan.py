@@ -0,0 +1,71 @@
+import os
+import json
+import numpy as np
+
+# key of the single generator in the models dict / artifact store (model_conditional.pt) when generator_mode is 'conditional'
+CONDITIONAL_KEY = 'conditional'
+
+
+class ConditionalDGAN:
+    '''
+    One DGAN (or other backend of the generators registry) for every class, the class is the DGAN attribute (the index of the label in labels,
+    a discrete attribute) and the series are the features. Scaling, network init and optimization
+    are done once instead of once per label, and small classes share the batches of the large ones.
+    Samples of all classes come out of one generate_numpy call per chunk and are routed by their
+    generated attribute, see generate_chunks.
+        model = ConditionalDGAN(train_dgan(X, DGAN_param, Experiment_param, attributes=label_index), labels)
+        for label, X_chunk in model.generate_chunks({'walking': 1000, 'running': 1000}, 1024): ...
+    '''
+    def __init__(self, model, labels, generator='dgan'):
+        self.model = model
+        self.labels = list(labels)
+        # backend of the generators registry that trained model
+        self.generator = generator
+
+    @staticmethod
+    def label_attributes(split_data:dict):
+        # (X, attributes) for train_dgan from split_dataset_by_label, attribute = position of the label in split_data
+        X = np.concatenate([split_data[label]['X'] for label in split_data])
+        attributes = np.concatenate([np.full((len(split_data[label]['X']), 1), index, dtype=np.float64)
+                                     for index, label in enumerate(split_data)])
+        return X, attributes
+
+    def generate_chunks(self, counts:dict, chunk_size:int, max_rounds:int=None):
+        '''
+        Yields (label, X_chunk) until every label got counts[label] samples. Each round is one batched
+        generate_numpy(chunk_size), surplus samples of classes that are already complete are dropped.
+        Raises ValueError after max_rounds rounds (default 50x the rounds a balanced generator needs),
+        which means the generator almost never produces some class.
+        '''
+        remaining = {label: int(counts[label]) for label in self.labels if label in counts}
+        max_rounds = max_rounds or 50 * int(np.ceil(sum(remaining.values()) / chunk_size))
+        for _ in range(max_rounds):
+            if not any(remaining.values()):
+                return
+            attributes, features = self.model.generate_numpy(chunk_size)
+            label_index = np.rint(np.asarray(attributes, dtype=np.float64)[:, 0]).astype(np.int64)
+            for index, label in enumerate(self.labels):
+                if not remaining.get(label):
+                    continue
+                rows = np.flatnonzero(label_index == index)[:remaining[label]]
+                if len(rows):
+                    remaining[label] -= len(rows)
+                    yield label, np.asarray(features)[rows]
+        if any(remaining.values()):
+            raise ValueError(f"Conditional generator did not produce enough samples after {max_rounds} rounds, missing per label: {remaining}")
+
+    def save(self, path):
+        self.model.save(path)
+        with open(f'{path}.labels.json', 'w') as file:
+            json.dump({'labels': [label.item() if hasattr(label, 'item') else label for label in self.labels], 'generator': self.generator}, file)
+
+    @classmethod
+    def load(cls, path):
+        from generators import load_generator
+        with open(f'{path}.labels.json') as file:
+            state = json.load(file)
+        return cls(load_generator(state['generator'], path), state['labels'], state['generator'])
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path) and os.path.exists(f'{path}.labels.json')
@@ -0,0 +1,111 @@
+import os
+import json
+import glob
+import shutil
+import hashlib
+import uuid
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def default_cache_root(ts_path):
+    # <root>/Datasets/<name>/<name>_TRAIN.ts -> <root>/Datasets/.cache
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(ts_path))), '.cache')
+
+
+def file_fingerprint(path, use_hash=False):
+    '''
+    Identity of a source file. By default size + mtime, which is free to compute.
+    With use_hash the sha1 of the content is used so that touched but unchanged files still hit.
+    '''
+    stat = os.stat(path)
+    fingerprint = {'path': os.path.abspath(path), 'size': stat.st_size}
+    if use_hash:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha1.update(chunk)
+        fingerprint['sha1'] = sha1.hexdigest()
+    else:
+        fingerprint['mtime_ns'] = stat.st_mtime_ns
+    return fingerprint
+
+
+def cache_key(fingerprint, params):
+    payload = json.dumps({'version': CACHE_VERSION, 'source': fingerprint, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _write_entry(entry_dir, X, y, lengths, meta):
+    # write into a private temp dir and rename, so concurrent workers never see half written entries
+    tmp_dir = f'{entry_dir}.tmp-{uuid.uuid4().hex}'
+    os.makedirs(tmp_dir)
+    try:
+        np.save(os.path.join(tmp_dir, 'X.npy'), np.ascontiguousarray(X))
+        np.save(os.path.join(tmp_dir, 'y.npy'), np.asarray(y).astype(str))
+        if lengths is not None:
+            np.save(os.path.join(tmp_dir, 'lengths.npy'), lengths)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as file:
+            json.dump(meta, file, indent=2, default=str)
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # another process won the race, its entry is equivalent
+        if not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _prune_stale_entries(cache_root, stem, keep):
+    for entry_dir in glob.glob(os.path.join(cache_root, f'{stem}-*')):
+        if os.path.basename(entry_dir) != keep and '.tmp-' not in entry_dir:
+            meta_path = os.path.join(entry_dir, 'meta.json')
+            try:
+                with open(meta_path) as file:
+                    source = json.load(file)['source']
+            except (OSError, ValueError, KeyError):
+                continue
+            # only drop entries of the same source file, other params stay valid
+            if not os.path.exists(source['path']) or file_fingerprint(source['path'], 'sha1' in source) != source:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def load_ts_dataset(path, sequence_length=None, dtype=np.float32, pad=False, legacy_layout=True,
+                    return_lengths=False, return_meta=False, mmap_mode='r', use_hash=False, cache_root=None):
+    '''
+    Cached replacement for load_from_tsfile + nested_to_array.
+    The first call parses the .ts file and stores X/y (and lengths) as .npy files under
+    Datasets/.cache, every following call with the same file and parameters is a np.load(mmap_mode).
+    The entry is invalidated when the source file changes (mtime/size or sha1 with use_hash).
+    '''
+    cache_root = cache_root or default_cache_root(path)
+    params = {'sequence_length': sequence_length, 'dtype': np.dtype(dtype).str, 'pad': pad, 'legacy_layout': legacy_layout}
+    fingerprint = file_fingerprint(path, use_hash)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    entry_name = f'{stem}-{cache_key(fingerprint, params)}'
+    entry_dir = os.path.join(cache_root, entry_name)
+
+    if not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+        from sktime.datasets import load_from_tsfile
+        from utilities_helper import nested_to_array
+        print(f"Dataset cache miss, parsing {path}")
+        X_nested, y = load_from_tsfile(path)
+        X, lengths = nested_to_array(X_nested, sequence_length, dtype=dtype, pad=pad, return_lengths=True, legacy_layout=legacy_layout)
+        meta = {'version': CACHE_VERSION, 'source': fingerprint, 'params': params,
+                'n_samples': X.shape[0], 'sequence_length': X.shape[1], 'n_dims': X.shape[2],
+                'class_labels': sorted(np.unique(y).astype(str).tolist())}
+        os.makedirs(cache_root, exist_ok=True)
+        _write_entry(entry_dir, X, y, lengths if pad else None, meta)
+        _prune_stale_entries(cache_root, stem, entry_name)
+
+    X = np.load(os.path.join(entry_dir, 'X.npy'), mmap_mode=mmap_mode)
+    y = np.load(os.path.join(entry_dir, 'y.npy'), mmap_mode=mmap_mode)
+    result = [X, y]
+    if return_lengths:
+        lengths_path = os.path.join(entry_dir, 'lengths.npy')
+        result.append(np.load(lengths_path) if os.path.exists(lengths_path) else np.full(X.shape[0], X.shape[1], dtype=np.int64))
+    if return_meta:
+        with open(os.path.join(entry_dir, 'meta.json')) as file:
+            result.append(json.load(file))
+    return tuple(result)
@@ -0,0 +1,250 @@
+import os
+import sys
+import copy
+import json
+import time
+import socket
+import sqlite3
+import datetime
+import traceback
+import multiprocessing
+import numpy as np
+import pandas as pd
+import yaml
+from ts_metadata import read_ts_metadata
+from dataset_cache import load_ts_dataset
+
+JOB_STATES = ('pending', 'running', 'done', 'skipped', 'failed')
+
+
+def read_yaml_config(CONFIG):
+    with open(CONFIG, 'r') as file:
+        try:
+            config = yaml.safe_load(file)
+            return config
+        except yaml.YAMLError as exc:
+            print(exc)
+            return None
+
+
+def _none_if_nan(value):
+    return None if pd.isna(value) else value
+
+
+class DatasetInfo:
+    # header metadata + sample counts per dataset, computed once for the whole grid
+    def __init__(self, datasets_root):
+        self.datasets_root = datasets_root
+        self.info = {}
+
+    def __getitem__(self, dataset_name):
+        if dataset_name not in self.info:
+            train_path = os.path.join(self.datasets_root, dataset_name, f'{dataset_name}_TRAIN.ts')
+            try:
+                metadata = read_ts_metadata(train_path)
+                X, _ = load_ts_dataset(train_path, metadata.series_length)
+                self.info[dataset_name] = {'series_length': metadata.series_length, 'num_features': metadata.dimensions,
+                                           'num_classes': metadata.num_classes, 'train_samples': X.shape[0]}
+            except (OSError, ValueError) as exc:
+                # remembered so that the other rows of a broken dataset fail without parsing it again
+                self.info[dataset_name] = exc
+        if isinstance(self.info[dataset_name], Exception):
+            raise self.info[dataset_name]
+        return self.info[dataset_name]
+
+
+def build_generation_config(base_config, row, index, dataset_info, epochs=20):
+    # same edits prepare_data_generation.py used to write into config.yaml
+    config_data = copy.deepcopy(base_config)
+    info = dataset_info[row['dataset_name']]
+    config_data['datageneration']['generate_n_sample'] = int((row['synthetic_num_samples'] * info['train_samples']) / info['num_classes'])
+    config_data['datageneration']['percentage_of_original_data'] = float(row['dgan_original_data_ratio'])
+    config_data['datageneration']['max_sequence_len'] = info['series_length']
+    config_data['datageneration']['sample_length'] = info['series_length']
+    config_data['datageneration']['epochs'] = epochs
+    config_data['experiment_params']['dataset_name'] = row['dataset_name']
+    config_data['experiment_params']['num_classes'] = info['num_classes']
+    config_data['experiment_params']['num_features'] = info['num_features']
+    config_data['experiment_params']['sequence_length'] = info['series_length']
+    config_data['experiment_params']['experiment_index'] = int(index)
+    return config_data
+
+
+def build_experiment_config(base_config, row, index, dataset_info):
+    # same edits prepare_experiment_from_table.py used to write into config.yaml
+    config_data = build_generation_config(base_config, row, index, dataset_info, epochs=base_config['datageneration']['epochs'])
+    info = dataset_info[row['dataset_name']]
+    batchsize = int(np.floor(row['BM_batch_size_ratio'] * info['train_samples']))
+    model_type = row['model_name']
+    # only the LSTM rows carry their hidden_dim / num_layers, like the old script
+    hidden_dim = _none_if_nan(row.get('hidden_dim')) if model_type == 'LSTM' else None
+    num_layers = _none_if_nan(row.get('num_layers')) if model_type == 'LSTM' else None
+    config_data['finetuning']['batch_size'] = batchsize
+    config_data['finetuning']['epochs'] = int(row['epochs'])
+    config_data['finetuning']['learning_rate'] = float(row['learning_rate'])
+    config_data['finetuning']['model_type'] = model_type
+    config_data['pretraining']['hidden_size'] = int(hidden_dim) if hidden_dim is not None else 'Null'
+    config_data['pretraining']['num_layers_layers_stacked'] = int(num_layers) if num_layers is not None else 'Null'
+    config_data['pretraining']['batch_size'] = batchsize
+    config_data['pretraining']['epochs'] = int(row['epochs'])
+    config_data['pretraining']['learning_rate'] = float(row['learning_rate'])
+    config_data['pretraining']['model_type'] = model_type
+    return config_data
+
+
+JOB_BUILDERS = {'experiment': build_experiment_config,
+                'generation': build_generation_config}
+
+
+class JobStore:
+    '''
+    Persistent job queue in SQLite. Every job holds its complete config as JSON and a state
+    (pending / running / done / failed). Workers claim jobs atomically, so several processes can
+    share one store, and a crashed run is resumed by putting its 'running' jobs back to pending.
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                    kind TEXT, job_id INTEGER, dataset_name TEXT, config TEXT,
+                                    status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0, worker TEXT,
+                                    started TEXT, finished TEXT, error TEXT, result TEXT,
+                                    PRIMARY KEY (kind, job_id))''')
+
+    def _executemany(self, query, rows):
+        # one transaction for the whole grid instead of one commit per row
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self.connection.executemany(query, rows)
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def add_jobs(self, kind, jobs):
+        # existing jobs keep their state, re-running the scheduler never duplicates work
+        self._executemany('INSERT OR IGNORE INTO jobs (kind, job_id, dataset_name, config) VALUES (?, ?, ?, ?)',
+                          [(kind, int(job_id), config['experiment_params']['dataset_name'], json.dumps(config)) for job_id, config in jobs])
+
+    def mark_done(self, kind, job_ids):
+        self._executemany("UPDATE jobs SET status = 'done' WHERE kind = ? AND job_id = ?", [(kind, int(job_id)) for job_id in job_ids])
+
+    def recover(self, kind, retry_failed=False):
+        states = ('running', 'failed') if retry_failed else ('running',)
+        self.connection.execute(f"UPDATE jobs SET status = 'pending' WHERE kind = ? AND status IN ({','.join('?' * len(states))})", (kind, *states))
+
+    def claim(self, kind, worker):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            # jobs of the same dataset are kept together so that a warm worker reuses its dataset cache
+            row = self.connection.execute("SELECT job_id, config FROM jobs WHERE kind = ? AND status = 'pending' ORDER BY dataset_name, job_id LIMIT 1", (kind,)).fetchone()
+            if row is not None:
+                self.connection.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started = ? WHERE kind = ? AND job_id = ?",
+                                        (worker, datetime.datetime.now().isoformat(), kind, row[0]))
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def finish(self, kind, job_id, status, error=None, result=None):
+        self.connection.execute('UPDATE jobs SET status = ?, finished = ?, error = ?, result = ? WHERE kind = ? AND job_id = ?',
+                                (status, datetime.datetime.now().isoformat(), error, json.dumps(result, default=str), kind, job_id))
+
+    def summary(self, kind):
+        counts = dict(self.connection.execute('SELECT status, COUNT(*) FROM jobs WHERE kind = ? GROUP BY status', (kind,)).fetchall())
+        return {state: counts.get(state, 0) for state in JOB_STATES}
+
+
+def _job_runner(kind):
+    # imported once per worker, the heavy stack (torch, sktime, gretel) then stays warm across jobs
+    if kind == 'experiment':
+        from run_single_experiment_new import run_experiment
+        return run_experiment
+    from generate_synthetic_data import generate_synthetic_data
+    return generate_synthetic_data
+
+
+def worker_loop(db_path, kind, worker_name, working_dir):
+    os.chdir(working_dir)
+    if working_dir not in sys.path:
+        sys.path.insert(0, working_dir)
+    store = JobStore(db_path)
+    runner = _job_runner(kind)
+    while True:
+        job = store.claim(kind, worker_name)
+        if job is None:
+            break
+        job_id, config_data = job
+        print(f"[{worker_name}] Running {kind} job {job_id} ({config_data['experiment_params']['dataset_name']})")
+        start = time.perf_counter()
+        try:
+            result = runner(config_data)
+            result = result if isinstance(result, dict) else {}
+            # a job whose synthetic data failed the quality gate is kept apart from the completed ones
+            status = 'skipped' if result.get('quality_gate') == 'skipped' else 'done'
+            store.finish(kind, job_id, status, result={'Experiment_id': result.get('Experiment_id'), 'quality_gate': result.get('quality_gate'),
+                                                       'seconds': time.perf_counter() - start})
+        except Exception:
+            store.finish(kind, job_id, 'failed', error=traceback.format_exc())
+            print(f"[{worker_name}] {kind} job {job_id} failed")
+
+
+def enqueue_jobs(store, kind, data, base_config, datasets_root, completed_ids=()):
+    dataset_info = DatasetInfo(datasets_root)
+    builder = JOB_BUILDERS[kind]
+    jobs = []
+    for index, row in data.iterrows():
+        try:
+            jobs.append((index, builder(base_config, row, index, dataset_info)))
+        except (OSError, ValueError) as exc:
+            print(f"Skipping row {index} ({row['dataset_name']}): {exc}")
+    store.add_jobs(kind, jobs)
+    store.mark_done(kind, completed_ids)
+    return len(jobs)
+
+
+def run_scheduler(data, base_config, kind='experiment', n_workers=1, db_path='scheduler/jobs.sqlite',
+                  datasets_root=None, completed_ids=(), retry_failed=False):
+    '''
+    Runs every row of an experiment table (all_experiments_param.csv or synthetic_data_generation.csv)
+    as a job. Jobs already done in db_path are skipped, jobs left running by a crashed run are resumed.
+    n_workers long-lived processes pull jobs from the store, each one imports the training stack once.
+    '''
+    working_dir = os.path.dirname(os.path.abspath(__file__))
+    datasets_root = datasets_root or os.path.join(base_config['experiment_params']['root_path'], 'Datasets')
+    db_path = os.path.abspath(db_path)
+    store = JobStore(db_path)
+    n_jobs = enqueue_jobs(store, kind, data, base_config, datasets_root, completed_ids)
+    store.recover(kind, retry_failed)
+    print(f"{n_jobs} {kind} jobs in the table, state: {store.summary(kind)}")
+
+    if n_workers <= 1:
+        worker_loop(db_path, kind, f'{socket.gethostname()}-{os.getpid()}', working_dir)
+    else:
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=worker_loop, args=(db_path, kind, f'{socket.gethostname()}-worker{i}', working_dir))
+                   for i in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    summary = store.summary(kind)
+    print(f"Finished {kind} jobs, state: {summary}")
+    return summary
+
+
+if __name__ == '__main__':
+    # python experiment_scheduler.py [experiment|generation] [n_workers]
+    ROOT = os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    config_data = read_yaml_config(os.path.join(os.getcwd(), "config.yaml"))
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'experiment'
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    table = "all_experiments_param.csv" if kind == 'experiment' else "synthetic_data_generation.csv"
+    data = pd.read_csv(os.path.join(os.getcwd(), table))
+    completed_ids = pd.read_csv("completed_experiments.csv")['experiment_index'].tolist() if kind == 'experiment' else ()
+    run_scheduler(data, config_data, kind=kind, n_workers=n_workers, completed_ids=completed_ids)
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import datetime
+import threading
+
+NEPTUNE_PROJECT = "astarteam/FinalProject"
+# the API token is only read from the NEPTUNE_API_TOKEN environment variable, see neptune_api_token
+
+# overridden from the 'tracking' section of config.yaml through configure_tracking
+TRACKING = {'backend': 'neptune',            # offline | neptune | both, neptune always keeps the offline copy as well
+            'db_path': 'tracking/runs.sqlite',
+            'project': NEPTUNE_PROJECT,
+            'flush_every': 50,               # records per batch
+            'flush_interval': 5.0}           # seconds
+
+
+def neptune_api_token():
+    return os.environ.get('NEPTUNE_API_TOKEN')
+
+
+def configure_tracking(tracking_config):
+    if tracking_config:
+        TRACKING.update(tracking_config)
+    return TRACKING
+
+
+def _to_json(value):
+    return json.dumps(value, default=str)
+
+
+class SQLiteSink:
+    '''
+    Offline sink, every parameter and metric of a run is appended to a local SQLite file.
+    Works without network access, runs can be pushed to Neptune later with replay_to_neptune.
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = None
+        self.synced = False
+
+    def open(self, run_id):
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # created inside the writer thread, sqlite connections are bound to their thread
+        self.connection = sqlite3.connect(self.db_path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS runs (
+                                    run_id TEXT PRIMARY KEY, created TEXT, synced INTEGER DEFAULT 0)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS records (
+                                    run_id TEXT, kind TEXT, key TEXT, value TEXT, step INTEGER, timestamp REAL)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS records_run_id ON records (run_id)')
+        self.connection.execute('INSERT OR IGNORE INTO runs (run_id, created) VALUES (?, ?)', (run_id, datetime.datetime.now().isoformat()))
+        self.connection.commit()
+        self.run_id = run_id
+
+    def write(self, records):
+        self.connection.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)',
+                                    [(self.run_id, kind, key, _to_json(value), step, timestamp) for kind, key, value, step, timestamp in records])
+        self.connection.commit()
+
+    def close(self):
+        if self.synced:
+            self.connection.execute('UPDATE runs SET synced = 1 WHERE run_id = ?', (self.run_id,))
+            self.connection.commit()
+        self.connection.close()
+
+
+class NeptuneSink:
+    '''
+    Neptune adapter, neptune is imported and the run is created inside the writer thread
+    so that training never waits for the network.
+    '''
+    def __init__(self, project=NEPTUNE_PROJECT, api_token=None):
+        self.project = project
+        self.api_token = api_token or neptune_api_token()
+        self.run = None
+
+    def open(self, run_id):
+        import neptune
+        self.run = neptune.init_run(project=self.project, api_token=self.api_token, custom_run_id=run_id)
+
+    def write(self, records):
+        for kind, key, value, step, timestamp in records:
+            if kind == 'param':
+                self.run[key] = value
+            else:
+                self.run[key].log(value, step=step, timestamp=timestamp)
+
+    def close(self):
+        self.run.stop()
+
+
+class _TrackedField:
+    def __init__(self, tracker, key):
+        self.tracker = tracker
+        self.key = key
+
+    def log(self, value, step=None):
+        self.tracker.log(self.key, value, step)
+
+
+class AsyncTracker:
+    '''
+    Buffers parameters and metrics in a queue and writes them to the sinks in batches from a
+    background thread. Mirrors the part of the neptune run API the training code uses:
+        tracker["parameters"] = run_param
+        tracker["train/accuracy"].log(train_acc)
+    The writer thread only ends on stop(), which training code calls in a finally block
+    (or through `with create_tracker() as tracker:`), so an exception never leaves it blocked.
+    '''
+    def __init__(self, sinks, run_id=None, flush_every=50, flush_interval=5.0):
+        self.sinks = sinks
+        self.run_id = run_id or uuid.uuid4().hex
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.steps = {}
+        self.stopped = False
+        self.queue = queue.Queue()
+        # not a daemon, so pending records are still written if the script ends right after stop()
+        self.writer = threading.Thread(target=self._write_loop, name=f'tracker-{self.run_id}')
+        self.writer.start()
+
+    def __setitem__(self, key, value):
+        self.queue.put(('param', key, value, None, time.time()))
+
+    def __getitem__(self, key):
+        return _TrackedField(self, key)
+
+    def log(self, key, value, step=None):
+        if step is None:
+            step = self.steps.get(key, -1) + 1
+        self.steps[key] = step
+        if hasattr(value, 'item'):
+            value = value.item()
+        self.queue.put(('metric', key, value, step, time.time()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def stop(self, wait=False):
+        if not self.stopped:
+            self.stopped = True
+            self.queue.put(None)
+        if wait:
+            self.writer.join()
+
+    def _open_sinks(self):
+        opened = []
+        for sink in self.sinks:
+            try:
+                sink.open(self.run_id)
+                opened.append(sink)
+            except Exception as exc:
+                print(f"Tracker sink {type(sink).__name__} disabled: {exc}")
+        return opened
+
+    def _flush(self, sinks, batch):
+        for sink in list(sinks):
+            try:
+                sink.write(batch)
+            except Exception as exc:
+                print(f"Tracker sink {type(sink).__name__} disabled: {exc}")
+                sinks.remove(sink)
+
+    def _write_loop(self):
+        sinks = self._open_sinks()
+        batch = []
+        deadline = time.time() + self.flush_interval
+        stopped = False
+        while not stopped:
+            try:
+                record = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                if record is None:
+                    stopped = True
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+            if batch and (stopped or len(batch) >= self.flush_every or time.time() >= deadline):
+                self._flush(sinks, batch)
+                batch = []
+            if time.time() >= deadline:
+                deadline = time.time() + self.flush_interval
+        neptune_ok = any(isinstance(sink, NeptuneSink) for sink in sinks)
+        for sink in sorted(sinks, key=lambda sink: isinstance(sink, SQLiteSink)):
+            try:
+                if isinstance(sink, NeptuneSink):
+                    sink.close()
+                else:
+                    sink.synced = neptune_ok
+                    sink.close()
+            except Exception as exc:
+                neptune_ok = False
+                print(f"Tracker sink {type(sink).__name__} failed to close: {exc}")
+
+
+_missing_token_reported = False
+
+
+def create_tracker(run_id=None, backend=None):
+    global _missing_token_reported
+    backend = backend or TRACKING['backend']
+    if backend in ('neptune', 'both') and not neptune_api_token():
+        # no credentials, the run is kept in the offline sink and can be replayed once the token is set
+        if not _missing_token_reported:
+            print(f"NEPTUNE_API_TOKEN is not set, tracking backend '{backend}' falls back to the offline sink {TRACKING['db_path']}")
+            _missing_token_reported = True
+        backend = 'offline'
+    # the offline sink is always written: when Neptune cannot be reached (init_run or a write fails) the run is
+    # marked unsynced and replay_to_neptune uploads it later, when Neptune worked it is marked synced
+    sinks = [SQLiteSink(TRACKING['db_path'])]
+    if backend in ('neptune', 'both'):
+        sinks.append(NeptuneSink(TRACKING['project']))
+    return AsyncTracker(sinks, run_id=run_id, flush_every=TRACKING['flush_every'], flush_interval=TRACKING['flush_interval'])
+
+
+def replay_to_neptune(db_path=None, project=None, api_token=None):
+    '''
+    Pushes every run of the offline database that was not synced yet to Neptune.
+    Meant to be run from a machine with network access after copying tracking/runs.sqlite.
+    The token defaults to the NEPTUNE_API_TOKEN environment variable.
+    '''
+    api_token = api_token or neptune_api_token()
+    if not api_token:
+        raise ValueError("replay_to_neptune needs a Neptune API token, set the NEPTUNE_API_TOKEN environment variable")
+    connection = sqlite3.connect(db_path or TRACKING['db_path'], timeout=60)
+    run_ids = [row[0] for row in connection.execute('SELECT run_id FROM runs WHERE synced = 0 ORDER BY created')]
+    for run_id in run_ids:
+        rows = connection.execute('SELECT kind, key, value, step, timestamp FROM records WHERE run_id = ? ORDER BY rowid', (run_id,))
+        sink = NeptuneSink(project or TRACKING['project'], api_token)
+        sink.open(run_id)
+        sink.write([(kind, key, json.loads(value), step, timestamp) for kind, key, value, step, timestamp in rows])
+        sink.close()
+        connection.execute('UPDATE runs SET synced = 1 WHERE run_id = ?', (run_id,))
+        connection.commit()
+        print(f"Replayed run {run_id} to Neptune")
+    connection.close()
+    return run_ids
+
+
+if __name__ == '__main__':
+    import sys
+    replay_to_neptune(sys.argv[1] if len(sys.argv) > 1 else None)
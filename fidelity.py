@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+from synthetic_dataset import SyntheticDataset, load_synthetic_dataset
+from ts_layout import to_time_major
+
+
+def sorted_quantiles(X, n_quantiles:int):
+    '''
+    Empirical quantile function of every column of X (samples on axis 0) at the midpoints
+    (k + 0.5) / n_quantiles, one np.sort for all columns instead of a histogram per series.
+    Returns an (n_quantiles, *X.shape[1:]) array.
+    '''
+    X = np.sort(np.asarray(X, dtype=np.float64), axis=0)
+    n_samples = X.shape[0]
+    if n_samples == n_quantiles:
+        return X
+    position = np.clip((np.arange(n_quantiles) + 0.5) / n_quantiles * n_samples - 0.5, 0, n_samples - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, n_samples - 1)
+    weight = (position - low).reshape((-1,) + (1,) * (X.ndim - 1))
+    return X[low] * (1 - weight) + X[high] * weight
+
+
+def wasserstein_1d(a, b, n_quantiles:int=None):
+    '''
+    1-D Wasserstein-1 distance between the columns of a and b (samples on axis 0, any trailing shape),
+    W1 = mean |Q_a(p) - Q_b(p)| over the quantile grid. Exact for equal sample counts without n_quantiles.
+    '''
+    n_quantiles = n_quantiles or max(len(a), len(b))
+    return np.abs(sorted_quantiles(a, n_quantiles) - sorted_quantiles(b, n_quantiles)).mean(axis=0)
+
+
+def subsample(X, max_samples:int=None, seed:int=0):
+    # at most max_samples rows, read in index order so a memmap is only touched where it is sampled
+    if max_samples is None or len(X) <= max_samples:
+        return np.asarray(X)
+    rows = np.sort(np.random.default_rng(seed).choice(len(X), max_samples, replace=False))
+    return np.asarray(X[rows])
+
+
+def channel_wasserstein(X_real, X_generated, max_samples:int=None, n_quantiles:int=None, per_timestep:bool=False, seed:int=0):
+    '''
+    Wasserstein distance per channel between two time-major (n, seq_len, dims) arrays (see ts_layout.py).
+    per_timestep=False pools every time step of a channel -> (dims,), per_timestep=True keeps them -> (seq_len, dims).
+    '''
+    X_real = subsample(X_real, max_samples, seed)
+    X_generated = subsample(X_generated, max_samples, seed)
+    if not per_timestep:
+        X_real = X_real.reshape(-1, X_real.shape[-1])
+        X_generated = X_generated.reshape(-1, X_generated.shape[-1])
+    return wasserstein_1d(X_real, X_generated, n_quantiles)
+
+
+def _generated_per_label(generated):
+    # {label: X} from a SyntheticDataset, a synthetic data directory, a {'X', 'y'} dict or a {label: X} dict
+    if isinstance(generated, str):
+        generated = SyntheticDataset(generated) if SyntheticDataset.exists(generated) else load_synthetic_dataset(generated)
+    if isinstance(generated, SyntheticDataset):
+        return {str(label): X for label, X in generated.per_label().items()}
+    if set(generated.keys()) == {'X', 'y'}:
+        y = np.asarray(generated['y']).astype(str)
+        return {label: generated['X'][np.flatnonzero(y == label)] for label in np.unique(y)}
+    return {str(label): X for label, X in generated.items()}
+
+
+def fidelity_report(X_real, y_real, generated, max_samples:int=None, n_quantiles:int=None, seed:int=0, legacy_layout:bool=True):
+    '''
+    Per class, per channel Wasserstein distance between the real data and the generated data of
+    generate_data_per_label (any input accepted by _generated_per_label).
+    'wasserstein_normalized' divides by the standard deviation of the real channel so channels
+    and datasets are comparable, its mean is the score of the generated dataset.
+    legacy_layout: real and generated data are in the layout of load_ts_dataset(legacy_layout=True).
+    Returns a DataFrame with columns label, channel, wasserstein, wasserstein_normalized.
+    '''
+    generated = _generated_per_label(generated)
+    y_real = np.asarray(y_real).astype(str)
+    rows = []
+    for label, X_generated in generated.items():
+        X_label = to_time_major(subsample(np.asarray(X_real)[y_real == label], max_samples, seed), legacy_layout)
+        if len(X_label) == 0:
+            print(f"Skipping label {label}, no real samples")
+            continue
+        X_generated = to_time_major(subsample(X_generated, max_samples, seed), legacy_layout)
+        distances = channel_wasserstein(X_label, X_generated, n_quantiles=n_quantiles)
+        scale = X_label.reshape(-1, X_label.shape[-1]).std(axis=0)
+        normalized = distances / np.where(scale > 0, scale, 1)
+        for channel, (distance, distance_normalized) in enumerate(zip(distances, normalized)):
+            rows.append({'label': label, 'channel': channel, 'wasserstein': distance, 'wasserstein_normalized': distance_normalized})
+    return pd.DataFrame(rows, columns=['label', 'channel', 'wasserstein', 'wasserstein_normalized'])
+
+
+def fidelity_score(report:pd.DataFrame):
+    # one number per generated dataset, lower is closer to the real data
+    return float(report['wasserstein_normalized'].mean())
+
+
+def score_synthetic_dataset(directory, X_real, y_real, max_samples:int=None, n_quantiles:int=None, seed:int=0, legacy_layout:bool=True):
+    # fidelity_report of a saved synthetic dataset, written next to it as fidelity.csv
+    report = fidelity_report(X_real, y_real, directory, max_samples, n_quantiles, seed, legacy_layout)
+    report.to_csv(os.path.join(directory, 'fidelity.csv'), index=False)
+    print(f"Fidelity score of {directory}: {fidelity_score(report):.4f}")
+    return report
+
+
+def channel_moments(X):
+    # mean, std, skewness and excess kurtosis of every channel of a time-major (n, seq_len, dims) array, pooled over samples and time
+    X = np.asarray(X, dtype=np.float64).reshape(-1, np.shape(X)[-1])
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    z = (X - mean) / np.where(std > 0, std, 1)
+    return {'mean': mean, 'std': std, 'skew': (z ** 3).mean(axis=0), 'kurtosis': (z ** 4).mean(axis=0) - 3}
+
+
+def autocorrelation(X, max_lag:int=10):
+    '''
+    Mean autocorrelation of every channel of a time-major (n, seq_len, dims) array for lags 1..max_lag,
+    one vectorized product per lag over all samples. Returns a (max_lag, dims) array.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    max_lag = min(max_lag, X.shape[1] - 1)
+    X = X - X.mean(axis=1, keepdims=True)
+    variance = (X ** 2).sum(axis=1)
+    variance = np.where(variance > 0, variance, np.inf)
+    return np.stack([((X[:, lag:] * X[:, :-lag]).sum(axis=1) / variance).mean(axis=0) for lag in range(1, max_lag + 1)])
+
+
+def summary_features(X, max_lag:int=3):
+    # small per sample feature vector (moments, range, smoothness, first lags of the autocorrelation) of a time-major array
+    # for discriminative_score
+    X = np.asarray(X, dtype=np.float64)
+    centered = X - X.mean(axis=1, keepdims=True)
+    variance = np.where((centered ** 2).sum(axis=1) > 0, (centered ** 2).sum(axis=1), np.inf)
+    lags = [(centered[:, lag:] * centered[:, :-lag]).sum(axis=1) / variance for lag in range(1, min(max_lag, X.shape[1] - 1) + 1)]
+    return np.concatenate([X.mean(axis=1), X.std(axis=1), X.min(axis=1), X.max(axis=1), np.diff(X, axis=1).std(axis=1), *lags], axis=1)
+
+
+def discriminative_score(X_real, X_generated, max_samples:int=None, n_folds:int=3, seed:int=0):
+    '''
+    How well a small classifier (logistic regression on summary_features) separates real from generated
+    samples, |cross validated accuracy - 0.5|. 0 means indistinguishable, 0.5 means perfectly separable.
+    '''
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import cross_val_score
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    n_samples = min(len(X_real), len(X_generated), max_samples or np.inf)
+    n_folds = min(n_folds, int(n_samples))
+    if n_folds < 2:
+        return np.nan
+    features = np.concatenate([summary_features(subsample(X_real, n_samples, seed)), summary_features(subsample(X_generated, n_samples, seed))])
+    features = np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
+    target = np.repeat([0, 1], int(n_samples))
+    classifier = make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+    accuracy = cross_val_score(classifier, features, target, cv=n_folds, scoring='accuracy').mean()
+    return float(abs(accuracy - 0.5))
+
+
+# checks of quality_gate, a None threshold disables the check
+QUALITY_THRESHOLDS = {'max_moment_error': 1.0,           # mean over channels of |mean diff| / real std + |log(std ratio)|
+                      'max_acf_error': 0.3,              # mean |autocorrelation diff| over lags and channels
+                      'max_discriminative_score': 0.4,   # |accuracy - 0.5| of the real vs generated classifier
+                      'max_wasserstein': None}           # mean wasserstein_normalized of fidelity_report
+
+
+def quality_report(X_real, y_real, generated, max_samples:int=2000, max_lag:int=10, seed:int=0, legacy_layout:bool=True):
+    '''
+    Cheap per label statistics of generated data against the data the generator was trained on
+    (the X_train_gen slice): moment error, autocorrelation error, discriminative score and Wasserstein distance.
+    Both are reordered to time-major with legacy_layout (see fidelity_report).
+    Returns a DataFrame with one row per label.
+    '''
+    generated = _generated_per_label(generated)
+    y_real = np.asarray(y_real).astype(str)
+    rows = []
+    for label, X_generated in generated.items():
+        X_label = to_time_major(subsample(np.asarray(X_real)[y_real == label], max_samples, seed), legacy_layout)
+        X_generated = to_time_major(subsample(X_generated, max_samples, seed), legacy_layout)
+        if len(X_label) == 0:
+            print(f"Skipping label {label}, no real samples")
+            continue
+        real, fake = channel_moments(X_label), channel_moments(X_generated)
+        scale = np.where(real['std'] > 0, real['std'], 1)
+        moment_error = np.abs(fake['mean'] - real['mean']) / scale + np.abs(np.log(np.maximum(fake['std'], 1e-12) / scale))
+        distances = channel_wasserstein(X_label, X_generated, n_quantiles=256, seed=seed) / scale
+        rows.append({'label': label, 'n_real': len(X_label), 'n_generated': len(X_generated),
+                     'moment_error': float(moment_error.mean()),
+                     'skew_error': float(np.abs(fake['skew'] - real['skew']).mean()),
+                     'kurtosis_error': float(np.abs(fake['kurtosis'] - real['kurtosis']).mean()),
+                     'acf_error': float(np.abs(autocorrelation(X_generated, max_lag) - autocorrelation(X_label, max_lag)).mean()),
+                     'discriminative_score': discriminative_score(X_label, X_generated, seed=seed),
+                     'wasserstein': float(distances.mean())})
+    return pd.DataFrame(rows)
+
+
+def quality_gate(X_real, y_real, generated, thresholds:dict=None, max_samples:int=2000, max_lag:int=10, seed:int=0, legacy_layout:bool=True):
+    '''
+    Pre-flight check of a synthetic dataset before any pretraining compute is spent on it.
+    thresholds overrides QUALITY_THRESHOLDS. Returns (quality_report with a 'failed' column listing
+    the checks every label failed, passed) where passed is True only if no label failed a check.
+    '''
+    thresholds = {**QUALITY_THRESHOLDS, **(thresholds or {})}
+    report = quality_report(X_real, y_real, generated, max_samples, max_lag, seed, legacy_layout)
+    checks = {'max_moment_error': 'moment_error', 'max_acf_error': 'acf_error',
+              'max_discriminative_score': 'discriminative_score', 'max_wasserstein': 'wasserstein'}
+    failed = [[] for _ in range(len(report))]
+    for threshold, column in checks.items():
+        if thresholds.get(threshold) is None or report.empty:
+            continue
+        for row in np.flatnonzero(report[column].to_numpy() > thresholds[threshold]):
+            failed[row].append(column)
+    report['failed'] = [','.join(columns) for columns in failed]
+    passed = not report.empty and not any(failed)
+    print(f"Quality gate {'passed' if passed else 'failed'}:\n{report.to_string()}")
+    return report, passed
+
+
+def generator_fidelity(X_real, X_generated, max_lag:int=10, n_quantiles:int=256, legacy_layout:bool=True):
+    '''
+    Single number used to monitor generator training (see train_dgan_early_stopping), lower is better:
+    mean Wasserstein distance per channel in units of the real std (marginals) + mean autocorrelation error (dynamics).
+    Both arrays are reordered to time-major with legacy_layout (see fidelity_report).
+    '''
+    X_real, X_generated = to_time_major(X_real, legacy_layout), to_time_major(X_generated, legacy_layout)
+    scale = channel_moments(X_real)['std']
+    distances = channel_wasserstein(X_real, X_generated, n_quantiles=n_quantiles) / np.where(scale > 0, scale, 1)
+    acf_error = np.abs(autocorrelation(X_generated, max_lag) - autocorrelation(X_real, max_lag)).mean()
+    return float(distances.mean() + acf_error)
@@ -1,15 +1,11 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
 # import seaborn as sns
 import random
 import os
 import sys
 import time
 import datetime
-from gretel_synthetics.timeseries_dgan.dgan import DGAN
-from gretel_synthetics.timeseries_dgan.config import DGANConfig,OutputType
 import glob
 import torch
 import torch.nn as nn
@@ -17,14 +13,13 @@ import torch.nn.functional as F
 import torch.optim as optim
 from torch.utils.data import DataLoader,Dataset
 from sklearn.model_selection import train_test_split, StratifiedKFold, StratifiedShuffleSplit
-from sktime.datasets import load_from_ucr_tsv_to_dataframe, load_from_tsfile
-import neptune.new as neptune
 import datetime
 import uuid
 import pickle
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 import yaml
 from utilities_helper import *
+from dataset_cache import load_ts_dataset
 
 def read_yaml_config(CONFIG):
     with open(CONFIG, 'r') as file:
@@ -35,20 +30,14 @@ def read_yaml_config(CONFIG):
             print(exc)
             return None
         
-if __name__ == '__main__':
-    print("Generating data for a single dataset !")
-    ROOT = os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    CONFIG = os.path.join(os.getcwd(),"config.yaml")
-    config_data = read_yaml_config(CONFIG)
+def generate_synthetic_data(config_data):
+    # data generation for one in-memory config, called by __main__ and by the scheduler workers
+    configure_tracking(config_data.get('tracking'))
     parent_directory =f'''{os.getcwd()}\dataset\{config_data['experiment_params']['dataset_name']}'''
-    # Read The data
-    X_train,y_train = load_from_tsfile(f"{config_data['experiment_params']['root_path']}\Datasets\{config_data['experiment_params']['dataset_name']}\{config_data['experiment_params']['dataset_name']}_TRAIN.ts")
+    # Read The data (preprocessed arrays are cached under Datasets/.cache after the first parse)
+    X_train,y_train = load_ts_dataset(f"{config_data['experiment_params']['root_path']}\Datasets\{config_data['experiment_params']['dataset_name']}\{config_data['experiment_params']['dataset_name']}_TRAIN.ts",config_data['datageneration']['max_sequence_len'])
     #Take X ratio out of the training data to be used to train the generator
-    _, X_train_gen, _, y_train_gen = train_test_split(X_train, y_train, test_size=config_data['datageneration']['percentage_of_original_data'],shuffle=True)
-
-    #relevant preprocessing
-    X_train = preprocess_dgan(X_train,config_data['datageneration']['max_sequence_len'])
-    X_train_gen = preprocess_dgan(X_train_gen,config_data['datageneration']['max_sequence_len'])
+    _, X_train_gen, _, y_train_gen = train_test_split(X_train, y_train, test_size=config_data['datageneration']['percentage_of_original_data'],shuffle=True,random_state=config_data['experiment_params'].get('seed'))
 
     # Print the shapes of all the data that was preprocessed
     print(f"X_train data shape {X_train.shape}")
@@ -59,7 +48,7 @@ if __name__ == '__main__':
 
     # Setup for finetuning
     print('Creating dataloaders for the original data...')
-    train_dataloader = DataLoader(TimeSeriesDataset(X_train,y_train),batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'])
+    train_dataloader = create_batch_dataloader(X_train,y_train,batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'])
         
     # Split training data by labels
     split_data = split_dataset_by_label(X_train_gen,y_train_gen)
@@ -70,6 +59,16 @@ if __name__ == '__main__':
     # Create the parameters for the DGAN
     DGAN_param = create_dgan_param(config_data)
     
-    # Train the generators
-    models = train_generator_per_label(split_data, DGAN_param, Experiment_param)
-    generated_data,concatenated_data = generate_data_per_label(models, Experiment_param,config_data)
\ No newline at end of file
+    # Train the generators and generate, or reuse them from the artifact store
+    models, generated_data, concatenated_data = train_or_load_synthetic_data(split_data, DGAN_param, Experiment_param, config_data,
+                                                                             n_workers=config_data['datageneration'].get('n_workers', 1),
+                                                                             threads_per_worker=config_data['datageneration'].get('threads_per_worker'))
+    return Experiment_param
+
+
+if __name__ == '__main__':
+    print("Generating data for a single dataset !")
+    ROOT = os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    CONFIG = os.path.join(os.getcwd(),"config.yaml")
+    config_data = read_yaml_config(CONFIG)
+    generate_synthetic_data(config_data)
\ No newline at end of file
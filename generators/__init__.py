@@ -0,0 +1,47 @@
+"""
+Generator registry, the synthetic data backends behind train_generator_per_label / generate_data_per_label.
+A backend is registered as 'module:class' and only imported when it is used. The class provides
+	train(X, DGAN_param, Experiment_param, attributes=None) -> trained generator
+	load(path) -> trained generator
+and a trained generator has the interface of gretel's DGAN: generate_numpy(n) -> (attributes, X) and save(path).
+	model = train_generator('augmentation', X, DGAN_param, Experiment_param)
+	register_generator('MyGAN', 'my_package.my_gan:MyGAN')
+"""
+import importlib
+
+GENERATOR_REGISTRY = {'dgan': 'generators.dgan:DGANBackend',
+					  'augmentation': 'generators.augmentation:AugmentationGenerator'}
+
+
+def register_generator(name, backend=None):
+	# register_generator('name', 'module:class') / register_generator('name', cls) / @register_generator('name')
+	if backend is None:
+		def decorator(cls):
+			GENERATOR_REGISTRY[name] = cls
+			return cls
+		return decorator
+	GENERATOR_REGISTRY[name] = backend
+	return backend
+
+
+def available_generators():
+	return list(GENERATOR_REGISTRY.keys())
+
+
+def get_generator(name):
+	if name not in GENERATOR_REGISTRY:
+		raise ValueError(f"Unknown generator {name}, registered generators: {available_generators()}")
+	backend = GENERATOR_REGISTRY[name]
+	if isinstance(backend, str):
+		module_name, class_name = backend.split(':')
+		backend = getattr(importlib.import_module(module_name), class_name)
+		GENERATOR_REGISTRY[name] = backend
+	return backend
+
+
+def train_generator(name, X, DGAN_param:dict, Experiment_param:dict, attributes=None):
+	return get_generator(name).train(X, DGAN_param, Experiment_param, attributes=attributes)
+
+
+def load_generator(name, path):
+	return get_generator(name).load(path)
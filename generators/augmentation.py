@@ -0,0 +1,151 @@
+import json
+import time
+import numpy as np
+from ts_layout import to_time_major, from_time_major
+
+AUGMENTATION_DEFAULTS = {'augmentations': ['mixup', 'time_warp', 'window_slice', 'magnitude_warp', 'scaling', 'jitter'],
+						 'mixup_alpha': 0.2,              # Beta(alpha, alpha), the weight of the base sample is max(lambda, 1 - lambda)
+						 'time_warp_sigma': 0.2,          # std of the local speed of the time axis at each knot
+						 'time_warp_knots': 4,
+						 'window_slice_ratio': 0.9,       # fraction of the series kept by the crop, stretched back to seq_len
+						 'magnitude_warp_sigma': 0.2,     # std of the smooth multiplicative curve at each knot
+						 'magnitude_warp_knots': 4,
+						 'scaling_sigma': 0.1,            # std of the per sample, per channel factor
+						 'jitter_sigma': 0.03}            # std of the additive noise, in units of the channel std
+
+
+# augmentations that move samples along the time axis, consecutive ones are composed into a single resample
+TIME_AUGMENTATIONS = ('time_warp', 'window_slice')
+
+
+def knot_weights(length:int, n_knots:int):
+	# (length, n_knots + 2) linear interpolation weights from evenly spaced knots (ends included) to every time step
+	knots = np.linspace(0, length - 1, n_knots + 2)
+	return np.stack([np.interp(np.arange(length), knots, np.eye(n_knots + 2)[k]) for k in range(n_knots + 2)], axis=1).astype(np.float32)
+
+
+def _interpolation(positions, length):
+	positions = np.clip(positions, 0, length - 1)
+	low = np.minimum(np.floor(positions).astype(np.int64), length - 2)
+	return low, (positions - low).astype(np.float32)
+
+
+def resample(X, positions):
+	# X (n, seq_len, dims) read at fractional time positions (n, out_len) with linear interpolation,
+	# gathered as whole (dims,) rows of the flattened array
+	n, length, dims = X.shape
+	low, weight = _interpolation(positions, length)
+	rows = (low + np.arange(n)[:, None] * length).reshape(-1)
+	flat = X.reshape(n * length, dims)
+	weight = weight.reshape(-1, 1)
+	return (flat[rows] * (1 - weight) + flat[rows + 1] * weight).reshape(n, -1, dims)
+
+
+def compose_positions(outer, inner):
+	# positions of reading at outer and then at inner, both (n, seq_len): outer evaluated at the fractional indices inner
+	low, weight = _interpolation(inner, outer.shape[1])
+	return np.take_along_axis(outer, low, axis=1) * (1 - weight) + np.take_along_axis(outer, low + 1, axis=1) * weight
+
+
+class AugmentationGenerator:
+	'''
+	Cheap synthetic data backend: new samples are random training samples passed through a chain of vectorized
+	NumPy augmentations (class-wise mixup, time warp, window slice, magnitude warp, scaling, jitter) in float32.
+	"Training" only stores the data and the channel std, a batch of n samples is a few array operations,
+	consecutive time augmentations only move read positions and share one resample of the data. Parameters are the 'augmentation'
+	entry of DGAN_param (datageneration.augmentation in config.yaml) over AUGMENTATION_DEFAULTS.
+	With attributes (generator_mode 'conditional') the attributes of the base sample are returned
+	and mixup partners are drawn from the same class.
+	The augmentations work on time-major data (see ts_layout.py): X is stored time-major and legacy_layout
+	is the layout train received and generate_numpy returns (DGAN_param['legacy_layout'], True unless
+	preprocessing.variable_length).
+	'''
+	def __init__(self, X, attributes=None, params:dict=None, seed=None, legacy_layout:bool=True):
+		self.X = np.ascontiguousarray(X, dtype=np.float32)
+		self.legacy_layout = legacy_layout
+		self.attributes = None if attributes is None else np.asarray(attributes)
+		self.params = {**AUGMENTATION_DEFAULTS, **(params or {})}
+		self.seed = seed
+		self.rng = np.random.default_rng(seed)
+		self.channel_std = self.X.reshape(-1, self.X.shape[-1]).std(axis=0)
+		# rows grouped by class for the class-wise mixup partners
+		classes = np.zeros(len(self.X), dtype=np.int64) if self.attributes is None else np.unique(self.attributes, axis=0, return_inverse=True)[1].reshape(-1)
+		self.class_order = np.argsort(classes, kind='stable')
+		self.sample_class = classes
+		counts = np.bincount(classes)
+		self.class_start, self.class_count = np.concatenate([[0], np.cumsum(counts)[:-1]]), counts
+
+	@classmethod
+	def train(cls, X, DGAN_param:dict, Experiment_param:dict, attributes=None):
+		from experiment_tracker import create_tracker
+		with create_tracker() as run:
+			run['Experiment_param'] = Experiment_param
+			run["DGAN_param"] = DGAN_param
+			start = time.perf_counter()
+			legacy_layout = DGAN_param.get('legacy_layout', True)
+			model = cls(to_time_major(X, legacy_layout), attributes, DGAN_param.get('augmentation'), DGAN_param.get('seed'), legacy_layout)
+			run["generator/fit_seconds"] = time.perf_counter() - start
+		return model
+
+	def mixup(self, X, rows):
+		n = len(rows)
+		classes = self.sample_class[rows]
+		partners = self.class_order[self.class_start[classes] + np.floor(self.rng.random(n) * self.class_count[classes]).astype(np.int64)]
+		weight = self.rng.beta(self.params['mixup_alpha'], self.params['mixup_alpha'], n).astype(np.float32)
+		weight = np.maximum(weight, 1 - weight)[:, None, None]
+		return weight * X + (1 - weight) * self.X[partners]
+
+	# time augmentations return the (n, seq_len) fractional positions to read every output step from
+
+	def time_warp(self, n:int, length:int):
+		speed = np.maximum(self.rng.normal(1.0, self.params['time_warp_sigma'], (n, self.params['time_warp_knots'] + 2)), 0.1).astype(np.float32)
+		warped = np.cumsum(speed @ knot_weights(length, self.params['time_warp_knots']).T, axis=1)
+		return (warped - warped[:, :1]) / (warped[:, -1:] - warped[:, :1]) * (length - 1)
+
+	def window_slice(self, n:int, length:int):
+		window = self.params['window_slice_ratio'] * (length - 1)
+		start = self.rng.random((n, 1), dtype=np.float32) * (length - 1 - window)
+		return start + np.linspace(0, window, length, dtype=np.float32)[None, :]
+
+	def magnitude_warp(self, X):
+		n, length, dims = X.shape
+		knots = self.rng.normal(1.0, self.params['magnitude_warp_sigma'], (n, self.params['magnitude_warp_knots'] + 2, dims)).astype(np.float32)
+		return X * np.matmul(knot_weights(length, self.params['magnitude_warp_knots']), knots)
+
+	def scaling(self, X):
+		return X * self.rng.normal(1.0, self.params['scaling_sigma'], (X.shape[0], 1, X.shape[2])).astype(np.float32)
+
+	def jitter(self, X):
+		return X + self.rng.standard_normal(X.shape, dtype=np.float32) * (self.params['jitter_sigma'] * self.channel_std)
+
+	def generate_numpy(self, n:int):
+		rows = self.rng.integers(0, len(self.X), n)
+		X = self.X[rows]
+		positions = None
+		for name in self.params['augmentations'] + [None]:
+			if name in TIME_AUGMENTATIONS:
+				inner = getattr(self, name)(n, X.shape[1])
+				positions = inner if positions is None else compose_positions(positions, inner)
+				continue
+			if positions is not None:
+				X, positions = resample(X, positions), None
+			if name == 'mixup':
+				X = self.mixup(X, rows)
+			elif name is not None:
+				X = getattr(self, name)(X)
+		attributes = None if self.attributes is None else self.attributes[rows]
+		return attributes, from_time_major(X, self.legacy_layout)
+
+	def save(self, path):
+		# plain .npz content (no pickle) under the model_<label>.pt name of the artifact layout
+		arrays = {'X': self.X, 'params': np.array(json.dumps({'params': self.params, 'seed': self.seed, 'legacy_layout': self.legacy_layout}))}
+		if self.attributes is not None:
+			arrays['attributes'] = self.attributes
+		with open(path, 'wb') as file:
+			np.savez(file, **arrays)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path) as arrays:
+			state = json.loads(str(arrays['params']))
+			return cls(arrays['X'], arrays['attributes'] if 'attributes' in arrays else None, state['params'], state['seed'], state['legacy_layout'])
@@ -0,0 +1,12 @@
+class DGANBackend:
+	# gretel's DGAN, trained by train_dgan (utilities_helper) with the datageneration section of config.yaml
+
+	@staticmethod
+	def train(X, DGAN_param:dict, Experiment_param:dict, attributes=None):
+		from utilities_helper import train_dgan
+		return train_dgan(X, DGAN_param, Experiment_param, attributes=attributes)
+
+	@staticmethod
+	def load(path):
+		from gretel_synthetics.timeseries_dgan.dgan import DGAN
+		return DGAN.load(path)
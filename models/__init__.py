@@ -0,0 +1,42 @@
+"""
+Model registry. Every architecture registers a builder taking config_data, as 'module:function' so the
+module and its dependencies are only imported when that architecture is built.
+	model = build_model('inceptionTime', config_data)
+	register_model('MyNet', 'my_package.my_net:build_my_net')
+"""
+import importlib
+
+MODEL_REGISTRY = {'LSTM': 'models.recurrent:build_lstm',
+				  'GRU': 'models.recurrent:build_gru',
+				  'inceptionTime': 'models.inception:build_inception_time',
+				  'Transformer': 'models.transformer:build_transformer'}
+
+
+def register_model(name, builder=None):
+	# register_model('name', 'module:function') / register_model('name', function) / @register_model('name')
+	if builder is None:
+		def decorator(function):
+			MODEL_REGISTRY[name] = function
+			return function
+		return decorator
+	MODEL_REGISTRY[name] = builder
+	return builder
+
+
+def available_models():
+	return list(MODEL_REGISTRY.keys())
+
+
+def get_builder(name):
+	if name not in MODEL_REGISTRY:
+		raise ValueError(f"Unknown model type {name}, registered models: {available_models()}")
+	builder = MODEL_REGISTRY[name]
+	if isinstance(builder, str):
+		module_name, function_name = builder.split(':')
+		builder = getattr(importlib.import_module(module_name), function_name)
+		MODEL_REGISTRY[name] = builder
+	return builder
+
+
+def build_model(name, config_data):
+	return get_builder(name)(config_data)
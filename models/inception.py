@@ -0,0 +1,436 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def correct_sizes(sizes):
+	corrected_sizes = [s if s % 2 != 0 else s - 1 for s in sizes]
+	return corrected_sizes
+
+
+def pass_through(X):
+	return X
+
+class Flatten(nn.Module):
+	def __init__(self, out_features):
+		super(Flatten, self).__init__()
+		self.output_dim = out_features
+
+	def forward(self, x):
+		return x.view(-1, self.output_dim)
+	
+class Reshape(nn.Module):
+	def __init__(self, out_shape):
+		super(Reshape, self).__init__()
+		self.out_shape = out_shape
+
+	def forward(self, x):
+		return x.view(-1, *self.out_shape)
+
+class Transpose(nn.Module):
+	# (n, sequence_length, features) -> (n, features, sequence_length), for time-major input
+	def __init__(self, dim0=1, dim1=2):
+		super(Transpose, self).__init__()
+		self.dim0 = dim0
+		self.dim1 = dim1
+
+	def forward(self, x):
+		return x.transpose(self.dim0, self.dim1)
+
+class Inception(nn.Module):
+	def __init__(self, in_channels,
+				 n_filters, 
+				kernel_sizes=[9, 19, 39], 
+				bottleneck_channels=32, 
+				activation=nn.ReLU(), 
+				return_indices=False):
+		"""
+		: param in_channels				Number of input channels (input features)
+		: param n_filters				Number of filters per convolution layer => out_channels = 4*n_filters
+		: param kernel_sizes			List of kernel sizes for each convolution.
+										Each kernel size must be odd number that meets -> "kernel_size % 2 !=0".
+										This is nessesery because of padding size.
+										For correction of kernel_sizes use function "correct_sizes". 
+		: param bottleneck_channels		Number of output channels in bottleneck. 
+										Bottleneck wont be used if number of in_channels is equal to 1.
+		: param activation				Activation function for output tensor (nn.ReLU()). 
+		: param return_indices			Indices are needed only if we want to create decoder with InceptionTranspose with MaxUnpool1d. 
+		"""
+		super(Inception, self).__init__()
+		self.return_indices=return_indices
+		if in_channels > 1:
+			self.bottleneck = nn.Conv1d(
+								in_channels=in_channels, 
+								out_channels=bottleneck_channels, 
+								kernel_size=1, 
+								stride=1, 
+								bias=False
+								)
+		else:
+			self.bottleneck = pass_through
+			bottleneck_channels = 1
+
+		self.conv_from_bottleneck_1 = nn.Conv1d(
+										in_channels=bottleneck_channels, 
+										out_channels=n_filters, 
+										kernel_size=kernel_sizes[0], 
+										stride=1, 
+										padding=kernel_sizes[0]//2, 
+										bias=False
+										)
+		self.conv_from_bottleneck_2 = nn.Conv1d(
+										in_channels=bottleneck_channels, 
+										out_channels=n_filters, 
+										kernel_size=kernel_sizes[1], 
+										stride=1, 
+										padding=kernel_sizes[1]//2, 
+										bias=False
+										)
+		self.conv_from_bottleneck_3 = nn.Conv1d(
+										in_channels=bottleneck_channels, 
+										out_channels=n_filters, 
+										kernel_size=kernel_sizes[2], 
+										stride=1, 
+										padding=kernel_sizes[2]//2, 
+										bias=False
+										)
+		self.max_pool = nn.MaxPool1d(kernel_size=3, stride=1, padding=1, return_indices=return_indices)
+		self.conv_from_maxpool = nn.Conv1d(
+									in_channels=in_channels, 
+									out_channels=n_filters, 
+									kernel_size=1, 
+									stride=1,
+									padding=0, 
+									bias=False
+									)
+		self.batch_norm = nn.BatchNorm1d(num_features=4*n_filters)
+		self.activation = activation
+
+	def forward(self, X):
+		# step 1
+		Z_bottleneck = self.bottleneck(X)
+		if self.return_indices:
+			Z_maxpool, indices = self.max_pool(X)
+		else:
+			Z_maxpool = self.max_pool(X)
+		# step 2
+		Z1 = self.conv_from_bottleneck_1(Z_bottleneck)
+		Z2 = self.conv_from_bottleneck_2(Z_bottleneck)
+		Z3 = self.conv_from_bottleneck_3(Z_bottleneck)
+		Z4 = self.conv_from_maxpool(Z_maxpool)
+		# step 3 
+		Z = torch.cat([Z1, Z2, Z3, Z4], axis=1)
+		Z = self.activation(self.batch_norm(Z))
+		if self.return_indices:
+			return Z, indices
+		else:
+			return Z
+
+
+class FusedInception(nn.Module):
+	def __init__(self, in_channels,
+				 n_filters, 
+				kernel_sizes=[9, 19, 39], 
+				bottleneck_channels=32, 
+				activation=nn.ReLU(), 
+				return_indices=False):
+		"""
+		Drop-in replacement of Inception with the same parameters and outputs.
+		The three bottleneck convolutions are one convolution of the largest kernel size, the smaller kernels
+		are zero-padded (centered) into it and kept at zero by a fixed mask, so the output is the same as
+		running the three convolutions and concatenating them. 2 conv calls per module instead of 4.
+		state_dicts of Inception are converted when loaded (see _load_from_state_dict).
+		"""
+		super(FusedInception, self).__init__()
+		self.return_indices=return_indices
+		self.kernel_sizes = list(kernel_sizes)
+		self.n_filters = n_filters
+		if in_channels > 1:
+			self.bottleneck = nn.Conv1d(
+								in_channels=in_channels, 
+								out_channels=bottleneck_channels, 
+								kernel_size=1, 
+								stride=1, 
+								bias=False
+								)
+		else:
+			self.bottleneck = pass_through
+			bottleneck_channels = 1
+
+		self.max_kernel_size = max(self.kernel_sizes)
+		weight = torch.zeros(3*n_filters, bottleneck_channels, self.max_kernel_size)
+		mask = torch.zeros_like(weight)
+		for i, kernel_size in enumerate(self.kernel_sizes):
+			# same initialization as the separate nn.Conv1d of Inception
+			branch = nn.Conv1d(bottleneck_channels, n_filters, kernel_size=kernel_size, bias=False).weight.data
+			offset = (self.max_kernel_size - kernel_size) // 2
+			weight[i*n_filters:(i+1)*n_filters, :, offset:offset + kernel_size] = branch
+			mask[i*n_filters:(i+1)*n_filters, :, offset:offset + kernel_size] = 1
+		self.conv_from_bottleneck = nn.Parameter(weight)
+		self.register_buffer('kernel_mask', mask, persistent=False)
+		self.max_pool = nn.MaxPool1d(kernel_size=3, stride=1, padding=1, return_indices=return_indices)
+		self.conv_from_maxpool = nn.Conv1d(
+									in_channels=in_channels, 
+									out_channels=n_filters, 
+									kernel_size=1, 
+									stride=1,
+									padding=0, 
+									bias=False
+									)
+		self.batch_norm = nn.BatchNorm1d(num_features=4*n_filters)
+		self.activation = activation
+
+	def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+		# Inception checkpoints store the three branches separately, they are padded into the fused weight
+		keys = [f'{prefix}conv_from_bottleneck_{i}.weight' for i in (1, 2, 3)]
+		if all(key in state_dict for key in keys):
+			weight = torch.zeros_like(self.conv_from_bottleneck)
+			for i, key in enumerate(keys):
+				branch = state_dict.pop(key)
+				offset = (self.max_kernel_size - branch.shape[-1]) // 2
+				weight[i*self.n_filters:(i+1)*self.n_filters, :, offset:offset + branch.shape[-1]] = branch
+			state_dict[f'{prefix}conv_from_bottleneck'] = weight
+		super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+	def forward(self, X):
+		# step 1
+		Z_bottleneck = self.bottleneck(X)
+		if self.return_indices:
+			Z_maxpool, indices = self.max_pool(X)
+		else:
+			Z_maxpool = self.max_pool(X)
+		# step 2
+		Z123 = F.conv1d(Z_bottleneck, self.conv_from_bottleneck * self.kernel_mask, padding=self.max_kernel_size//2)
+		Z4 = self.conv_from_maxpool(Z_maxpool)
+		# step 3 
+		Z = torch.cat([Z123, Z4], axis=1)
+		Z = self.activation(self.batch_norm(Z))
+		if self.return_indices:
+			return Z, indices
+		else:
+			return Z
+
+
+class InceptionBlock(nn.Module):
+	def __init__(self, in_channels, n_filters=32, kernel_sizes=[9,19,39], bottleneck_channels=32, use_residual=True, activation=nn.ReLU(), return_indices=False, fused=False):
+		super(InceptionBlock, self).__init__()
+		# fused=True builds the modules as FusedInception, same outputs and loadable from Inception checkpoints
+		inception = FusedInception if fused else Inception
+		self.use_residual = use_residual
+		self.return_indices = return_indices
+		self.activation = activation
+		self.inception_1 = inception(
+							in_channels=in_channels,
+							n_filters=n_filters,
+							kernel_sizes=kernel_sizes,
+							bottleneck_channels=bottleneck_channels,
+							activation=activation,
+							return_indices=return_indices
+							)
+		self.inception_2 = inception(
+							in_channels=4*n_filters,
+							n_filters=n_filters,
+							kernel_sizes=kernel_sizes,
+							bottleneck_channels=bottleneck_channels,
+							activation=activation,
+							return_indices=return_indices
+							)
+		self.inception_3 = inception(
+							in_channels=4*n_filters,
+							n_filters=n_filters,
+							kernel_sizes=kernel_sizes,
+							bottleneck_channels=bottleneck_channels,
+							activation=activation,
+							return_indices=return_indices
+							)	
+		if self.use_residual:
+			self.residual = nn.Sequential(
+								nn.Conv1d(
+									in_channels=in_channels, 
+									out_channels=4*n_filters, 
+									kernel_size=1,
+									stride=1,
+									padding=0
+									),
+								nn.BatchNorm1d(
+									num_features=4*n_filters
+									)
+								)
+
+	def forward(self, X):
+		if self.return_indices:
+			Z, i1 = self.inception_1(X)
+			Z, i2 = self.inception_2(Z)
+			Z, i3 = self.inception_3(Z)
+		else:
+			Z = self.inception_1(X)
+			Z = self.inception_2(Z)
+			Z = self.inception_3(Z)
+		if self.use_residual:
+			Z = Z + self.residual(X)
+			Z = self.activation(Z)
+		if self.return_indices:
+			return Z,[i1, i2, i3]
+		else:
+			return Z
+
+
+
+class InceptionTranspose(nn.Module):
+	def __init__(self, in_channels, out_channels, kernel_sizes=[9, 19, 39], bottleneck_channels=32, activation=nn.ReLU()):
+		"""
+		: param in_channels				Number of input channels (input features)
+		: param n_filters				Number of filters per convolution layer => out_channels = 4*n_filters
+		: param kernel_sizes			List of kernel sizes for each convolution.
+										Each kernel size must be odd number that meets -> "kernel_size % 2 !=0".
+										This is nessesery because of padding size.
+										For correction of kernel_sizes use function "correct_sizes". 
+		: param bottleneck_channels		Number of output channels in bottleneck. 
+										Bottleneck wont be used if nuber of in_channels is equal to 1.
+		: param activation				Activation function for output tensor (nn.ReLU()). 
+		"""
+		super(InceptionTranspose, self).__init__()
+		self.activation = activation
+		self.conv_to_bottleneck_1 = nn.ConvTranspose1d(
+										in_channels=in_channels, 
+										out_channels=bottleneck_channels, 
+										kernel_size=kernel_sizes[0], 
+										stride=1, 
+										padding=kernel_sizes[0]//2, 
+										bias=False
+										)
+		self.conv_to_bottleneck_2 = nn.ConvTranspose1d(
+										in_channels=in_channels, 
+										out_channels=bottleneck_channels, 
+										kernel_size=kernel_sizes[1], 
+										stride=1, 
+										padding=kernel_sizes[1]//2, 
+										bias=False
+										)
+		self.conv_to_bottleneck_3 = nn.ConvTranspose1d(
+										in_channels=in_channels, 
+										out_channels=bottleneck_channels, 
+										kernel_size=kernel_sizes[2], 
+										stride=1, 
+										padding=kernel_sizes[2]//2, 
+										bias=False
+										)
+		self.conv_to_maxpool = nn.Conv1d(
+									in_channels=in_channels, 
+									out_channels=out_channels, 
+									kernel_size=1, 
+									stride=1,
+									padding=0, 
+									bias=False
+									)
+		self.max_unpool = nn.MaxUnpool1d(kernel_size=3, stride=1, padding=1)
+		self.bottleneck = nn.Conv1d(
+								in_channels=3*bottleneck_channels, 
+								out_channels=out_channels, 
+								kernel_size=1, 
+								stride=1, 
+								bias=False
+								)
+		self.batch_norm = nn.BatchNorm1d(num_features=out_channels)
+
+		def forward(self, X, indices):
+			Z1 = self.conv_to_bottleneck_1(X)
+			Z2 = self.conv_to_bottleneck_2(X)
+			Z3 = self.conv_to_bottleneck_3(X)
+			Z4 = self.conv_to_maxpool(X)
+
+			Z = torch.cat([Z1, Z2, Z3], axis=1)
+			MUP = self.max_unpool(Z4, indices)
+			BN = self.bottleneck(Z)
+			# another possibility insted of sum BN and MUP is adding 2nd bottleneck transposed convolution
+			
+			return self.activation(self.batch_norm(BN + MUP))
+
+
+class InceptionTransposeBlock(nn.Module):
+	def __init__(self, in_channels, out_channels=32, kernel_sizes=[9,19,39], bottleneck_channels=32, use_residual=True, activation=nn.ReLU()):
+		super(InceptionTransposeBlock, self).__init__()
+		self.use_residual = use_residual
+		self.activation = activation
+		self.inception_1 = InceptionTranspose(
+							in_channels=in_channels,
+							out_channels=in_channels,
+							kernel_sizes=kernel_sizes,
+							bottleneck_channels=bottleneck_channels,
+							activation=activation
+							)
+		self.inception_2 = InceptionTranspose(
+							in_channels=in_channels,
+							out_channels=in_channels,
+							kernel_sizes=kernel_sizes,
+							bottleneck_channels=bottleneck_channels,
+							activation=activation
+							)
+		self.inception_3 = InceptionTranspose(
+							in_channels=in_channels,
+							out_channels=out_channels,
+							kernel_sizes=kernel_sizes,
+							bottleneck_channels=bottleneck_channels,
+							activation=activation
+							)	
+		if self.use_residual:
+			self.residual = nn.Sequential(
+								nn.ConvTranspose1d(
+									in_channels=in_channels, 
+									out_channels=out_channels, 
+									kernel_size=1,
+									stride=1,
+									padding=0
+									),
+								nn.BatchNorm1d(
+									num_features=out_channels
+									)
+								)
+
+	def forward(self, X, indices):
+		assert len(indices)==3
+		Z = self.inception_1(X, indices[2])
+		Z = self.inception_2(Z, indices[1])
+		Z = self.inception_3(Z, indices[0])
+		if self.use_residual:
+			Z = Z + self.residual(X)
+			Z = self.activation(Z)
+		return Z
+
+
+def input_layout(config_data):
+	# legacy layout (the default): X is (n, sequence_length, features) in shape but its memory holds (n, features, sequence_length),
+	# the view restores the channels. preprocessing.variable_length loads truly time-major X, which has to be transposed
+	if config_data['preprocessing'].get('variable_length', False):
+		return Transpose(1, 2)
+	return Reshape((config_data['experiment_params']['num_features'],
+					config_data['experiment_params']['sequence_length']))
+
+
+def build_inception_time(config_data):
+	return nn.Sequential(
+
+					input_layout(config_data),
+
+					InceptionBlock(
+						in_channels=config_data['experiment_params']['num_features'], 
+						n_filters=32, 
+						kernel_sizes=[5, 11, 23],
+						bottleneck_channels=32,
+						use_residual=True,
+						activation=nn.ReLU(),
+						fused=config_data['pretraining'].get('fused_inception', False)
+					),
+					InceptionBlock(
+						in_channels=32*4, 
+						n_filters=32, 
+						kernel_sizes=[5, 11, 23],
+						bottleneck_channels=32,
+						use_residual=True,
+						activation=nn.ReLU(),
+						fused=config_data['pretraining'].get('fused_inception', False)
+					),
+					nn.AdaptiveAvgPool1d(output_size=1),
+					Flatten(out_features=32*4*1),
+					nn.Linear(in_features=4*32*1, out_features=config_data['experiment_params']['num_classes'])
+		)
@@ -0,0 +1,73 @@
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence
+
+
+def pack_sequence(X, lengths):
+	# padded batch -> PackedSequence, the RNN stops at every sample's true length instead of running over padding
+	lengths = torch.as_tensor(lengths).cpu().clamp(min=1, max=X.size(1))
+	return pack_padded_sequence(X[:, :int(lengths.max())], lengths, batch_first=True, enforce_sorted=False)
+
+
+class LSTM_Classifier(nn.Module):
+	# forward takes the true length of each sample (see TensorTimeSeriesDataset with lengths)
+	supports_lengths = True
+
+	def __init__(self, input_dim=31, hidden_dim=256, num_layers=1, output_dim=5, dropout=0):
+		'''
+		input_dim = number of features at each time step 
+		hidden_dim = number of features produced by each LSTM cell (in each layer)
+		num_layers = number of LSTM layers
+		output_dim = number of classes (number of activities)
+		'''
+		super().__init__()
+		self.hidden_dim = hidden_dim
+		self.num_layers = num_layers
+		self.lstm = nn.LSTM(input_size=input_dim, hidden_size=hidden_dim, 
+							num_layers=num_layers, batch_first=True, dropout=dropout)
+		self.fc = nn.Linear(hidden_dim, output_dim)
+		self.softmax = nn.Softmax(dim=1)
+		
+		
+	def forward(self, X, lengths=None):
+		if lengths is not None:
+			X = pack_sequence(X, lengths)
+		_, (h_n, c_n) = self.lstm(X)  # (h_0, c_0) default to zeros
+		out = self.fc(h_n[-1,:,:])
+		out = self.softmax(out)
+		return out
+	
+
+class GRU_Classifier(nn.Module):
+	supports_lengths = True
+
+	def __init__(self, input_size, hidden_size, num_layers, num_classes):
+		super(GRU_Classifier, self).__init__()
+		self.hidden_size = hidden_size
+		self.num_layers = num_layers
+		self.gru = nn.GRU(input_size, hidden_size, num_layers, batch_first=True)
+		self.fc = nn.Linear(hidden_size, num_classes)
+		
+	def forward(self, x, lengths=None):
+		h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(device=x.device)
+		if lengths is not None:
+			x = pack_sequence(x, lengths)
+		# last layer hidden state, equal to out[:, -1, :] for full length series and the last real step of packed ones
+		_, h_n = self.gru(x, h0.detach())
+		out = self.fc(h_n[-1])
+		return out
+
+
+def build_lstm(config_data):
+	return LSTM_Classifier(input_dim=config_data['experiment_params']['num_features'],
+							hidden_dim=config_data['pretraining']['hidden_size'],
+							num_layers=config_data['pretraining']['num_layers_stacked'], 
+							output_dim=config_data['experiment_params']['num_classes'],
+							dropout=config_data['pretraining']['dropout'])
+
+
+def build_gru(config_data):
+	return GRU_Classifier(input_size=config_data['experiment_params']['num_features'],
+							hidden_size=config_data['pretraining']['hidden_size'],
+							num_layers=config_data['pretraining']['num_layers_stacked'], 
+							num_classes=config_data['experiment_params']['num_classes'])
@@ -0,0 +1,19 @@
+from Transformer import TimeSeriesTransformerClassifier
+
+# pretraining.transformer in config.yaml, missing keys fall back to these
+TRANSFORMER_DEFAULTS = {'d_model': 64, 'n_heads': 4, 'n_layers': 2, 'dim_feedforward': 128, 'dropout': 0.1, 'pooling': 'mean'}
+
+
+def build_transformer(config_data):
+	params = {**TRANSFORMER_DEFAULTS, **(config_data['pretraining'].get('transformer') or {})}
+	return TimeSeriesTransformerClassifier(input_size=config_data['experiment_params']['num_features'],
+										num_classes=config_data['experiment_params']['num_classes'],
+										sequence_length=config_data['experiment_params']['sequence_length'],
+										batch_first=True,
+										dim_val=params['d_model'],
+										n_encoder_layers=params['n_layers'],
+										n_heads=params['n_heads'],
+										dropout_encoder=params['dropout'],
+										dropout_pos_enc=params['dropout'],
+										dim_feedforward_encoder=params['dim_feedforward'],
+										pooling=params['pooling'])
@@ -27,9 +27,13 @@ class PositionalEncoder(nn.Module):
         """
         Parameters:
             dropout: the dropout rate
-            max_seq_len: the maximum length of the input sequences
+            max_seq_len: the maximum length of the input sequences, the encoding
+                         table is built for exactly this many positions, so pass
+                         the dataset's sequence_length instead of the default
             d_model: The dimension of the output of sub-layers in the model 
                      (Vaswani et al, 2017)
+            batch_first: inputs are [batch_size, seq_len, d_model] when True,
+                         [seq_len, batch_size, d_model] otherwise
         """
 
         super().__init__()
@@ -42,19 +46,32 @@ class PositionalEncoder(nn.Module):
 
         self.x_dim = 1 if batch_first else 0
 
+        self.max_seq_len = max_seq_len
+
         # copy pasted from PyTorch tutorial
         position = torch.arange(max_seq_len).unsqueeze(1)
         
         div_term = torch.exp(torch.arange(0, d_model, 2) * (-math.log(10000.0) / d_model))
         
-        pe = torch.zeros(max_seq_len, 1, d_model)
-        
-        pe[:, 0, 0::2] = torch.sin(position * div_term)
-        
-        pe[:, 0, 1::2] = torch.cos(position * div_term)
+        pe = torch.zeros(max_seq_len, d_model)
         
-        self.register_buffer('pe', pe)
+        pe[:, 0::2] = torch.sin(position * div_term)
         
+        pe[:, 1::2] = torch.cos(position * div_term)
+
+        # stored in the layout of the input, [1, seq_len, d_model] or [seq_len, 1, d_model],
+        # so forward only slices it and broadcasting runs over the batch dimension
+        pe = pe.unsqueeze(0) if batch_first else pe.unsqueeze(1)
+
+        # not persistent: it is rebuilt from the arguments, and checkpoints stay
+        # loadable when the sequence length changes
+        self.register_buffer('pe', pe, persistent=False)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints saved before the buffer was made non persistent still carry it
+        state_dict.pop(f'{prefix}pe', None)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, x: Tensor) -> Tensor:
         """
         Args:
@@ -62,6 +79,14 @@ class PositionalEncoder(nn.Module):
                [enc_seq_len, batch_size, dim_val]
         """
 
-        x = x + self.pe[:x.size(self.x_dim)]
+        seq_len = x.size(self.x_dim)
+
+        if seq_len > self.max_seq_len:
+            raise ValueError(f"Sequence length {seq_len} is longer than max_seq_len={self.max_seq_len} of the positional encoding")
+
+        if self.batch_first:
+            x = x + self.pe[:, :seq_len]
+        else:
+            x = x + self.pe[:seq_len]
 
-        return self.dropout(x)
\ No newline at end of file
+        return self.dropout(x)
@@ -1,15 +1,11 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
 # import seaborn as sns
 import random
 import os
 import sys
 import time
 import datetime
-from gretel_synthetics.timeseries_dgan.dgan import DGAN
-from gretel_synthetics.timeseries_dgan.config import DGANConfig,OutputType
 import glob
 import torch
 import torch.nn as nn
@@ -17,14 +13,13 @@ import torch.nn.functional as F
 import torch.optim as optim
 from torch.utils.data import DataLoader,Dataset
 from sklearn.model_selection import train_test_split, StratifiedKFold, StratifiedShuffleSplit
-from sktime.datasets import load_from_ucr_tsv_to_dataframe, load_from_tsfile
-import neptune.new as neptune
 import datetime
 import uuid
 import pickle
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 import yaml
 from utilities_helper import *
+from dataset_cache import load_ts_dataset
 
 
 
@@ -37,29 +32,27 @@ def read_yaml_config(CONFIG):
             print(exc)
             return None
         
-if __name__ == '__main__':
-    print("Running Single Experiment !")
-    ROOT = os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    CONFIG = os.path.join(os.getcwd(),"config.yaml")
-    config_data = read_yaml_config(CONFIG)
+def run_experiment(config_data):
+    # the whole pipeline for one in-memory config, called by __main__ and by the scheduler workers
+    configure_tracking(config_data.get('tracking'))
+    configure_checkpoints(config_data.get('checkpoints'))
     parent_directory =f'''{os.getcwd()}\dataset\{config_data['experiment_params']['dataset_name']}'''
 
 
-    # Read The data
-    X_train,y_train = load_from_tsfile(f"{config_data['experiment_params']['root_path']}\Datasets\{config_data['experiment_params']['dataset_name']}\{config_data['experiment_params']['dataset_name']}_TRAIN.ts")
-    X_test,y_test = load_from_tsfile(f"{config_data['experiment_params']['root_path']}\Datasets\{config_data['experiment_params']['dataset_name']}\{config_data['experiment_params']['dataset_name']}_TEST.ts")
+    # Read The data (preprocessed arrays are cached under Datasets/.cache after the first parse)
+    # variable_length zero pads ragged datasets (time on axis 1) and keeps the true lengths for the packed LSTM/GRU
+    variable_length = config_data['preprocessing'].get('variable_length', False)
+    X_train,y_train,lengths_train = load_ts_dataset(f"{config_data['experiment_params']['root_path']}\Datasets\{config_data['experiment_params']['dataset_name']}\{config_data['experiment_params']['dataset_name']}_TRAIN.ts",config_data['datageneration']['max_sequence_len'],
+                                                    pad=variable_length,legacy_layout=not variable_length,return_lengths=True)
+    X_test,y_test,lengths_test = load_ts_dataset(f"{config_data['experiment_params']['root_path']}\Datasets\{config_data['experiment_params']['dataset_name']}\{config_data['experiment_params']['dataset_name']}_TEST.ts",config_data['datageneration']['max_sequence_len'],
+                                                 pad=variable_length,legacy_layout=not variable_length,return_lengths=True)
 
     # Split  the data based on config ratio
-    X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=1-config_data['preprocessing']['split_ratio'],shuffle=True)
+    X_train, X_val, y_train, y_val, lengths_train, lengths_val = train_test_split(X_train, y_train, lengths_train, test_size=1-config_data['preprocessing']['split_ratio'],shuffle=True,random_state=config_data['experiment_params'].get('seed'))
 
     #Take X ratio out of the training data to be used to train the generator
-    _, X_train_gen, _, y_train_gen = train_test_split(X_train, y_train, test_size=config_data['datageneration']['percentage_of_original_data'],shuffle=True)
+    _, X_train_gen, _, y_train_gen = train_test_split(X_train, y_train, test_size=config_data['datageneration']['percentage_of_original_data'],shuffle=True,random_state=config_data['experiment_params'].get('seed'))
 
-    #relevant preprocessing
-    X_train = preprocess_dgan(X_train,config_data['datageneration']['max_sequence_len'])
-    X_val = preprocess_dgan(X_val,config_data['datageneration']['max_sequence_len'])
-    X_test = preprocess_dgan(X_test,config_data['datageneration']['max_sequence_len'])
-    X_train_gen = preprocess_dgan(X_train_gen,config_data['datageneration']['max_sequence_len'])
     # Print the shapes of all the data that was preprocessed
     print(f"X_train data shape {X_train.shape}")
     print(f"X_val data shape {X_val.shape}")
@@ -72,9 +65,11 @@ if __name__ == '__main__':
     _,__,y_test = map_label_int(y_test)
     # Setup for finetuning
     print('Creating dataloaders for the original data...')
-    train_dataloader = DataLoader(TimeSeriesDataset(X_train,y_train),batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'])
-    validation_dataloader = DataLoader(TimeSeriesDataset(X_val,y_val),batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'])
-    test_dataloader = DataLoader(TimeSeriesDataset(X_test,y_test),batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'])
+    if not variable_length:
+        lengths_train = lengths_val = lengths_test = None
+    train_dataloader = create_batch_dataloader(X_train,y_train,batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'],lengths=lengths_train,bucket_by_length=variable_length)
+    validation_dataloader = create_batch_dataloader(X_val,y_val,batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'],lengths=lengths_val,bucket_by_length=variable_length)
+    test_dataloader = create_batch_dataloader(X_test,y_test,batch_size=config_data['finetuning']['batch_size'],shuffle=config_data['finetuning']['shuffle'],lengths=lengths_test,bucket_by_length=variable_length)
     
     #Now finetuning
     print('Now finetuning...')
@@ -91,7 +86,9 @@ if __name__ == '__main__':
             "batch_size": config_data['pretraining']['batch_size'],
             "learning_rate": lr, 
             "criterion":config_data['pretraining']['criterion'],
-            "optimizer": config_data['pretraining']['optimizer']}
+            "optimizer": config_data['pretraining']['optimizer'],
+            "amp": config_data['pretraining'].get('amp', False),
+            "export_torchscript": config_data['pretraining'].get('export_torchscript', False)}
     
     # Split training data by labels
     split_data = split_dataset_by_label(X_train_gen,y_train_gen)
@@ -102,14 +99,32 @@ if __name__ == '__main__':
     # Create the parameters for the DGAN
     DGAN_param = create_dgan_param(config_data)
     
-    # Train the generators
-    models = train_generator_per_label(split_data, DGAN_param, Experiment_param)
-    generated_data,concatenated_data = generate_data_per_label(models, Experiment_param,config_data)
+    # Train the generators and generate, or reuse them from the artifact store
+    stream = (config_data['pretraining'].get('synthetic_stream') or {}).get('enabled', False)
+    models, generated_data, concatenated_data = train_or_load_synthetic_data(split_data, DGAN_param, Experiment_param, config_data,
+                                                                             n_workers=config_data['datageneration'].get('n_workers', 1),
+                                                                             threads_per_worker=config_data['datageneration'].get('threads_per_worker'),
+                                                                             generate=not stream)
+    if stream:
+        # no upfront generation, pretraining batches are sampled from the generators during training
+        # and the fixed validation set is what the quality gate looks at
+        train_dataloader, validation_dataloader, generated_data = create_stream_dataloaders(models, config_data, Experiment_param['generate_n_sample'])
+
+    # Pre-flight check of the synthetic data against the generator training slice, before any pretraining compute
+    gate = config_data['datageneration'].get('quality_gate') or {}
+    if gate.get('enabled', False):
+        _, passed = quality_gate(X_train_gen, y_train_gen, generated_data, gate.get('thresholds'), max_samples=gate.get('max_samples', 2000),
+                                 max_lag=gate.get('max_lag', 10), seed=config_data['experiment_params'].get('seed') or 0, legacy_layout=not variable_length)
+        Experiment_param['quality_gate'] = 'passed' if passed else ('flagged' if gate.get('action', 'skip') == 'flag' else 'skipped')
+        if Experiment_param['quality_gate'] == 'skipped':
+            print(f"Synthetic data of {Experiment_param['Dataset name']} failed the quality gate, skipping pretraining and finetuning")
+            return Experiment_param
     
-    label_to_int, int_to_label, concatenated_data['y'] = map_label_int(concatenated_data['y'])
+    if not stream:
+        label_to_int, int_to_label, concatenated_data['y'] = map_label_int(concatenated_data['y'])
 
-    #
-    train_dataloader, validation_dataloader = create_data_loaders(concatenated_data['X'],concatenated_data['y'],n_splits=1, validation_size=0.2)
+        #
+        train_dataloader, validation_dataloader = create_data_loaders(concatenated_data['X'],concatenated_data['y'],n_splits=1, validation_size=0.2)
 
     # Pretraining parameters from config
     output_dim = config_data['experiment_params']['num_classes']
@@ -128,7 +143,37 @@ if __name__ == '__main__':
 
     multiple_experiments  = config_data['pretraining']['multiple_experiments']
 
-    if multiple_experiments == True:
+    if multiple_experiments == True and config_data['pretraining'].get('shared_data_pass', False):
+        # All models of models_list are trained together, every batch is loaded once for all of them
+        models = {}
+        for model_type in config_data['pretraining']['models_list']:
+            models[model_type] = create_model_based_on_config(model_type,config_data).to(device)
+
+        # Pretraining models
+        Experiment_param['model type'] = '+'.join(models.keys())
+        Experiment_param['experiment state'] = 'pretraining'
+        optimizers = {model_type: define_optimizer(model, config_data['pretraining']['optimizer'], lr) for model_type, model in models.items()}
+        model_paths = train_and_log_multi(train_dataloader,validation_dataloader,models,device,criterion,optimizers,save_each_epoch,run_param,Experiment_param)
+
+        # Finetuning models
+        print('Loading pretrained models')
+        for model_type, model_path in model_paths.items():
+            load_checkpoint(models[model_type], model_path)
+        Experiment_param['experiment state'] = 'fine-tuning'
+        optimizers = {model_type: define_optimizer(model, config_data['finetuning']['optimizer'], lr) for model_type, model in models.items()}
+        run_param = {"epochs":config_data['finetuning']['epochs'],
+                    "patience":config_data['finetuning']['patience'],
+                    "batch_size": config_data['finetuning']['batch_size'],
+                    "learning_rate": lr, 
+                    "criterion":config_data['finetuning']['criterion'],
+                    "optimizer": config_data['finetuning']['optimizer'],
+                    "amp": config_data['finetuning'].get('amp', False),
+                    "export_torchscript": config_data['finetuning'].get('export_torchscript', False)}
+
+        print("Finetuning the models...")
+        train_and_log_multi(train_dataloader,validation_dataloader,models,device,criterion,optimizers,save_each_epoch,run_param,Experiment_param)
+
+    elif multiple_experiments == True:
         #Models Creation
         visit_information = {}
         models = {}
@@ -148,7 +193,7 @@ if __name__ == '__main__':
             elif config_data['pretraining']['optimizer'].lower() == 'rmsprop':
                 optimizer = torch.optim.RMSprop(model.parameters(), lr=lr, momentum=0.9, weight_decay=5e-4)
             model_path = train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_each_epoch,run_param,Experiment_param)
-            visit_information[model_type] = {'model_path':model_path,'last_modified_file':get_latest_model_path(parent_directory)}
+            visit_information[model_type] = {'model_path':model_path}
 
         # Finetuning models
         for info in visit_information:
@@ -156,7 +201,7 @@ if __name__ == '__main__':
 
             print('Loading pretrained model')
             model = models[info]
-            model.load_state_dict(torch.load(last_modified_file))
+            load_checkpoint(model, last_modified_file)
             model.to(device)
 
             print('Finetuning - Reading config data from YAML...')
@@ -177,7 +222,9 @@ if __name__ == '__main__':
                         "batch_size": config_data['finetuning']['batch_size'],
                         "learning_rate": lr, 
                         "criterion":config_data['finetuning']['criterion'],
-                        "optimizer": config_data['finetuning']['optimizer']}
+                        "optimizer": config_data['finetuning']['optimizer'],
+                        "amp": config_data['finetuning'].get('amp', False),
+                        "export_torchscript": config_data['finetuning'].get('export_torchscript', False)}
             
             print("Finetuning the model...")
             train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_each_epoch,run_param,Experiment_param)
@@ -197,12 +244,11 @@ if __name__ == '__main__':
         Experiment_param['model type'] = config_data['pretraining']['model_type']
         Experiment_param['experiment state'] = 'pretraining'
         model_path = train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_each_epoch,run_param,Experiment_param)
-        last_modified_file = get_latest_model_path(parent_directory)
 
         # Finetuning
         # Load the pre-trained model
         print('Loading pretrained model')
-        model.load_state_dict(torch.load(model_path))
+        load_checkpoint(model, model_path)
         model.to(device)
 
         print('Finetuning - Reading config data from YAML...')
@@ -223,7 +269,9 @@ if __name__ == '__main__':
                     "batch_size": config_data['finetuning']['batch_size'],
                     "learning_rate": lr, 
                     "criterion":config_data['finetuning']['criterion'],
-                    "optimizer": config_data['finetuning']['optimizer']}
+                    "optimizer": config_data['finetuning']['optimizer'],
+                    "amp": config_data['finetuning'].get('amp', False),
+                    "export_torchscript": config_data['finetuning'].get('export_torchscript', False)}
 
         print("Finetuning the model...")
         train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_each_epoch,run_param,Experiment_param)
@@ -235,4 +283,12 @@ if __name__ == '__main__':
         os.makedirs(config_dir)
     with open(f'''{config_dir}\config.yaml''', 'w') as outfile:
         yaml.dump(config_data, outfile, default_flow_style=False)
-            
+    return Experiment_param
+
+
+if __name__ == '__main__':
+    print("Running Single Experiment !")
+    ROOT = os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    CONFIG = os.path.join(os.getcwd(),"config.yaml")
+    config_data = read_yaml_config(CONFIG)
+    run_experiment(config_data)
\ No newline at end of file
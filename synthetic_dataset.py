@@ -0,0 +1,214 @@
+import os
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+LINK = 'link.json'
+
+
+def _label_array(labels):
+    # fixed width unicode / numeric dtype, never object, so y.npy can be read without pickle
+    return np.asarray(list(labels))
+
+
+def _write_manifest(directory, manifest):
+    # the manifest is written last and atomically, a directory without one is an unfinished write
+    path = os.path.join(directory, MANIFEST)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, path)
+
+
+def write_link(directory, target):
+    # directory/link.json pointing at the dataset directory target (relative when possible, so the tree can be moved)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        target = os.path.relpath(target, directory)
+    except ValueError:
+        # different drives on Windows
+        target = os.path.abspath(target)
+    path = os.path.join(directory, LINK)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({'path': target}, file, indent=2)
+    os.replace(temp_path, path)
+
+
+def resolve_link(directory):
+    # the directory a link.json points to, the directory itself when it has none
+    path = os.path.join(directory, LINK)
+    if not os.path.exists(path):
+        return directory
+    with open(path) as file:
+        return os.path.normpath(os.path.join(directory, json.load(file)['path']))
+
+
+class SyntheticDatasetWriter:
+    '''
+    Writes generated samples as plain .npy arrays plus a manifest.json:
+        X.npy, y.npy                    one array, labels stored contiguously in manifest order
+        X_<i>.npy                       one shard per label when shard_per_label=True (y is implied)
+    The manifest holds shape, dtype and offset / count / file of every label.
+    The arrays are preallocated on disk (open_memmap) from the label counts, chunks are written into
+    place, so writing n samples never needs more memory than one chunk.
+        writer = SyntheticDatasetWriter(directory, {'walking': 1000, 'running': 1000})
+        writer.write('walking', X_chunk)
+        writer.close()
+    '''
+    def __init__(self, directory, counts:dict, shard_per_label=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_per_label = shard_per_label
+        self.labels = list(counts.keys())
+        self.entries = {}
+        offset = 0
+        for index, label in enumerate(self.labels):
+            entry = {'label': label.item() if hasattr(label, 'item') else label, 'offset': offset, 'count': int(counts[label])}
+            if shard_per_label:
+                entry['file'] = f'X_{index}.npy'
+            self.entries[label] = entry
+            offset += entry['count']
+        self.n_samples = offset
+        self.written = {label: 0 for label in self.labels}
+        self.arrays = {}
+        self.sample_shape = None
+        self.dtype = None
+
+    def _allocate(self, X_chunk):
+        # shape and dtype are only known once the generator produced its first chunk
+        self.sample_shape = list(X_chunk.shape[1:])
+        self.dtype = X_chunk.dtype
+        if self.shard_per_label:
+            for label in self.labels:
+                self.arrays[label] = open_memmap(os.path.join(self.directory, self.entries[label]['file']), mode='w+',
+                                                 dtype=self.dtype, shape=(self.entries[label]['count'], *self.sample_shape))
+        else:
+            X = open_memmap(os.path.join(self.directory, 'X.npy'), mode='w+', dtype=self.dtype, shape=(self.n_samples, *self.sample_shape))
+            for label in self.labels:
+                entry = self.entries[label]
+                self.arrays[label] = X[entry['offset']:entry['offset'] + entry['count']]
+
+    def write(self, label, X_chunk):
+        X_chunk = np.asarray(X_chunk)
+        if self.dtype is None:
+            self._allocate(X_chunk)
+        start = self.written[label]
+        if start + X_chunk.shape[0] > self.entries[label]['count']:
+            raise ValueError(f"Label {label} got more than the {self.entries[label]['count']} samples it was allocated")
+        self.arrays[label][start:start + X_chunk.shape[0]] = X_chunk
+        self.written[label] = start + X_chunk.shape[0]
+
+    def close(self):
+        missing = {label: self.entries[label]['count'] - written for label, written in self.written.items() if written != self.entries[label]['count']}
+        if missing:
+            raise ValueError(f"Synthetic dataset {self.directory} is incomplete, samples missing per label: {missing}")
+        for X in self.arrays.values():
+            X.flush()
+        self.arrays = {}
+        if not self.shard_per_label:
+            label_dtype = _label_array(self.labels).dtype
+            y = open_memmap(os.path.join(self.directory, 'y.npy'), mode='w+', dtype=label_dtype, shape=(self.n_samples,))
+            for label in self.labels:
+                entry = self.entries[label]
+                y[entry['offset']:entry['offset'] + entry['count']] = label
+            y.flush()
+            del y
+        _write_manifest(self.directory, {'format_version': FORMAT_VERSION, 'n_samples': self.n_samples, 'sample_shape': self.sample_shape,
+                                         'dtype': np.dtype(self.dtype).str, 'sharded': bool(self.shard_per_label),
+                                         'labels': [self.entries[label] for label in self.labels]})
+        return self.directory
+
+
+def save_synthetic_dataset(directory, generated_data:dict, shard_per_label=False):
+    # in memory {label: X} dict, written in the format of SyntheticDatasetWriter
+    writer = SyntheticDatasetWriter(directory, {label: len(X) for label, X in generated_data.items()}, shard_per_label=shard_per_label)
+    for label, X in generated_data.items():
+        writer.write(label, X)
+    return writer.close()
+
+
+def generate_chunks(model, n_samples:int, chunk_size:int):
+    # samples a DGAN chunk by chunk, only chunk_size samples are alive at a time
+    for start in range(0, n_samples, chunk_size):
+        yield model.generate_numpy(min(chunk_size, n_samples - start))[1]
+
+
+class SyntheticDataset:
+    '''
+    Read side of save_synthetic_dataset. Arrays are opened with np.load(mmap_mode=...), so a label subset
+    or a chunk is read from disk without deserializing the whole set.
+        dataset = SyntheticDataset('DGAN_data/BasicMotions/0.7')
+        X_walking = dataset.label_data('walking')
+        for X_chunk, y_chunk in dataset.iter_chunks(1024): ...
+    A directory holding a link.json (see write_link) is read from the directory it points to.
+    '''
+    def __init__(self, directory, mmap_mode='r'):
+        self.directory = resolve_link(directory)
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(self.directory, MANIFEST)) as file:
+            self.manifest = json.load(file)
+        self.entries = {str(entry['label']): entry for entry in self.manifest['labels']}
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(resolve_link(directory), MANIFEST))
+
+    @property
+    def labels(self):
+        return [entry['label'] for entry in self.manifest['labels']]
+
+    def __len__(self):
+        return self.manifest['n_samples']
+
+    def _load(self, file_name):
+        return np.load(os.path.join(self.directory, file_name), mmap_mode=self.mmap_mode)
+
+    def label_data(self, label):
+        entry = self.entries[str(label)]
+        if self.manifest['sharded']:
+            return self._load(entry['file'])
+        return self._load('X.npy')[entry['offset']:entry['offset'] + entry['count']]
+
+    @property
+    def X(self):
+        if self.manifest['sharded']:
+            # shards are only joined when the full array is asked for
+            return np.concatenate([self.label_data(label) for label in self.labels])
+        return self._load('X.npy')
+
+    @property
+    def y(self):
+        if self.manifest['sharded']:
+            return _label_array(np.repeat(self.labels, [entry['count'] for entry in self.manifest['labels']]))
+        return self._load('y.npy')
+
+    def iter_chunks(self, chunk_size, labels=None):
+        # yields (X, y) blocks of at most chunk_size samples, label by label
+        for label in (self.labels if labels is None else labels):
+            X_label = self.label_data(label)
+            for start in range(0, X_label.shape[0], chunk_size):
+                X_chunk = np.asarray(X_label[start:start + chunk_size])
+                yield X_chunk, _label_array([label] * X_chunk.shape[0])
+
+    def per_label(self):
+        # same layout as the generated_data dict returned by generate_data_per_label
+        return {label: self.label_data(label) for label in self.labels}
+
+    def to_dict(self):
+        # same layout as the concatenated_data dict returned by generate_data_per_label
+        return {'X': self.X, 'y': self.y}
+
+
+def load_synthetic_dataset(path, mmap_mode='r'):
+    '''
+    Returns {'X': ..., 'y': ...} for a synthetic data directory, or for an old generated_data.npy
+    (pickled dict) so that runs written before the manifest format can still be read.
+    '''
+    if os.path.isdir(path) and SyntheticDataset.exists(path):
+        return SyntheticDataset(path, mmap_mode=mmap_mode).to_dict()
+    if os.path.isdir(path):
+        path = os.path.join(path, 'generated_data.npy')
+    return np.load(path, allow_pickle=True).item()
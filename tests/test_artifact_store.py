@@ -0,0 +1,17 @@
+import os
+import numpy as np
+from artifact_store import ArtifactStore
+from synthetic_dataset import save_synthetic_dataset, load_synthetic_dataset, SyntheticDataset
+
+
+def test_dataset_ratio_path_reads_store_data(tmp_path):
+    # DGAN_data/<dataset>/<ratio>, the layout testing.ipynb and wasserstein.ipynb read, resolves to the store entry
+    store = ArtifactStore(root=str(tmp_path / 'DGAN_data' / 'store'))
+    generated = {'a': np.random.randn(4, 5, 2).astype(np.float32), 'b': np.random.randn(4, 5, 2).astype(np.float32)}
+    save_synthetic_dataset(store.generated_data_path('key', 4), generated)
+    path = store.link_generated_data('key', 4, 'BasicMotions', 0.7)
+    assert path == os.path.join(str(tmp_path), 'DGAN_data', 'BasicMotions', '0.7')
+    assert SyntheticDataset.exists(path)
+    data = load_synthetic_dataset(path)
+    np.testing.assert_array_equal(data['X'], np.concatenate([generated['a'], generated['b']]))
+    assert data['y'].tolist() == ['a'] * 4 + ['b'] * 4
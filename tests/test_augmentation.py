@@ -0,0 +1,32 @@
+import numpy as np
+from generators.augmentation import AugmentationGenerator
+from ts_layout import to_time_major, from_time_major
+
+
+def ramp_dataset(n=8, length=50):
+    # time-major (n, length, 2): a ramp in channel 0 and a constant channel, with a single channel
+    # the legacy layout is the same array and a warp along the wrong axis would go unnoticed
+    X = np.zeros((n, length, 2), dtype=np.float32)
+    X[:, :, 0] = np.linspace(0, 1, length, dtype=np.float32)
+    X[:, :, 1] = 5
+    return X
+
+
+def test_time_warp_keeps_ramp_monotone_in_legacy_layout():
+    X = ramp_dataset()
+    model = AugmentationGenerator.train(from_time_major(X), {'augmentation': {'augmentations': ['time_warp']}, 'seed': 0}, {})
+    _, generated = model.generate_numpy(16)
+    generated = to_time_major(generated)
+    assert generated.shape == (16, 50, 2)
+    assert np.all(np.diff(generated[:, :, 0], axis=1) >= -1e-6)
+    np.testing.assert_allclose(generated[:, :, 1], 5)
+
+
+def test_save_load_keeps_layout(tmp_path):
+    X = ramp_dataset()
+    model = AugmentationGenerator.train(X, {'augmentation': {'augmentations': ['time_warp']}, 'seed': 0, 'legacy_layout': False}, {})
+    model.save(str(tmp_path / 'model.pt'))
+    loaded = AugmentationGenerator.load(str(tmp_path / 'model.pt'))
+    assert loaded.legacy_layout is False
+    _, generated = loaded.generate_numpy(4)
+    assert np.all(np.diff(generated[:, :, 0], axis=1) >= -1e-6)
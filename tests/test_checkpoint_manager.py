@@ -0,0 +1,34 @@
+import os
+import torch
+from checkpoint_manager import CheckpointManager
+
+
+def experiment(experiment_id):
+    return {'Dataset name': 'BasicMotions', 'Experiment_id': experiment_id, 'experiment state': 'pretraining', 'model type': 'GRU'}
+
+
+def test_save_returns_none_when_retention_drops_it(tmp_path):
+    manager = CheckpointManager(db_path=str(tmp_path / 'checkpoints.sqlite'), keep_top_k=2, mode='min')
+    state_dict = torch.nn.Linear(2, 2).state_dict()
+    kept = [manager.save(state_dict, str(tmp_path), experiment('e'), epoch, metric) for epoch, metric in enumerate([0.5, 0.4])]
+    assert all(path is not None and os.path.exists(path) for path in kept)
+    # worse than the two kept checkpoints, written and removed in the same call
+    assert manager.save(state_dict, str(tmp_path), experiment('e'), 2, 0.9) is None
+    assert manager.best('e') == os.path.abspath(kept[1])
+
+
+def test_empty_index(tmp_path):
+    manager = CheckpointManager(db_path=str(tmp_path / 'checkpoints.sqlite'))
+    assert manager.best('e') is None
+    assert manager.latest(dataset='BasicMotions') is None
+
+
+def test_retention_keeps_other_phases(tmp_path):
+    # pretrain_and_finetune saves the finetuned checkpoints under their own phase next to pretrained_model.pt
+    manager = CheckpointManager(db_path=str(tmp_path / 'checkpoints.sqlite'), keep_top_k=1, mode='min')
+    state_dict = torch.nn.Linear(2, 2).state_dict()
+    pretrained = manager.save(state_dict, str(tmp_path), experiment('e'), 0, 2.0, phase='pretraining', file_name='pretrained_model.pt')
+    for epoch, metric in enumerate([0.5, 0.4]):
+        manager.save(state_dict, str(tmp_path), experiment('e'), epoch, metric, phase='fine-tuning')
+    assert os.path.exists(pretrained)
+    assert manager.best('e', phase='pretraining') == os.path.abspath(pretrained)
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from fidelity import wasserstein_1d, channel_wasserstein, fidelity_report, score_synthetic_dataset, quality_gate
+from synthetic_dataset import save_synthetic_dataset
+
+
+def legacy_dataset(n=40, length=30, shift=0.0, seed=0):
+    # the (n, dims, seq_len) buffer that load_ts_dataset(legacy_layout=True) returns viewed as (n, seq_len, dims)
+    buffer = np.random.default_rng(seed).normal(size=(n, 2, length))
+    buffer[:, 1] = buffer[:, 1] * 3 + 10 + shift
+    return buffer, buffer.reshape(n, length, 2)
+
+
+def test_quality_gate_per_channel_stats_on_legacy_layout():
+    buffer, X_real = legacy_dataset()
+    _, X_generated = legacy_dataset(shift=1.5)
+    thresholds = {'max_moment_error': None, 'max_acf_error': None, 'max_discriminative_score': None}
+    report, _ = quality_gate(X_real, ['a'] * len(X_real), {'a': X_generated}, thresholds)
+    # per channel std by hand, channel 0 is unchanged and channel 1 is shifted by 1.5 with the same std
+    std = buffer.transpose(1, 0, 2).reshape(2, -1).std(axis=1)
+    expected = np.mean([0, 1.5 / std[1]])
+    np.testing.assert_allclose(report['moment_error'][0], expected, rtol=1e-6)
+    np.testing.assert_allclose(report['wasserstein'][0], expected, rtol=1e-6)
+
+
+def test_wasserstein_1d_equal_sample_counts():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(size=(50, 3)), rng.normal(1, 2, size=(50, 3))
+    # W1 of two equal sized samples is the mean distance between their sorted values
+    np.testing.assert_allclose(wasserstein_1d(a, b), np.abs(np.sort(a, axis=0) - np.sort(b, axis=0)).mean(axis=0))
+
+
+def test_channel_wasserstein_shapes():
+    rng = np.random.default_rng(0)
+    X_real, X_generated = rng.normal(size=(20, 15, 3)), rng.normal(size=(30, 15, 3))
+    assert channel_wasserstein(X_real, X_generated, n_quantiles=64).shape == (3,)
+    assert channel_wasserstein(X_real, X_generated, n_quantiles=64, per_timestep=True).shape == (15, 3)
+    np.testing.assert_allclose(channel_wasserstein(X_real, X_real), 0)
+
+
+def test_score_synthetic_dataset_writes_report(tmp_path):
+    rng = np.random.default_rng(0)
+    X_real = rng.normal(size=(20, 15, 2)).astype(np.float32)
+    y_real = np.array(['a'] * 10 + ['b'] * 10)
+    save_synthetic_dataset(str(tmp_path), {'a': X_real[:10] + 1, 'b': X_real[10:]})
+    report = score_synthetic_dataset(str(tmp_path), X_real, y_real, n_quantiles=64)
+    assert list(report.columns) == ['label', 'channel', 'wasserstein', 'wasserstein_normalized']
+    assert sorted(set(report['label'])) == ['a', 'b'] and len(report) == 4
+    assert os.path.exists(os.path.join(str(tmp_path), 'fidelity.csv'))
+    # the unchanged class is at distance 0, the shifted one is not
+    assert np.allclose(report[report['label'] == 'b']['wasserstein'], 0)
+    assert (report[report['label'] == 'a']['wasserstein'] > 0.5).all()
+    assert fidelity_report(X_real, y_real, {'X': X_real, 'y': y_real})['wasserstein'].max() < 1e-9
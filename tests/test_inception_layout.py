@@ -0,0 +1,40 @@
+import torch
+import pytest
+from models.inception import build_inception_time
+
+
+def inception_config(variable_length):
+    return {'experiment_params': {'num_features': 3, 'sequence_length': 7, 'num_classes': 2},
+            'preprocessing': {'variable_length': variable_length},
+            'pretraining': {'fused_inception': False}}
+
+
+def first_block_input(model, X):
+    # the (n, channels, sequence_length) tensor the first InceptionBlock (and its first conv) receives
+    seen = []
+    handle = model[1].register_forward_pre_hook(lambda module, args: seen.append(args[0]))
+    with torch.no_grad():
+        model(X)
+    handle.remove()
+    return seen[0]
+
+
+def test_time_major_input_is_transposed():
+    # preprocessing.variable_length loads X as (n, sequence_length, features)
+    X = torch.arange(2 * 7 * 3, dtype=torch.float32).reshape(2, 7, 3)
+    received = first_block_input(build_inception_time(inception_config(True)), X)
+    assert received.shape == (2, 3, 7)
+    assert torch.equal(received, X.transpose(1, 2))
+
+
+@pytest.mark.parametrize('variable_length', [False, True])
+def test_channels_reach_first_conv(variable_length):
+    # every channel holds its own constant, whatever the layout it must stay one channel of the first conv input
+    channels = torch.tensor([1.0, 2.0, 3.0])
+    if variable_length:
+        X = channels.view(1, 1, 3).expand(2, 7, 3).contiguous()
+    else:
+        # legacy layout: (n, features, sequence_length) memory exposed with the (n, sequence_length, features) shape
+        X = channels.view(1, 3, 1).expand(2, 3, 7).contiguous().view(2, 7, 3)
+    received = first_block_input(build_inception_time(inception_config(variable_length)), X)
+    assert torch.equal(received, channels.view(1, 3, 1).expand(2, 3, 7))
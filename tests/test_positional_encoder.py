@@ -0,0 +1,28 @@
+import torch
+from positional_encoder import PositionalEncoder
+
+
+def test_buffer_in_input_layout():
+    batch_first = PositionalEncoder(dropout=0.0, max_seq_len=7, d_model=16, batch_first=True)
+    seq_first = PositionalEncoder(dropout=0.0, max_seq_len=7, d_model=16, batch_first=False)
+    assert batch_first.pe.shape == (1, 7, 16)
+    assert seq_first.pe.shape == (7, 1, 16)
+
+
+def test_buffer_not_persistent():
+    encoder = PositionalEncoder(dropout=0.0, max_seq_len=7, d_model=16, batch_first=True)
+    assert 'pe' in dict(encoder.named_buffers())
+    assert 'pe' not in encoder.state_dict()
+    # checkpoints saved while the buffer was persistent still load
+    PositionalEncoder(dropout=0.0, max_seq_len=9, d_model=16, batch_first=True).load_state_dict({'pe': torch.zeros(7, 1, 16)})
+
+
+def test_batch_first_matches_sequence_first():
+    torch.manual_seed(0)
+    x = torch.randn(3, 7, 16)
+    batch_first = PositionalEncoder(dropout=0.0, max_seq_len=7, d_model=16, batch_first=True)
+    seq_first = PositionalEncoder(dropout=0.0, max_seq_len=7, d_model=16, batch_first=False)
+    assert torch.allclose(batch_first(x), seq_first(x.transpose(0, 1)).transpose(0, 1))
+    # shorter sequences use the first positions of the table, whatever the batch size
+    assert torch.allclose(batch_first(x[:, :5]), batch_first(x)[:, :5])
+    assert torch.allclose(batch_first(x[:1]), batch_first(x)[:1])
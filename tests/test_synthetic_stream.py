@@ -0,0 +1,24 @@
+import numpy as np
+from generators.augmentation import AugmentationGenerator
+from utilities_helper import SyntheticStreamDataset
+
+
+def stream(seed, chunk_size=3, batch_size=20):
+    models = {label: AugmentationGenerator(np.full((4, 10, 2), value, dtype=np.float32), params={'augmentations': []}, seed=0)
+              for value, label in enumerate(['a', 'b'])}
+    return SyntheticStreamDataset(models, {'a': 0, 'b': 1}, batch_size, batches_per_epoch=5, chunk_size=chunk_size, seed=seed)
+
+
+def test_small_chunks_still_give_full_batches():
+    # chunk_size * n_labels = 6 < batch_size, every batch takes several rounds of chunks
+    batches = list(stream(seed=0))
+    assert len(batches) == 5
+    for X, y in batches:
+        assert X.shape == (20, 10, 2) and y.shape == (20,)
+        np.testing.assert_array_equal(X[:, 0, 0].numpy(), y.numpy())
+
+
+def test_seeded_shuffle_is_reproducible():
+    first, second = list(stream(seed=1)), list(stream(seed=1))
+    for (_, y_first), (_, y_second) in zip(first, second):
+        np.testing.assert_array_equal(y_first.numpy(), y_second.numpy())
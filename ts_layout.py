@@ -0,0 +1,24 @@
+import numpy as np
+
+# load_ts_dataset / nested_to_array keep the legacy layout by default: the (n, dims, seq_len) buffer of every
+# sample exposed with the (n, seq_len, dims) shape, so axis 1 is not time. Code that works along time or per
+# channel (augmentations, fidelity statistics) converts to the time-major layout first and back afterwards.
+# preprocessing.variable_length loads truly time-major arrays (legacy_layout=False), both functions are then no-ops.
+
+
+def to_time_major(X, legacy_layout:bool=True):
+    # (n, seq_len, dims) with time on axis 1 and channels on the last axis, a view when possible
+    X = np.asarray(X)
+    if not legacy_layout:
+        return X
+    n, length, dims = X.shape
+    return X.reshape(n, dims, length).transpose(0, 2, 1)
+
+
+def from_time_major(X, legacy_layout:bool=True):
+    # inverse of to_time_major
+    X = np.asarray(X)
+    if not legacy_layout:
+        return X
+    n, length, dims = X.shape
+    return np.ascontiguousarray(X.transpose(0, 2, 1)).reshape(n, length, dims)
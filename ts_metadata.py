@@ -0,0 +1,101 @@
+import os
+import codecs
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class TSMetadata:
+    path: str
+    problem_name: Optional[str]
+    series_length: Optional[int]   # None for unequal length problems
+    dimensions: int
+    class_labels: Tuple[str, ...]
+    equal_length: bool
+    univariate: bool
+    missing: bool
+    timestamps: bool
+    encoding: str
+
+    @property
+    def num_classes(self):
+        return len(self.class_labels)
+
+
+def detect_file_encoding(file_path, n_bytes=ENCODING_SNIFF_BYTES):
+    # only a bounded prefix is inspected, the header is always at the top of the file
+    with open(file_path, 'rb') as file:
+        prefix = file.read(n_bytes)
+    try:
+        # incremental decoder so a multi-byte char cut at the prefix boundary is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        import chardet
+        return chardet.detect(prefix)['encoding'] or 'latin-1'
+    except ImportError:
+        return 'latin-1'
+
+
+def _parse_bool(value):
+    return value.strip().lower() == 'true'
+
+
+@lru_cache(maxsize=None)
+def _read_ts_metadata(path, mtime_ns, size):
+    encoding = detect_file_encoding(path)
+    header = {}
+    # stream the header line by line and stop at @data, the series are never read
+    with open(path, 'r', encoding=encoding, errors='replace') as file:
+        for line in file:
+            line = line.strip()
+            if not line.startswith('@'):
+                continue
+            tag, _, value = line.partition(' ')
+            tag = tag[1:].lower()
+            if tag == 'data':
+                break
+            header[tag] = value.strip()
+
+    class_labels = ()
+    if 'classlabel' in header:
+        flag, _, labels = header['classlabel'].partition(' ')
+        if _parse_bool(flag):
+            class_labels = tuple(labels.split())
+    univariate = _parse_bool(header.get('univariate', 'true'))
+    dimensions = int(header['dimensions']) if 'dimensions' in header else (1 if univariate else None)
+    series_length = int(header['serieslength']) if 'serieslength' in header else None
+    return TSMetadata(path=path,
+                      problem_name=header.get('problemname'),
+                      series_length=series_length,
+                      dimensions=dimensions,
+                      class_labels=class_labels,
+                      equal_length=_parse_bool(header.get('equallength', 'true' if series_length else 'false')),
+                      univariate=univariate,
+                      missing=_parse_bool(header.get('missing', 'false')),
+                      timestamps=_parse_bool(header.get('timestamps', 'false')),
+                      encoding=encoding)
+
+
+def read_ts_metadata(path) -> TSMetadata:
+    '''
+    Reads only the header of a .ts file (everything before @data).
+    Results are memoized per file and invalidated when the file's mtime or size changes.
+    '''
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _read_ts_metadata(path, stat.st_mtime_ns, stat.st_size)
+
+
+def extract_metadata(path):
+    # kept with the old signature for the scripts: (series_length, dimensions, num_classes)
+    metadata = read_ts_metadata(path)
+    print("Series Length:", metadata.series_length)
+    print("Dimensions:", metadata.dimensions)
+    print("Unique labels:", list(metadata.class_labels))
+    return metadata.series_length, metadata.dimensions, metadata.num_classes
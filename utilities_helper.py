@@ -1,7 +1,5 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
 # import seaborn as sns
 import random
 import os
@@ -9,24 +7,34 @@ import re
 import sys
 import time
 import datetime
-from gretel_synthetics.timeseries_dgan.dgan import DGAN
-from gretel_synthetics.timeseries_dgan.config import DGANConfig,OutputType
+import copy
+import io
+import queue
+import threading
 import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-from torch.utils.data import DataLoader,Dataset
-from sklearn.model_selection import train_test_split, StratifiedKFold, StratifiedShuffleSplit
-from sktime.datasets import load_from_ucr_tsv_to_dataframe
-from sktime.datasets import load_from_tsfile
-import neptune.new as neptune
-import datetime
+from torch.utils.data import DataLoader,Dataset,IterableDataset,Sampler,BatchSampler,RandomSampler,SequentialSampler
+# gretel (DGAN), sktime and sklearn are imported inside the functions that use them, so that importing
+# the training helpers stays cheap; neptune is only imported by the tracker's writer thread
+from experiment_tracker import create_tracker, configure_tracking, TRACKING
+from checkpoint_manager import CheckpointManager, configure_checkpoints
+from fidelity import fidelity_report, fidelity_score, score_synthetic_dataset, quality_gate, generator_fidelity
+from artifact_store import ArtifactStore
+from conditional_dgan import ConditionalDGAN, CONDITIONAL_KEY
+from synthetic_dataset import save_synthetic_dataset, load_synthetic_dataset, SyntheticDataset, SyntheticDatasetWriter, generate_chunks
+from models import build_model, register_model, available_models
+from generators import train_generator, load_generator, register_generator, available_generators
+from models.recurrent import LSTM_Classifier, GRU_Classifier
+from models.inception import correct_sizes, pass_through, Flatten, Reshape, Inception, FusedInception, InceptionBlock, InceptionTranspose, InceptionTransposeBlock
 import uuid
 import pickle
-from sklearn.metrics import roc_auc_score, average_precision_score, confusion_matrix, matthews_corrcoef, cohen_kappa_score, f1_score, precision_score, recall_score
 import yaml
-import chardet
+from ts_metadata import TSMetadata, read_ts_metadata, extract_metadata
 
 class TimeSeriesDataset(Dataset):    
 	def __init__(self, X, y, transform=None, trarget_transform=None):
@@ -46,344 +54,110 @@ class TimeSeriesDataset(Dataset):
 		if self.target_transform:
 			y = self.target_transform(y)
 		return torch.tensor(X), torch.tensor(y)
-	
 
-class LSTM_Classifier(nn.Module):
-	def __init__(self, input_dim=31, hidden_dim=256, num_layers=1, output_dim=5, dropout=0):
-		'''
-		input_dim = number of features at each time step 
-		hidden_dim = number of features produced by each LSTM cell (in each layer)
-		num_layers = number of LSTM layers
-		output_dim = number of classes (number of activities)
-		'''
-		super().__init__()
-		self.hidden_dim = hidden_dim
-		self.num_layers = num_layers
-		self.lstm = nn.LSTM(input_size=input_dim, hidden_size=hidden_dim, 
-							num_layers=num_layers, batch_first=True, dropout=dropout)
-		self.fc = nn.Linear(hidden_dim, output_dim)
-		self.softmax = nn.Softmax(dim=1)
-		
-		
-	def forward(self, X):
-		_, (h_n, c_n) = self.lstm(X)  # (h_0, c_0) default to zeros
-		out = self.fc(h_n[-1,:,:])
-		out = self.softmax(out)
-		return out
-	
 
-class GRU_Classifier(nn.Module):
-	def __init__(self, input_size, hidden_size, num_layers, num_classes):
-		super(GRU_Classifier, self).__init__()
-		self.hidden_size = hidden_size
-		self.num_layers = num_layers
-		self.gru = nn.GRU(input_size, hidden_size, num_layers, batch_first=True)
-		self.fc = nn.Linear(hidden_size, num_classes)
-		
-	def forward(self, x):
-		h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(device=x.device)
-		out, _ = self.gru(x, h0.detach())
-		out = self.fc(out[:, -1, :])
-		return out
-	
-def correct_sizes(sizes):
-	corrected_sizes = [s if s % 2 != 0 else s - 1 for s in sizes]
-	return corrected_sizes
+class TensorTimeSeriesDataset(Dataset):
+	'''
+	In-memory dataset backed by one float32 tensor shared with the numpy array (torch.from_numpy, no copy).
+	__getitem__ accepts a single index or a list / tensor of indices, so together with a BatchSampler
+	(see create_batch_dataloader) a whole batch is fetched with one fancy-indexing call and no collate.
+	With lengths (true length of every zero padded series) items are (X, y, lengths) instead of (X, y).
+	'''
+	def __init__(self, X, y, lengths=None):
+		X = np.asarray(X)
+		if X.dtype != np.float32 or not X.flags['C_CONTIGUOUS'] or not X.flags['WRITEABLE']:
+			# read-only memmaps and float64 arrays are converted once here instead of per sample
+			X = np.array(X, dtype=np.float32, order='C')
+		self.X = torch.from_numpy(X)
+		self.y = torch.from_numpy(np.asarray(y, dtype=np.int64))
+		self.lengths = None if lengths is None else torch.from_numpy(np.asarray(lengths, dtype=np.int64))
 
+	def __len__(self):
+		return len(self.y)
 
-def pass_through(X):
-	return X
+	def __getitem__(self, idx):
+		if isinstance(idx, list):
+			idx = torch.as_tensor(idx)
+		if self.lengths is None:
+			return self.X[idx], self.y[idx]
+		return self.X[idx], self.y[idx], self.lengths[idx]
+
+
+class MemmapTimeSeriesDataset(Dataset):
+	'''
+	Dataset over a np.memmap (e.g. streamed synthetic data), a batch is read from disk with one
+	fancy-indexing call and converted to float32, memory stays bounded by the batch size.
+	indices selects the rows of X that belong to this dataset (train / validation split without a copy).
+	'''
+	def __init__(self, X, y, indices=None, lengths=None):
+		self.X = X
+		self.indices = np.arange(len(X)) if indices is None else np.asarray(indices)
+		self.y = torch.from_numpy(np.asarray(y, dtype=np.int64)[self.indices])
+		self.lengths = None if lengths is None else torch.from_numpy(np.asarray(lengths, dtype=np.int64)[self.indices])
 
-class Flatten(nn.Module):
-	def __init__(self, out_features):
-		super(Flatten, self).__init__()
-		self.output_dim = out_features
+	def __len__(self):
+		return len(self.indices)
+
+	def __getitem__(self, idx):
+		rows = self.indices[idx]
+		X = torch.from_numpy(np.array(self.X[rows], dtype=np.float32))
+		if self.lengths is None:
+			return X, self.y[idx]
+		return X, self.y[idx], self.lengths[idx]
+
+
+class LengthBucketBatchSampler(Sampler):
+	'''
+	Batches of samples with similar lengths: indices are sorted by length (ties broken at random)
+	and cut into batches, only the order of the batches is shuffled. Packed RNN batches then have
+	little padding left, and the batch max length that pack_sequence trims to stays close to every sample.
+	'''
+	def __init__(self, lengths, batch_size, shuffle=True, drop_last=False):
+		self.lengths = np.asarray(lengths)
+		self.batch_size = batch_size
+		self.shuffle = shuffle
+		self.drop_last = drop_last
 
-	def forward(self, x):
-		return x.view(-1, self.output_dim)
-	
-class Reshape(nn.Module):
-	def __init__(self, out_shape):
-		super(Reshape, self).__init__()
-		self.out_shape = out_shape
-
-	def forward(self, x):
-		return x.view(-1, *self.out_shape)
-
-class Inception(nn.Module):
-	def __init__(self, in_channels,
-				 n_filters, 
-				kernel_sizes=[9, 19, 39], 
-				bottleneck_channels=32, 
-				activation=nn.ReLU(), 
-				return_indices=False):
-		"""
-		: param in_channels				Number of input channels (input features)
-		: param n_filters				Number of filters per convolution layer => out_channels = 4*n_filters
-		: param kernel_sizes			List of kernel sizes for each convolution.
-										Each kernel size must be odd number that meets -> "kernel_size % 2 !=0".
-										This is nessesery because of padding size.
-										For correction of kernel_sizes use function "correct_sizes". 
-		: param bottleneck_channels		Number of output channels in bottleneck. 
-										Bottleneck wont be used if number of in_channels is equal to 1.
-		: param activation				Activation function for output tensor (nn.ReLU()). 
-		: param return_indices			Indices are needed only if we want to create decoder with InceptionTranspose with MaxUnpool1d. 
-		"""
-		super(Inception, self).__init__()
-		self.return_indices=return_indices
-		if in_channels > 1:
-			self.bottleneck = nn.Conv1d(
-								in_channels=in_channels, 
-								out_channels=bottleneck_channels, 
-								kernel_size=1, 
-								stride=1, 
-								bias=False
-								)
-		else:
-			self.bottleneck = pass_through
-			bottleneck_channels = 1
-
-		self.conv_from_bottleneck_1 = nn.Conv1d(
-										in_channels=bottleneck_channels, 
-										out_channels=n_filters, 
-										kernel_size=kernel_sizes[0], 
-										stride=1, 
-										padding=kernel_sizes[0]//2, 
-										bias=False
-										)
-		self.conv_from_bottleneck_2 = nn.Conv1d(
-										in_channels=bottleneck_channels, 
-										out_channels=n_filters, 
-										kernel_size=kernel_sizes[1], 
-										stride=1, 
-										padding=kernel_sizes[1]//2, 
-										bias=False
-										)
-		self.conv_from_bottleneck_3 = nn.Conv1d(
-										in_channels=bottleneck_channels, 
-										out_channels=n_filters, 
-										kernel_size=kernel_sizes[2], 
-										stride=1, 
-										padding=kernel_sizes[2]//2, 
-										bias=False
-										)
-		self.max_pool = nn.MaxPool1d(kernel_size=3, stride=1, padding=1, return_indices=return_indices)
-		self.conv_from_maxpool = nn.Conv1d(
-									in_channels=in_channels, 
-									out_channels=n_filters, 
-									kernel_size=1, 
-									stride=1,
-									padding=0, 
-									bias=False
-									)
-		self.batch_norm = nn.BatchNorm1d(num_features=4*n_filters)
-		self.activation = activation
-
-	def forward(self, X):
-		# step 1
-		Z_bottleneck = self.bottleneck(X)
-		if self.return_indices:
-			Z_maxpool, indices = self.max_pool(X)
-		else:
-			Z_maxpool = self.max_pool(X)
-		# step 2
-		Z1 = self.conv_from_bottleneck_1(Z_bottleneck)
-		Z2 = self.conv_from_bottleneck_2(Z_bottleneck)
-		Z3 = self.conv_from_bottleneck_3(Z_bottleneck)
-		Z4 = self.conv_from_maxpool(Z_maxpool)
-		# step 3 
-		Z = torch.cat([Z1, Z2, Z3, Z4], axis=1)
-		Z = self.activation(self.batch_norm(Z))
-		if self.return_indices:
-			return Z, indices
-		else:
-			return Z
-
-
-class InceptionBlock(nn.Module):
-	def __init__(self, in_channels, n_filters=32, kernel_sizes=[9,19,39], bottleneck_channels=32, use_residual=True, activation=nn.ReLU(), return_indices=False):
-		super(InceptionBlock, self).__init__()
-		self.use_residual = use_residual
-		self.return_indices = return_indices
-		self.activation = activation
-		self.inception_1 = Inception(
-							in_channels=in_channels,
-							n_filters=n_filters,
-							kernel_sizes=kernel_sizes,
-							bottleneck_channels=bottleneck_channels,
-							activation=activation,
-							return_indices=return_indices
-							)
-		self.inception_2 = Inception(
-							in_channels=4*n_filters,
-							n_filters=n_filters,
-							kernel_sizes=kernel_sizes,
-							bottleneck_channels=bottleneck_channels,
-							activation=activation,
-							return_indices=return_indices
-							)
-		self.inception_3 = Inception(
-							in_channels=4*n_filters,
-							n_filters=n_filters,
-							kernel_sizes=kernel_sizes,
-							bottleneck_channels=bottleneck_channels,
-							activation=activation,
-							return_indices=return_indices
-							)	
-		if self.use_residual:
-			self.residual = nn.Sequential(
-								nn.Conv1d(
-									in_channels=in_channels, 
-									out_channels=4*n_filters, 
-									kernel_size=1,
-									stride=1,
-									padding=0
-									),
-								nn.BatchNorm1d(
-									num_features=4*n_filters
-									)
-								)
-
-	def forward(self, X):
-		if self.return_indices:
-			Z, i1 = self.inception_1(X)
-			Z, i2 = self.inception_2(Z)
-			Z, i3 = self.inception_3(Z)
-		else:
-			Z = self.inception_1(X)
-			Z = self.inception_2(Z)
-			Z = self.inception_3(Z)
-		if self.use_residual:
-			Z = Z + self.residual(X)
-			Z = self.activation(Z)
-		if self.return_indices:
-			return Z,[i1, i2, i3]
+	def __len__(self):
+		if self.drop_last:
+			return len(self.lengths) // self.batch_size
+		return -(-len(self.lengths) // self.batch_size)
+
+	def __iter__(self):
+		if self.shuffle:
+			ties = np.random.permutation(len(self.lengths))
+			order = ties[np.argsort(self.lengths[ties], kind='stable')]
 		else:
-			return Z
-
-
-
-class InceptionTranspose(nn.Module):
-	def __init__(self, in_channels, out_channels, kernel_sizes=[9, 19, 39], bottleneck_channels=32, activation=nn.ReLU()):
-		"""
-		: param in_channels				Number of input channels (input features)
-		: param n_filters				Number of filters per convolution layer => out_channels = 4*n_filters
-		: param kernel_sizes			List of kernel sizes for each convolution.
-										Each kernel size must be odd number that meets -> "kernel_size % 2 !=0".
-										This is nessesery because of padding size.
-										For correction of kernel_sizes use function "correct_sizes". 
-		: param bottleneck_channels		Number of output channels in bottleneck. 
-										Bottleneck wont be used if nuber of in_channels is equal to 1.
-		: param activation				Activation function for output tensor (nn.ReLU()). 
-		"""
-		super(InceptionTranspose, self).__init__()
-		self.activation = activation
-		self.conv_to_bottleneck_1 = nn.ConvTranspose1d(
-										in_channels=in_channels, 
-										out_channels=bottleneck_channels, 
-										kernel_size=kernel_sizes[0], 
-										stride=1, 
-										padding=kernel_sizes[0]//2, 
-										bias=False
-										)
-		self.conv_to_bottleneck_2 = nn.ConvTranspose1d(
-										in_channels=in_channels, 
-										out_channels=bottleneck_channels, 
-										kernel_size=kernel_sizes[1], 
-										stride=1, 
-										padding=kernel_sizes[1]//2, 
-										bias=False
-										)
-		self.conv_to_bottleneck_3 = nn.ConvTranspose1d(
-										in_channels=in_channels, 
-										out_channels=bottleneck_channels, 
-										kernel_size=kernel_sizes[2], 
-										stride=1, 
-										padding=kernel_sizes[2]//2, 
-										bias=False
-										)
-		self.conv_to_maxpool = nn.Conv1d(
-									in_channels=in_channels, 
-									out_channels=out_channels, 
-									kernel_size=1, 
-									stride=1,
-									padding=0, 
-									bias=False
-									)
-		self.max_unpool = nn.MaxUnpool1d(kernel_size=3, stride=1, padding=1)
-		self.bottleneck = nn.Conv1d(
-								in_channels=3*bottleneck_channels, 
-								out_channels=out_channels, 
-								kernel_size=1, 
-								stride=1, 
-								bias=False
-								)
-		self.batch_norm = nn.BatchNorm1d(num_features=out_channels)
-
-		def forward(self, X, indices):
-			Z1 = self.conv_to_bottleneck_1(X)
-			Z2 = self.conv_to_bottleneck_2(X)
-			Z3 = self.conv_to_bottleneck_3(X)
-			Z4 = self.conv_to_maxpool(X)
-
-			Z = torch.cat([Z1, Z2, Z3], axis=1)
-			MUP = self.max_unpool(Z4, indices)
-			BN = self.bottleneck(Z)
-			# another possibility insted of sum BN and MUP is adding 2nd bottleneck transposed convolution
-			
-			return self.activation(self.batch_norm(BN + MUP))
-
-
-class InceptionTransposeBlock(nn.Module):
-	def __init__(self, in_channels, out_channels=32, kernel_sizes=[9,19,39], bottleneck_channels=32, use_residual=True, activation=nn.ReLU()):
-		super(InceptionTransposeBlock, self).__init__()
-		self.use_residual = use_residual
-		self.activation = activation
-		self.inception_1 = InceptionTranspose(
-							in_channels=in_channels,
-							out_channels=in_channels,
-							kernel_sizes=kernel_sizes,
-							bottleneck_channels=bottleneck_channels,
-							activation=activation
-							)
-		self.inception_2 = InceptionTranspose(
-							in_channels=in_channels,
-							out_channels=in_channels,
-							kernel_sizes=kernel_sizes,
-							bottleneck_channels=bottleneck_channels,
-							activation=activation
-							)
-		self.inception_3 = InceptionTranspose(
-							in_channels=in_channels,
-							out_channels=out_channels,
-							kernel_sizes=kernel_sizes,
-							bottleneck_channels=bottleneck_channels,
-							activation=activation
-							)	
-		if self.use_residual:
-			self.residual = nn.Sequential(
-								nn.ConvTranspose1d(
-									in_channels=in_channels, 
-									out_channels=out_channels, 
-									kernel_size=1,
-									stride=1,
-									padding=0
-									),
-								nn.BatchNorm1d(
-									num_features=out_channels
-									)
-								)
-
-	def forward(self, X, indices):
-		assert len(indices)==3
-		Z = self.inception_1(X, indices[2])
-		Z = self.inception_2(Z, indices[1])
-		Z = self.inception_3(Z, indices[0])
-		if self.use_residual:
-			Z = Z + self.residual(X)
-			Z = self.activation(Z)
-		return Z
-	
+			order = np.argsort(self.lengths, kind='stable')
+		batches = [order[start:start + self.batch_size].tolist() for start in range(0, len(order), self.batch_size)]
+		if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+			batches.pop()
+		if self.shuffle:
+			random.shuffle(batches)
+		return iter(batches)
+
+
+def create_batch_dataloader(X, y, batch_size, shuffle=True, drop_last=False, indices=None, lengths=None, bucket_by_length=False):
+	if isinstance(X, np.memmap):
+		dataset = MemmapTimeSeriesDataset(X, y, indices, lengths)
+	else:
+		dataset = TensorTimeSeriesDataset(X if indices is None else X[indices], y if indices is None else np.asarray(y)[indices],
+										lengths if lengths is None or indices is None else np.asarray(lengths)[indices])
+	if bucket_by_length and dataset.lengths is not None:
+		batch_sampler = LengthBucketBatchSampler(dataset.lengths.numpy(), batch_size, shuffle=shuffle, drop_last=drop_last)
+	else:
+		sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+		batch_sampler = BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
+	# batch_size=None disables auto collation, the dataset receives the whole index list of a batch
+	return DataLoader(dataset, sampler=batch_sampler, batch_size=None)
+
+
+def forward_model(model, X, lengths=None):
+	# lengths only reach the models that pack their input (supports_lengths), the others see the padded batch
+	if lengths is not None and getattr(model, 'supports_lengths', False):
+		return model(X, lengths)
+	return model(X)
+
 
 # Functions and Utilities
 def preprocess_dgan(df:pd.DataFrame,sequence_length:int):
@@ -396,6 +170,45 @@ def preprocess_dgan(df:pd.DataFrame,sequence_length:int):
 	data = data.reshape((df.shape[0], sequence_length, df.shape[1]))
 	return data
 
+def nested_to_array(df:pd.DataFrame, sequence_length:int=None, dtype=np.float32, pad:bool=False, pad_value:float=0.0, return_lengths:bool=False, legacy_layout:bool=True):
+	'''
+	Converts the nested DataFrame returned by load_from_tsfile into one preallocated contiguous
+	(n_samples, sequence_length, n_dims) array without iterating over rows.
+	: param sequence_length		Length of the output time axis. Defaults to the longest series in df.
+	: param dtype				Output dtype. With np.float64 the result is identical to preprocess_dgan.
+	: param pad					Allow series shorter than sequence_length, the tail is filled with pad_value.
+	: param return_lengths		Also return an int64 vector with the true length of every sample.
+	: param legacy_layout		Reinterpret the (n_samples, n_dims, sequence_length) buffer as
+								(n_samples, sequence_length, n_dims) exactly like preprocess_dgan does.
+								When False the dims are transposed so that axis 1 really is time.
+	'''
+	n_samples, n_dims = df.shape
+	lengths = np.fromiter((len(cell) for cell in df.iloc[:, 0].values), dtype=np.int64, count=n_samples)
+	if sequence_length is None:
+		sequence_length = int(lengths.max()) if n_samples else 0
+	data = np.full((n_samples, n_dims, sequence_length), pad_value, dtype=dtype)
+	for j, col in enumerate(df.columns):
+		cells = df[col].values
+		col_lengths = np.fromiter((len(cell) for cell in cells), dtype=np.int64, count=n_samples)
+		if (col_lengths > sequence_length).any():
+			raise ValueError(f"Column {col} has series longer than sequence_length={sequence_length}")
+		if (col_lengths == sequence_length).all():
+			# single C level copy for the whole column
+			data[:, j, :] = np.concatenate([np.asarray(cell) for cell in cells]).reshape(n_samples, sequence_length)
+		elif pad:
+			for i, cell in enumerate(cells):
+				data[i, j, :col_lengths[i]] = np.asarray(cell)
+		else:
+			raise ValueError(f"Column {col} has series of unequal length, use pad=True to pad them to {sequence_length}")
+		lengths = np.maximum(lengths, col_lengths)
+	if legacy_layout:
+		data = data.reshape((n_samples, sequence_length, n_dims))
+	else:
+		data = np.ascontiguousarray(data.transpose(0, 2, 1))
+	if return_lengths:
+		return data, lengths
+	return data
+
 def create_dgan_param(config_data):
 	DGAN_param = {'epochs': config_data['datageneration']['epochs'],
 				'attribute_noise_dim': config_data['datageneration']['attribute_noise_dim'],
@@ -422,8 +235,22 @@ def create_dgan_param(config_data):
 				'batch_size':  config_data['datageneration']['batch_size'], 
 				'discriminator_rounds': config_data['datageneration']['discriminator_rounds'], 
 				'generator_rounds': config_data['datageneration']['generator_rounds'],
-				'mixed_precision_training': config_data['datageneration']['mixed_precision_training']
+				'mixed_precision_training': config_data['datageneration']['mixed_precision_training'],
+				'seed': config_data['experiment_params'].get('seed')
 				}
+	if config_data['datageneration'].get('generator_mode', 'per_label') == 'conditional':
+		DGAN_param['generator_mode'] = 'conditional'
+	# like generator_mode, the backend only enters DGAN_param (and the artifact store key) when it is not the default DGAN
+	if config_data['datageneration'].get('generator', 'dgan') != 'dgan':
+		DGAN_param['generator'] = config_data['datageneration']['generator']
+		DGAN_param[DGAN_param['generator']] = config_data['datageneration'].get(DGAN_param['generator'])
+	early_stopping = config_data['datageneration'].get('early_stopping') or {}
+	if early_stopping.get('enabled', False):
+		# only added when enabled, so the artifact store keys of fixed-epoch generators do not change
+		DGAN_param['early_stopping'] = early_stopping
+	if config_data['preprocessing'].get('variable_length', False):
+		# variable_length loads time-major arrays (legacy_layout=False), the generators need to know which layout they get
+		DGAN_param['legacy_layout'] = False
 	return DGAN_param
 
 def define_criterion(config_data):
@@ -435,6 +262,15 @@ def define_criterion(config_data):
 	
 	return criterion
 
+def define_optimizer(model, optimizer_name:str, lr:float):
+	if optimizer_name.lower() == 'adam':
+		optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+	elif optimizer_name.lower() == 'sgd':
+		optimizer = torch.optim.SGD(model.parameters(), lr=lr, momentum=0.9, weight_decay=5e-4)
+	elif optimizer_name.lower() == 'rmsprop':
+		optimizer = torch.optim.RMSprop(model.parameters(), lr=lr, momentum=0.9, weight_decay=5e-4)
+	return optimizer
+
 def create_experiment_param(config_data):
 	Experiment_param ={'experiment state':'data generation',
 					'Experiment_id': f'{datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_{uuid.uuid4().hex}', # experiment unique ID 
@@ -472,83 +308,395 @@ def split_dataset_by_label(X, y):
 #             divisors.append(i)
 #     return divisors
 
-def train_dgan(data:np.ndarray, DGAN_param:dict, Experiment_param:dict):
-	run = neptune.init_run(
-	project="astarteam/FinalProject",
-	api_token="eyJhcGlfYWRkcmVzcyI6Imh0dHBzOi8vYXBwLm5lcHR1bmUuYWkiLCJhcGlfdXJsIjoiaHR0cHM6Ly9hcHAubmVwdHVuZS5haSIsImFwaV9rZXkiOiJhMDI5YzIxMy00NjE1LTQ2MDUtOTk3NS1jNDJhMjIzZDE0NDMifQ==",
-	)  # your credentialscredentials
-	DGAN_param['sample_len'] = data.shape[1]     # random.choice(get_divisor(data.shape[1])[-3:])
-	DGAN_param['max_sequence_len'] = data.shape[1]
-	DGAN_param['batch_size'] = min(1000, data.shape[0])
-	run['Experiment_param'] = Experiment_param
-	run["DGAN_param"] = DGAN_param
-
-	model = DGAN(DGANConfig(
-		max_sequence_len=DGAN_param['max_sequence_len'],
-		sample_len=DGAN_param['sample_len'],
-		batch_size=DGAN_param['batch_size'] ,
-		apply_feature_scaling=DGAN_param['apply_feature_scaling'],
-		apply_example_scaling=DGAN_param['apply_example_scaling'],
-		use_attribute_discriminator=DGAN_param['use_attribute_discriminator'],
-		generator_learning_rate=DGAN_param['generator_learning_rate'],
-		discriminator_learning_rate=DGAN_param['discriminator_learning_rate'],
-		epochs=DGAN_param['epochs'],
-		gradient_penalty_coef = DGAN_param['gradient_penalty_coef'],
-	))
-
-	model.train_numpy(
-		data,
-		feature_types=[OutputType.CONTINUOUS] * data.shape[2],
-	)
-	# run.stop()
+def train_dgan(data:np.ndarray, DGAN_param:dict, Experiment_param:dict, attributes:np.ndarray=None):
+	'''
+	Trains one DGAN on data (n, seq_len, dims). attributes (n, n_attributes) are optional discrete
+	attributes per sample, e.g. the label index of a ConditionalDGAN.
+	'''
+	from gretel_synthetics.timeseries_dgan.dgan import DGAN
+	from gretel_synthetics.timeseries_dgan.config import DGANConfig,OutputType
+	run = create_tracker()
+	try:
+		early_stopping = DGAN_param.get('early_stopping') or {}
+		if early_stopping.get('enabled', False):
+			train_rows, eval_rows = holdout_split(len(data), early_stopping.get('holdout_fraction', 0.2), DGAN_param.get('seed'))
+			data, X_eval = data[train_rows], data[eval_rows]
+			attributes = None if attributes is None else attributes[train_rows]
+		DGAN_param['sample_len'] = data.shape[1]     # random.choice(get_divisor(data.shape[1])[-3:])
+		DGAN_param['max_sequence_len'] = data.shape[1]
+		DGAN_param['batch_size'] = min(1000, data.shape[0])
+		run['Experiment_param'] = Experiment_param
+		run["DGAN_param"] = DGAN_param
+		if DGAN_param.get('seed') is not None:
+			# same data + config + seed gives the same generator, which is what makes the artifact store reusable
+			torch.manual_seed(DGAN_param['seed'])
+			np.random.seed(DGAN_param['seed'])
+
+		model = DGAN(DGANConfig(
+			max_sequence_len=DGAN_param['max_sequence_len'],
+			sample_len=DGAN_param['sample_len'],
+			batch_size=DGAN_param['batch_size'] ,
+			apply_feature_scaling=DGAN_param['apply_feature_scaling'],
+			apply_example_scaling=DGAN_param['apply_example_scaling'],
+			use_attribute_discriminator=DGAN_param['use_attribute_discriminator'],
+			generator_learning_rate=DGAN_param['generator_learning_rate'],
+			discriminator_learning_rate=DGAN_param['discriminator_learning_rate'],
+			epochs=DGAN_param['epochs'],
+			gradient_penalty_coef = DGAN_param['gradient_penalty_coef'],
+		))
+
+		fit_param = {'feature_types': [OutputType.CONTINUOUS] * data.shape[2]}
+		if attributes is not None:
+			fit_param.update(attributes=attributes, attribute_types=[OutputType.DISCRETE] * attributes.shape[1])
+		if early_stopping.get('enabled', False):
+			model = train_dgan_early_stopping(model, data, X_eval, fit_param, early_stopping, run, DGAN_param.get('legacy_layout', True))
+		else:
+			model.train_numpy(
+				data,
+				**fit_param,
+			)
+	finally:
+		run.stop()
+	return model
+
+def holdout_split(n_samples:int, holdout_fraction:float, seed=None):
+	# (train, held out) row indices, classes too small to give both sides at least 2 samples are scored on their training data
+	n_holdout = int(n_samples * holdout_fraction)
+	if n_holdout < 2 or n_samples - n_holdout < 2:
+		return np.arange(n_samples), np.arange(n_samples)
+	order = np.random.default_rng(seed).permutation(n_samples)
+	return np.sort(order[n_holdout:]), np.sort(order[:n_holdout])
+
+def train_dgan_early_stopping(model, data:np.ndarray, X_eval:np.ndarray, fit_param:dict, early_stopping:dict, run, legacy_layout:bool=True):
+	'''
+	Epoch-wise driver around DGAN.train_numpy: trains eval_every epochs at a time (up to the configured epochs),
+	then scores n_eval_samples generated samples against the held out X_eval with generator_fidelity.
+	Training stops once the score did not improve by min_delta for patience evaluations,
+	the returned model is the snapshot with the best score. Non-finite scores (a diverged generator) count as
+	evaluations without improvement, if no evaluation gave a finite score the last model is kept.
+	gretel does not expose the GAN losses, the tracker gets the fidelity score and the time of every round.
+	'''
+	from gretel_synthetics.timeseries_dgan.dgan import DGAN
+	max_epochs = model.config.epochs
+	eval_every = early_stopping.get('eval_every', 2)
+	patience = early_stopping.get('patience', 3)
+	min_delta = early_stopping.get('min_delta', 0.0)
+	best_score, best_epoch, best_snapshot = np.inf, 0, None
+	epoch, stale_rounds = 0, 0
+	while epoch < max_epochs:
+		# train_numpy keeps the fitted scaling and network weights between calls, each call runs config.epochs epochs
+		model.config.epochs = min(eval_every, max_epochs - epoch)
+		start = time.perf_counter()
+		model.train_numpy(data, **fit_param)
+		epoch += model.config.epochs
+		_, X_generated = model.generate_numpy(early_stopping.get('n_eval_samples', 500))
+		score = generator_fidelity(X_eval, X_generated, legacy_layout=legacy_layout)
+		run["dgan/fidelity"].log(score)
+		run["dgan/epoch"].log(epoch)
+		run["dgan/round_seconds"].log(time.perf_counter() - start)
+		if np.isfinite(score) and score < best_score - min_delta:
+			best_score, best_epoch, stale_rounds = score, epoch, 0
+			best_snapshot = io.BytesIO()
+			model.save(best_snapshot)
+		else:
+			stale_rounds += 1
+			if stale_rounds >= patience:
+				print(f"Generator fidelity did not improve for {patience} evaluations, stopping at epoch {epoch} (best epoch {best_epoch})")
+				break
+	run["dgan/best_epoch"] = best_epoch
+	run["dgan/best_fidelity"] = best_score
+	run["dgan/epochs_trained"] = epoch
+	if best_snapshot is None:
+		print(f"Generator fidelity was never finite, keeping the model of epoch {epoch}")
+	elif best_epoch != epoch:
+		best_snapshot.seek(0)
+		model = DGAN.load(best_snapshot)
+	model.config.epochs = max_epochs
 	return model
 
 def save_model(model, Experiment_param:dict, label:str):
 	# define directory path
 	directory_path =f'''dataset/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/synthetic_models/'''
-	# create directory if it doesn't exist
-	if not os.path.exists(directory_path):
-		os.makedirs(directory_path)
+	# create directory if it doesn't exist (parallel label workers may race here)
+	os.makedirs(directory_path, exist_ok=True)
 	# define file path
 	file_path = os.path.join(directory_path, f'model_{label}.pt')
 	# save model
 	model.save(file_path)
-	
-
-def train_generator_per_label(splitted_data:pd.DataFrame, DGAN_param:dict, Experiment_param:dict):
+	return file_path
+
+
+def _init_dgan_worker(tracking_config, threads_per_worker):
+	# spawned workers start from a fresh interpreter, so the tracking config and thread limits are set again here
+	configure_tracking(tracking_config)
+	if threads_per_worker:
+		torch.set_num_threads(threads_per_worker)
+		torch.set_num_interop_threads(1)
+
+def _train_dgan_for_label(label, X, DGAN_param:dict, Experiment_param:dict):
+	print(f"Training generator for label {label} (pid {os.getpid()})")
+	DGAN_param = dict(DGAN_param, label=label)
+	model = train_generator(DGAN_param.get('generator', 'dgan'), X, DGAN_param, Experiment_param)
+	return save_model(model, Experiment_param, label)
+
+def train_generator_per_label(splitted_data:pd.DataFrame, DGAN_param:dict, Experiment_param:dict, n_workers:int=1, threads_per_worker:int=None):
+	'''
+	Trains one generator per label, a DGAN unless DGAN_param['generator'] names another backend of the
+	generators registry. With n_workers > 1 the labels are trained in a process pool,
+	each worker limited to threads_per_worker torch threads. Workers save their model with save_model
+	and the parent loads the saved files back into the models dict.
+	A label whose training fails is reported and left out of the returned dict, the other labels continue.
+	'''
+	generator = DGAN_param.get('generator', 'dgan')
 	models = {}
-	for label in splitted_data.keys():
-		print(f"Training generator for label {label}")
-		X = splitted_data[label]['X']
-		DGAN_param['label'] = label
-		model = train_dgan(X, DGAN_param, Experiment_param)
-		save_model(model, Experiment_param, label)
-		models[label] = model
-	return models
-
-def generate_data_per_label(models, Experiment_param,config_data):
+	if n_workers <= 1:
+		for label in splitted_data.keys():
+			print(f"Training generator for label {label}")
+			X = splitted_data[label]['X']
+			DGAN_param['label'] = label
+			model = train_generator(generator, X, DGAN_param, Experiment_param)
+			save_model(model, Experiment_param, label)
+			models[label] = model
+		return models
+
+	failed = {}
+	context = multiprocessing.get_context('spawn')
+	with ProcessPoolExecutor(max_workers=min(n_workers, len(splitted_data)), mp_context=context,
+							initializer=_init_dgan_worker, initargs=(dict(TRACKING), threads_per_worker)) as executor:
+		futures = {executor.submit(_train_dgan_for_label, label, splitted_data[label]['X'], DGAN_param, Experiment_param): label
+					for label in splitted_data.keys()}
+		for future in as_completed(futures):
+			label = futures[future]
+			try:
+				file_path = future.result()
+				models[label] = load_generator(generator, file_path)
+				print(f"Generator for label {label} is ready")
+			except Exception as exc:
+				failed[label] = exc
+				print(f"Training generator for label {label} failed: {exc!r}")
+	if failed:
+		print(f"{len(failed)} of {len(splitted_data)} generators failed: {list(failed.keys())}")
+	# keep the label order of splitted_data
+	return {label: models[label] for label in splitted_data.keys() if label in models}
+
+def train_conditional_generator(splitted_data:dict, DGAN_param:dict, Experiment_param:dict):
+	'''
+	generator_mode 'conditional': one DGAN for all labels of split_dataset_by_label, the label is its attribute.
+	Returns {CONDITIONAL_KEY: ConditionalDGAN}, which train_or_load_synthetic_data and generate_data_per_label
+	use in place of the {label: DGAN} dict of train_generator_per_label.
+	'''
+	print(f"Training one conditional generator for labels {list(splitted_data.keys())}")
+	X, attributes = ConditionalDGAN.label_attributes(splitted_data)
+	DGAN_param['label'] = CONDITIONAL_KEY
+	generator = DGAN_param.get('generator', 'dgan')
+	model = ConditionalDGAN(train_generator(generator, X, DGAN_param, Experiment_param, attributes=attributes), splitted_data.keys(), generator)
+	save_model(model, Experiment_param, CONDITIONAL_KEY)
+	return {CONDITIONAL_KEY: model}
+
+def generator_labels(models):
+	# labels produced by the models of train_generator_per_label / train_conditional_generator
+	return models[CONDITIONAL_KEY].labels if CONDITIONAL_KEY in models else list(models.keys())
+
+def generated_chunks_per_label(models, n_samples:int, chunk_size:int, verbose:bool=True):
+	# (label, X_chunk) from the per label DGANs, or from the single ConditionalDGAN with one batched call for all labels per chunk
+	if CONDITIONAL_KEY in models:
+		yield from models[CONDITIONAL_KEY].generate_chunks({label: n_samples for label in models[CONDITIONAL_KEY].labels}, chunk_size)
+		return
+	for label in models.keys():
+		if verbose:
+			print(f"Generating data for label {label}")
+		for X_chunk in generate_chunks(models[label], n_samples, chunk_size):
+			yield label, X_chunk
+
+def generate_data_per_label(models, Experiment_param,config_data, directory_path=None):
 	generated_data = {}
 	synthetic = config_data['datageneration']['percentage_of_original_data']
-	for label in models.keys():
-		print(f"Generating data for label {label}")
-		generated_data[label] = models[label].generate_numpy(Experiment_param['generate_n_sample'])[1]
+	chunk_size = config_data['datageneration'].get('generation_chunk_size')
+	n_samples = Experiment_param['generate_n_sample']
+	labels = generator_labels(models)
+	# directory_path =f'''dataset/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/data/'''
+	if directory_path is None:
+		directory_path =f'''DGAN_data/{Experiment_param['Dataset name']}/{synthetic}/'''
+
+	if chunk_size:
+		# streaming: chunks go straight into the preallocated X.npy, the returned arrays are memmaps of it
+		writer = SyntheticDatasetWriter(directory_path, {label: n_samples for label in labels},
+										shard_per_label=config_data['datageneration'].get('shard_per_label', False))
+		print(f"Generating data in chunks of {chunk_size}")
+		for label, X_chunk in generated_chunks_per_label(models, n_samples, chunk_size):
+			writer.write(label, X_chunk)
+		writer.close()
+		dataset = SyntheticDataset(directory_path, mmap_mode='r')
+		return dataset.per_label(), dataset.to_dict()
+
+	# without chunking every per label DGAN is sampled in one call, the conditional one in rounds of all the samples
+	chunks = {label: [] for label in labels}
+	for label, X_chunk in generated_chunks_per_label(models, n_samples, n_samples if CONDITIONAL_KEY not in models else n_samples * len(labels)):
+		chunks[label].append(X_chunk)
+	for label in labels:
+		generated_data[label] = np.concatenate(chunks[label])
 	concatenated_data = {'X':np.concatenate([generated_data[label] for label in generated_data.keys()]),
 				'y':np.concatenate([np.array([label]*Experiment_param['generate_n_sample']) for label in generated_data.keys()])}
-	# directory_path =f'''dataset/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/data/'''
-	directory_path =f'''DGAN_data/{Experiment_param['Dataset name']}/{synthetic}/'''
-
-	# create directory if it doesn't exist
-	if not os.path.exists(directory_path):
-		os.makedirs(directory_path)
-	file_path = os.path.join(directory_path, f'generated_data.npy')
-	np.save(file_path, concatenated_data)
+	# raw X.npy / y.npy + manifest.json, readable with mmap and per label (see synthetic_dataset.py)
+	save_synthetic_dataset(directory_path, generated_data, shard_per_label=config_data['datageneration'].get('shard_per_label', False))
 	return generated_data,concatenated_data
 
+def _score_generated_data(directory_path, X, y, config_data):
+	# datageneration.fidelity.report: Wasserstein fidelity of the generated set against the generator training data
+	fidelity = config_data['datageneration'].get('fidelity') or {}
+	if fidelity.get('report', False) and not os.path.exists(os.path.join(directory_path, 'fidelity.csv')):
+		score_synthetic_dataset(directory_path, X, y, max_samples=fidelity.get('max_samples'), n_quantiles=fidelity.get('n_quantiles'),
+								seed=config_data['experiment_params'].get('seed') or 0, legacy_layout=not config_data['preprocessing'].get('variable_length', False))
+
+def train_or_load_synthetic_data(split_data, DGAN_param:dict, Experiment_param:dict, config_data, store=None, n_workers:int=1, threads_per_worker:int=None, generate:bool=True):
+	'''
+	Generator training + generation through the content addressed ArtifactStore.
+	Generated data for the same training data, DGAN config, seed and generate_n_sample is loaded as is,
+	generators that were already trained are loaded and only sampled, everything else is trained and stored.
+	generate=False only trains / loads the generators and returns (models, None, None), see create_stream_dataloaders.
+	'''
+	store = store or ArtifactStore()
+	labels = list(split_data.keys())
+	conditional = DGAN_param.get('generator_mode') == 'conditional'
+	model_labels = [CONDITIONAL_KEY] if conditional else labels
+	X = np.concatenate([split_data[label]['X'] for label in labels])
+	y = np.concatenate([split_data[label]['y'] for label in labels])
+	model_key = store.model_key(X, y, DGAN_param)
+	n_samples = Experiment_param['generate_n_sample']
+	Experiment_param['artifact_key'] = model_key
+	ratio = config_data['datageneration']['percentage_of_original_data']
+	if generate and store.has_generated_data(model_key, n_samples):
+		print(f"Reusing generated data {store.generated_data_path(model_key, n_samples)}")
+		store.link_generated_data(model_key, n_samples, Experiment_param['Dataset name'], ratio)
+		# kept on disk when generation is streamed, otherwise read into memory once
+		dataset = store.load_generated_data(model_key, n_samples, mmap_mode='r' if config_data['datageneration'].get('generation_chunk_size') else None)
+		_score_generated_data(store.generated_data_path(model_key, n_samples), X, y, config_data)
+		return None, dataset.per_label(), dataset.to_dict()
+
+	if store.has_models(model_key, model_labels):
+		print(f"Reusing trained generators {store.model_dir(model_key)}")
+		models = store.load_models(model_key, model_labels, DGAN_param.get('generator', 'dgan'))
+	else:
+		store.write_manifest(model_key, dataset_name=Experiment_param['Dataset name'], DGAN_param=DGAN_param, data_shape=X.shape)
+		if conditional:
+			models = train_conditional_generator(split_data, DGAN_param, Experiment_param)
+		else:
+			models = train_generator_per_label(split_data, DGAN_param, Experiment_param, n_workers=n_workers, threads_per_worker=threads_per_worker)
+		store.save_models(model_key, models)
+	if not generate:
+		return models, None, None
+	# a generator that failed to train leaves the set incomplete, that set is kept out of the store
+	complete = len(models) == len(model_labels)
+	directory_path = store.samples_dir(model_key, n_samples) if complete else f'''DGAN_data/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/'''
+	generated_data, concatenated_data = generate_data_per_label(models, Experiment_param, config_data, directory_path=directory_path)
+	if complete:
+		# DGAN_data/<dataset>/<ratio> keeps pointing at the latest data, for the notebooks reading that layout
+		store.link_generated_data(model_key, n_samples, Experiment_param['Dataset name'], ratio)
+	_score_generated_data(directory_path, X, y, config_data)
+	return models, generated_data, concatenated_data
+
+class SyntheticStreamDataset(IterableDataset):
+	'''
+	Pretraining batches drawn from the trained generators while training, nothing is materialized up front.
+	A background thread samples chunk_size samples per label (one generate_numpy call per label, or one
+	batched call for a ConditionalDGAN), shuffles them with a np.random.default_rng(seed) into full (X, y) batches
+	and keeps at most prefetch_batches of them in a bounded queue. Samples that do not fill a batch are carried
+	into the next round, so chunk_size * n_labels < batch_size only takes several rounds per batch.
+	Memory stays at one round of chunks plus the queue, however many samples are drawn.
+	Every iteration (epoch) yields batches_per_epoch fresh batches, y is mapped through label_to_int.
+	Used with DataLoader(dataset, batch_size=None), see create_stream_dataloaders.
+	'''
+	def __init__(self, models, label_to_int:dict, batch_size:int, batches_per_epoch:int, chunk_size:int=256, prefetch_batches:int=16, seed=None):
+		self.models = models
+		self.label_to_int = label_to_int
+		self.batch_size = batch_size
+		self.batches_per_epoch = batches_per_epoch
+		self.chunk_size = chunk_size
+		self.prefetch_batches = prefetch_batches
+		self.rng = np.random.default_rng(seed)
+
+	def __len__(self):
+		return self.batches_per_epoch
+
+	@staticmethod
+	def _put(batches, item, stop):
+		# blocks while the queue is full, gives up once the consumer stopped
+		while not stop.is_set():
+			try:
+				batches.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def _produce(self, batches, stop):
+		n_labels = len(generator_labels(self.models))
+		# samples of the previous rounds that did not fill a batch
+		X_rest, y_rest = [], []
+		try:
+			while not stop.is_set():
+				X_round, y_round = list(X_rest), list(y_rest)
+				for label, X_chunk in generated_chunks_per_label(self.models, self.chunk_size, self.chunk_size * n_labels, verbose=False):
+					X_round.append(np.asarray(X_chunk, dtype=np.float32))
+					y_round.append(np.full(len(X_chunk), self.label_to_int[label], dtype=np.int64))
+				X_round, y_round = np.concatenate(X_round), np.concatenate(y_round)
+				order = self.rng.permutation(len(y_round))
+				n_full = len(order) - len(order) % self.batch_size
+				X_rest, y_rest = [X_round[order[n_full:]]], [y_round[order[n_full:]]]
+				for start in range(0, n_full, self.batch_size):
+					rows = order[start:start + self.batch_size]
+					if not self._put(batches, (torch.from_numpy(X_round[rows]), torch.from_numpy(y_round[rows])), stop):
+						return
+		except Exception as exc:
+			# re-raised in the training loop
+			self._put(batches, exc, stop)
+
+	def __iter__(self):
+		batches = queue.Queue(maxsize=self.prefetch_batches)
+		stop = threading.Event()
+		worker = threading.Thread(target=self._produce, args=(batches, stop), daemon=True)
+		worker.start()
+		try:
+			for _ in range(self.batches_per_epoch):
+				batch = batches.get()
+				if isinstance(batch, Exception):
+					raise batch
+				yield batch
+		finally:
+			stop.set()
+			worker.join()
+
+def create_stream_dataloaders(models, config_data, n_samples:int):
+	'''
+	pretraining.synthetic_stream counterpart of create_data_loaders: the validation set (validation_size of
+	n_samples per label) is generated once and kept fixed, training batches come from a SyntheticStreamDataset
+	with as many samples per epoch as the materialized training split would have.
+	Returns (train_dataloader, validation_dataloader, {label: X_validation}).
+	'''
+	stream = config_data['pretraining'].get('synthetic_stream') or {}
+	batch_size = stream.get('batch_size', 20)
+	labels = generator_labels(models)
+	label_to_int, _, _ = map_label_int(np.array(labels))
+	n_validation = max(1, int(n_samples * stream.get('validation_size', 0.2)))
+	validation_data = {label: [] for label in labels}
+	for label, X_chunk in generated_chunks_per_label(models, n_validation, n_validation * len(labels) if CONDITIONAL_KEY in models else n_validation):
+		validation_data[label].append(X_chunk)
+	validation_data = {label: np.concatenate(chunks) for label, chunks in validation_data.items()}
+	validation_dataloader = create_batch_dataloader(np.concatenate(list(validation_data.values())),
+													np.concatenate([[label_to_int[label]] * len(X) for label, X in validation_data.items()]),
+													batch_size=batch_size, shuffle=False)
+	batches_per_epoch = int(np.ceil((n_samples - n_validation) * len(labels) / batch_size))
+	dataset = SyntheticStreamDataset(models, label_to_int, batch_size, batches_per_epoch,
+									 chunk_size=stream.get('chunk_size', 256), prefetch_batches=stream.get('prefetch_batches', 16),
+									 seed=config_data['experiment_params'].get('seed'))
+	return DataLoader(dataset, batch_size=None), validation_dataloader, validation_data
+
 def create_data_loaders(X,y,n_splits:int = 1, validation_size:float=0.2):
+	from sklearn.model_selection import StratifiedShuffleSplit
 	ssf = StratifiedShuffleSplit(n_splits=n_splits, test_size=validation_size)
 	train_ind, test_ind = next(ssf.split(X,y))
-	train_dataloader = DataLoader(TimeSeriesDataset(X[train_ind],y[train_ind]),batch_size=20,shuffle=True)
-	validation_dataloader = DataLoader(TimeSeriesDataset(X[test_ind],y[test_ind]),batch_size=20,shuffle=True)
+	train_dataloader = create_batch_dataloader(X,y,batch_size=20,shuffle=True,indices=train_ind)
+	validation_dataloader = create_batch_dataloader(X,y,batch_size=20,shuffle=True,indices=test_ind)
 	return train_dataloader, validation_dataloader
 
 def map_label_int(y):    
@@ -594,45 +742,111 @@ def map_label_int(y):
 # 	train_acc = tp/size    
 # 	print(f'train accuracy = {train_acc}, val_loss = {train_loss:2f}')
 # 	return train_loss,train_acc
-def train_loop(data_loader, model, device, loss_fn, optimizer, print_every_n=200):
+
+
+class ConfusionMatrixAccumulator:
+	'''
+	Streaming confusion matrix that stays on the model's device.
+	update() is one bincount per batch and never syncs with the host, compute() moves the
+	num_classes x num_classes matrix to the CPU once and derives all the epoch metrics from it.
+	Unlike averaging per batch sklearn scores, MCC and kappa are computed over the whole epoch.
+	'''
+	def __init__(self, num_classes=None, device=None):
+		self.num_classes = num_classes
+		self.device = device
+		self.matrix = None
+		if num_classes is not None:
+			self.reset()
+
+	def reset(self):
+		self.matrix = torch.zeros(self.num_classes * self.num_classes, dtype=torch.long, device=self.device)
+
+	def update(self, y, pred):
+		if self.matrix is None:
+			# the number of classes is taken from the model output when it is not given
+			self.num_classes = pred.shape[1] if pred.dim() > 1 else int(torch.max(y.max(), pred.max()).item()) + 1
+			self.device = y.device
+			self.reset()
+		if pred.dim() > 1:
+			pred = pred.argmax(1)
+		self.matrix += torch.bincount(y.view(-1) * self.num_classes + pred.view(-1), minlength=self.num_classes * self.num_classes)
+
+	def confusion_matrix(self):
+		# rows are the true labels, columns the predictions (same as sklearn)
+		return self.matrix.view(self.num_classes, self.num_classes).cpu().double()
+
+	def compute(self):
+		cm = self.confusion_matrix()
+		total = cm.sum()
+		correct = cm.trace()
+		true_sum = cm.sum(1)
+		pred_sum = cm.sum(0)
+		accuracy = (correct / total).item() if total > 0 else 0.0
+		# micro averaged f1 / precision / recall all reduce to accuracy for single label problems
+		mcc_denominator = torch.sqrt((total ** 2 - pred_sum @ pred_sum) * (total ** 2 - true_sum @ true_sum))
+		mcc = ((correct * total - true_sum @ pred_sum) / mcc_denominator).item() if mcc_denominator > 0 else 0.0
+		expected = (true_sum @ pred_sum) / total ** 2 if total > 0 else torch.tensor(1.0, dtype=torch.float64)
+		cohen_kappa = ((correct / total - expected) / (1 - expected)).item() if expected < 1 else 0.0
+		return {'accuracy': accuracy, 'f1_score': accuracy, 'precision_score': accuracy, 'recall_score': accuracy,
+				'matthews_corrcoef': mcc, 'cohen_kappa': cohen_kappa}
+
+
+class MixedPrecision:
+	'''
+	Autocast + gradient scaling for train_loop / validation_loop, built from the 'amp' entry of run_param.
+	amp=False keeps fp32, amp=True picks bfloat16 on CPU and float16 on CUDA, a dtype name forces it.
+	Only float16 needs a GradScaler, bfloat16 has the fp32 exponent range.
+	'''
+	def __init__(self, device, amp=False):
+		self.device_type = torch.device(device).type
+		if amp is True:
+			amp = 'float16' if self.device_type == 'cuda' else 'bfloat16'
+		self.enabled = bool(amp)
+		self.dtype = getattr(torch, amp) if self.enabled else None
+		self.scaler = torch.amp.GradScaler(self.device_type) if self.dtype == torch.float16 else None
+
+	def autocast(self):
+		return torch.autocast(device_type=self.device_type, dtype=self.dtype, enabled=self.enabled)
+
+	def step(self, loss, optimizer):
+		if self.scaler is None:
+			loss.backward()
+			optimizer.step()
+		else:
+			self.scaler.scale(loss).backward()
+			self.scaler.step(optimizer)
+			self.scaler.update()
+
+
+def train_loop(data_loader, model, device, loss_fn, optimizer, print_every_n=200, precision=None):
     model.train()
     size = len(data_loader.dataset)
     num_batches = len(data_loader)
-    train_loss=0;acc=0;train_f1_score=0; train_precision=0; train_recall=0; train_specificity_score=0; train_fpr_score=0
-    mcc, cohen_kappa= 0,0
-    for batch,(X,y) in enumerate(data_loader):
+    train_loss = torch.zeros((), device=device)
+    metrics = ConfusionMatrixAccumulator()
+    precision = precision or MixedPrecision(device)
+    for batch,(X,y,*lengths) in enumerate(data_loader):
         X = X.to(device)
         y = y.type(torch.LongTensor)
         y = y.to(device)
-        pred = model(X.float())
-        loss = loss_fn(pred,y)
-        train_loss += loss
-        pred= pred.argmax(1)
-        acc += (y==pred).type(torch.float).sum().item()
-        y = y.cpu().detach().numpy()
-        pred = pred.cpu().detach().numpy()
-        train_f1_score+= f1_score(y,pred,average='micro')
-        train_precision+= precision_score(y,pred,average='micro')
-        train_recall+= recall_score(y,pred,average='micro')
-        mcc += matthews_corrcoef(y, pred)
-        cohen_kappa += cohen_kappa_score(y, pred)
+        with precision.autocast():
+            pred = forward_model(model, X.float(), *lengths)
+        # the loss is taken in fp32 whatever the autocast dtype
+        loss = loss_fn(pred.float(),y)
+        train_loss += loss.detach()
+        metrics.update(y, pred.detach())
         optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
-        loss, current = loss.item(), batch*len(X)
+        precision.step(loss, optimizer)
         if batch%print_every_n==0:
+            loss, current = loss.item(), batch*len(X)
             print(f'loss={loss:.3f}, {current} / {size}')
 
-    train_loss /= num_batches
-    train_acc = acc/size
-    train_f1_score /= num_batches
-    train_precision /= num_batches
-    train_recall /= num_batches
-    mcc /= num_batches
-    cohen_kappa /= num_batches
+    train_loss = (train_loss / num_batches).item()
+    scores = metrics.compute()
+    train_acc = scores['accuracy']
 
     print(f'train accuracy = {train_acc}, val_loss = {train_loss:2f}')
-    return train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc, cohen_kappa
+    return train_loss, train_acc, scores['f1_score'], scores['precision_score'], scores['recall_score'], scores['matthews_corrcoef'], scores['cohen_kappa']
 
 # def validation_loop(data_loader,model,device,loss_fn):
 # 	model.eval()
@@ -653,168 +867,283 @@ def train_loop(data_loader, model, device, loss_fn, optimizer, print_every_n=200
 # 	val_acc = tp/size
 # 	print(f'validation accuracy = {val_acc}, val_loss = {val_loss:2f}')
 # 	return val_loss,val_acc
-def validation_loop(data_loader,model,device,loss_fn):
+def validation_loop(data_loader,model,device,loss_fn,precision=None):
       model.eval()
       size=len(data_loader.dataset)
       num_batches = len(data_loader)
-      val_loss=0; acc=0; val_f1_score=0; val_precision=0; val_recall=0
-      mcc_val, cohen_kappa_val = 0,0
+      val_loss = torch.zeros((), device=device)
+      metrics = ConfusionMatrixAccumulator()
+      precision = precision or MixedPrecision(device)
       with torch.no_grad():
-            for X,y in data_loader:
+            for X,y,*lengths in data_loader:
                   X = X.to(device)
                   y = y.type(torch.LongTensor)
                   y = y.to(device)
-                  pred = model(X.float())
-                  val_loss += loss_fn(pred,y).item()
-                  pred= pred.argmax(1)
-                  acc += (y==pred).type(torch.float).sum().item()
-                  y = y.cpu().detach().numpy()
-                  pred = pred.cpu().detach().numpy()
-                  val_f1_score+= f1_score(y,pred,average='micro')
-                  val_precision+= precision_score(y,pred,average='micro')
-                  val_recall+= recall_score(y,pred,average='micro')
-                  mcc_val += matthews_corrcoef(y, pred)
-                  cohen_kappa_val += cohen_kappa_score(y, pred)
-
-      val_loss /=num_batches
-      val_acc = acc/size
-      val_f1_score /= num_batches
-      val_precision /= num_batches
-      val_recall /= num_batches
-      mcc_val /= num_batches
-      cohen_kappa_val /= num_batches
+                  with precision.autocast():
+                        pred = forward_model(model, X.float(), *lengths)
+                  val_loss += loss_fn(pred.float(),y)
+                  metrics.update(y, pred)
+
+      val_loss = (val_loss / num_batches).item()
+      scores = metrics.compute()
+      val_acc = scores['accuracy']
 
       print(f'validation accuracy = {val_acc}, val_loss = {val_loss:2f}')
-      return val_loss,val_acc, val_f1_score, val_precision, val_recall, mcc_val, cohen_kappa_val
+      return val_loss,val_acc, scores['f1_score'], scores['precision_score'], scores['recall_score'], scores['matthews_corrcoef'], scores['cohen_kappa']
+
+def train_loop_multi(data_loader, models:dict, device, loss_fn, optimizers:dict, precisions:dict=None):
+	'''
+	train_loop for several models on one pass over data_loader: every batch is fetched, collated and moved
+	to the device once, then each model takes its optimizer step on it.
+	Returns {model_type: same tuple as train_loop}.
+	'''
+	precisions = precisions or {name: MixedPrecision(device) for name in models}
+	train_loss = {name: torch.zeros((), device=device) for name in models}
+	metrics = {name: ConfusionMatrixAccumulator() for name in models}
+	for model in models.values():
+		model.train()
+	num_batches = 0
+	for X,y,*lengths in data_loader:
+		X = X.to(device).float()
+		y = y.type(torch.LongTensor).to(device)
+		for name, model in models.items():
+			with precisions[name].autocast():
+				pred = forward_model(model, X, *lengths)
+			loss = loss_fn(pred.float(),y)
+			train_loss[name] += loss.detach()
+			metrics[name].update(y, pred.detach())
+			optimizers[name].zero_grad()
+			precisions[name].step(loss, optimizers[name])
+		num_batches += 1
+
+	results = {}
+	for name in models:
+		loss = (train_loss[name] / num_batches).item()
+		scores = metrics[name].compute()
+		print(f'{name} train accuracy = {scores["accuracy"]}, val_loss = {loss:2f}')
+		results[name] = (loss, scores['accuracy'], scores['f1_score'], scores['precision_score'], scores['recall_score'], scores['matthews_corrcoef'], scores['cohen_kappa'])
+	return results
+
+def validation_loop_multi(data_loader, models:dict, device, loss_fn, precisions:dict=None):
+	# validation_loop for several models on one pass over data_loader, returns {model_type: validation_loop tuple}
+	precisions = precisions or {name: MixedPrecision(device) for name in models}
+	val_loss = {name: torch.zeros((), device=device) for name in models}
+	metrics = {name: ConfusionMatrixAccumulator() for name in models}
+	for model in models.values():
+		model.eval()
+	num_batches = 0
+	with torch.no_grad():
+		for X,y,*lengths in data_loader:
+			X = X.to(device).float()
+			y = y.type(torch.LongTensor).to(device)
+			for name, model in models.items():
+				with precisions[name].autocast():
+					pred = forward_model(model, X, *lengths)
+				val_loss[name] += loss_fn(pred.float(),y)
+				metrics[name].update(y, pred)
+			num_batches += 1
+
+	results = {}
+	for name in models:
+		loss = (val_loss[name] / num_batches).item()
+		scores = metrics[name].compute()
+		print(f'{name} validation accuracy = {scores["accuracy"]}, val_loss = {loss:2f}')
+		results[name] = (loss, scores['accuracy'], scores['f1_score'], scores['precision_score'], scores['recall_score'], scores['matthews_corrcoef'], scores['cohen_kappa'])
+	return results
 
 def pretrain_and_finetune(synthetic_dataloader,train_dataloader,validation_dataloader,model,device,criterion,optimizer,run_param,experiment_param):
 	print(f'''Pretraining : {run_param['epochs']} epochs''')
-	run = neptune.init_run(
-	project="astarteam/FinalProject",
-	api_token="eyJhcGlfYWRkcmVzcyI6Imh0dHBzOi8vYXBwLm5lcHR1bmUuYWkiLCJhcGlfdXJsIjoiaHR0cHM6Ly9hcHAubmVwdHVuZS5haSIsImFwaV9rZXkiOiJhMDI5YzIxMy00NjE1LTQ2MDUtOTk3NS1jNDJhMjIzZDE0NDMifQ==")  # your credentialscredentials
-	directory_path = f'''dataset/{experiment_param['Dataset name']}/{experiment_param['Experiment_id']}/{experiment_param['experiment state']}/'''
+	run = create_tracker()
+	try:
+		directory_path = f'''dataset/{experiment_param['Dataset name']}/{experiment_param['Experiment_id']}/{experiment_param['experiment state']}/'''
+
+		if not os.path.exists(directory_path):
+			os.makedirs(directory_path)
+
+		run["parameters"] = run_param
+		run['Experiment_param'] = experiment_param
+		precision = MixedPrecision(device, run_param.get('amp', False))
+		checkpoints = CheckpointManager()
+		best_loss = np.inf
+		model_path = None
+		for epoch in range(run_param['epochs']):
+		# Train
+			train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc_train, cohen_kappa_train = train_loop(data_loader = synthetic_dataloader, model=model, device = device, loss_fn = criterion, optimizer = optimizer, precision = precision)
+			run["pretrain/accuracy"].log(train_acc)
+			run["pretrain/loss"].log(train_loss)
+			run["pretrain/f1_score"].log(train_f1_score)
+			run["pretrain/precision_score"].log(train_precision)
+			run["pretrain/recall_score"].log(train_recall)
+			run["pretrain/matthews_corrcoef"].log(mcc_train)
+			run["pretrain/cohen_kappa"].log(cohen_kappa_train)
+			if train_acc >= 0.99:
+				print(f"Accuracy has reached 0.99, stopping pretraining at epoch :{epoch}.")
+				break
 
-	if not os.path.exists(directory_path):
-		os.makedirs(directory_path)
 
-	run["parameters"] = run_param
-	run['Experiment_param'] = experiment_param
-	best_loss = np.inf
-	for epoch in range(run_param['epochs']):
-	# Train
-		train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc_train, cohen_kappa_train = train_loop(data_loader = synthetic_dataloader, model=model, device = device, loss_fn = criterion, optimizer = optimizer)
-		run["pretrain/accuracy"].log(train_acc)
-		run["pretrain/loss"].log(train_loss)
-		run["pretrain/f1_score"].log(train_f1_score)
-		run["pretrain/precision_score"].log(train_precision)
-		run["pretrain/recall_score"].log(train_recall)
-		run["pretrain/matthews_corrcoef"].log(mcc_train)
-		run["pretrain/cohen_kappa"].log(cohen_kappa_train)
-		if train_acc >= 0.99:
-			print(f"Accuracy has reached 0.99, stopping pretraining at epoch :{epoch}.")
-			break
-
-
-	print("Finished Pre-training")
-
-	# Save pretrained model
-	torch.save(model.state_dict(), os.path.join(directory_path, f'pretrained_model.pt'))
-
-	# Load pretrained model
-	model.load_state_dict(torch.load(os.path.join(directory_path, f'pretrained_model.pt')))
-	print("Pretrained model is loaded succesfully")
-
-	# Fine-tune
-	print(f'''Finetuning : {run_param['epochs']} epochs''')
-	for epoch in range(run_param['epochs']):
-	# Train
-		train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc_train, cohen_kappa_train = train_loop(train_dataloader, model, device, criterion, optimizer)
-		run["finetune_training/accuracy"].log(train_acc)
-		run["finetune_training/loss"].log(train_loss)
-		run["finetune_training/f1_score"].log(train_f1_score)
-		run["finetune_training/precision_score"].log(train_precision)
-		run["finetune_training/recall_score"].log(train_recall)
-		run["finetune_training/matthews_corrcoef"].log(mcc_train)
-		run["finetune_training/cohen_kappa"].log(cohen_kappa_train)
-	# Validation
-		val_loss,val_acc, val_f1_score, val_precision, val_recall, mcc_val, cohen_kappa_val = validation_loop(validation_dataloader, model, device, criterion)
-		run["finetune_validation/accuracy"].log(val_acc)
-		run["finetune_validation/loss"].log(val_loss)
-		run["finetune_validation/f1_score"].log(val_f1_score)
-		run["finetune_validation/precision_score"].log(val_precision)
-		run["finetune_validation/recall_score"].log(val_recall)
-		run["finetune_validation/matthews_corrcoef"].log(mcc_val)
-		run["finetune_validation/cohen_kappa"].log(cohen_kappa_val)
-
-		if val_loss < best_loss:
-			# save the model
-			model_path = f'''{directory_path}model_{experiment_param["model type"]}_.pt'''
-			torch.save(model.state_dict(), model_path)
-			best_loss = val_loss
-			early_stopping_counter = 0
-		else:
-			early_stopping_counter += 1
+		print("Finished Pre-training")
+
+		# Save pretrained model
+		pretrained_path = checkpoints.save(unwrap_model(model).state_dict(), directory_path, experiment_param, epoch, train_loss, phase='pretraining', file_name='pretrained_model.pt')
+
+		# Load pretrained model
+		load_checkpoint(model, pretrained_path)
+		print("Pretrained model is loaded succesfully")
+
+		# Fine-tune
+		print(f'''Finetuning : {run_param['epochs']} epochs''')
+		for epoch in range(run_param['epochs']):
+		# Train
+			train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc_train, cohen_kappa_train = train_loop(train_dataloader, model, device, criterion, optimizer, precision=precision)
+			run["finetune_training/accuracy"].log(train_acc)
+			run["finetune_training/loss"].log(train_loss)
+			run["finetune_training/f1_score"].log(train_f1_score)
+			run["finetune_training/precision_score"].log(train_precision)
+			run["finetune_training/recall_score"].log(train_recall)
+			run["finetune_training/matthews_corrcoef"].log(mcc_train)
+			run["finetune_training/cohen_kappa"].log(cohen_kappa_train)
+		# Validation
+			val_loss,val_acc, val_f1_score, val_precision, val_recall, mcc_val, cohen_kappa_val = validation_loop(validation_dataloader, model, device, criterion, precision=precision)
+			run["finetune_validation/accuracy"].log(val_acc)
+			run["finetune_validation/loss"].log(val_loss)
+			run["finetune_validation/f1_score"].log(val_f1_score)
+			run["finetune_validation/precision_score"].log(val_precision)
+			run["finetune_validation/recall_score"].log(val_recall)
+			run["finetune_validation/matthews_corrcoef"].log(mcc_val)
+			run["finetune_validation/cohen_kappa"].log(cohen_kappa_val)
+
+			if val_loss < best_loss:
+				# save the model
+				# own phase, the retention of the finetuned checkpoints must not compete with pretrained_model.pt
+				model_path = checkpoints.save(unwrap_model(model).state_dict(), directory_path, experiment_param, epoch, val_loss, phase='fine-tuning')
+				best_loss = val_loss
+				early_stopping_counter = 0
+			else:
+				early_stopping_counter += 1
+				# if the early stopping counter has reached the patience, stop training
+				if early_stopping_counter == run_param['patience']:
+					break
+		print("Finished Training and validation, metrics are flushed in the background.")
+	finally:
+		run.stop()
+	return model_path
+
+def train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_model, run_param,Experiment_param):
+	run = create_tracker()
+	try:
+		directory_path = f'''dataset/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/{Experiment_param['experiment state']}/'''
+		if not os.path.exists(directory_path):
+			os.makedirs(directory_path)
+		run["parameters"] = run_param
+		run['Experiment_param'] = Experiment_param
+		precision = MixedPrecision(device, run_param.get('amp', False))
+		checkpoints = CheckpointManager()
+		best_loss = np.inf
+		model_path = None
+		# define the number of epochs and early stopping patience
+		for epoch in range(run_param['epochs']):
+			#Train
+			train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc_train, cohen_kappa_train = train_loop(train_dataloader, model, device, criterion, optimizer, precision=precision)
+			run["train/accuracy"].log(train_acc)
+			run["train/loss"].log(train_loss)
+			run["train/f1_score"].log(train_f1_score)
+			run["train/precision_score"].log(train_precision)
+			run["train/recall_score"].log(train_recall)
+			run["train/matthews_corrcoef"].log(mcc_train)
+			run["train/cohen_kappa"].log(cohen_kappa_train)
+
+			#Evaluate
+			val_loss,val_acc, val_f1_score, val_precision, val_recall, mcc_val, cohen_kappa_val = validation_loop(validation_dataloader, model, device, criterion, precision=precision)
+			run["validation/accuracy"].log(val_acc)
+			run["validation/loss"].log(val_loss)
+			run["validation/f1_score"].log(val_f1_score)
+			run["validation/precision_score"].log(val_precision)
+			run["validation/recall_score"].log(val_recall)
+			run["validation/matthews_corrcoef"].log(mcc_val)
+			run["validation/cohen_kappa"].log(cohen_kappa_val)
+
+			if val_loss < best_loss:
+				if save_model:
+					# save the model
+					model_path = checkpoints.save(unwrap_model(model).state_dict(), directory_path, Experiment_param, epoch, val_loss)
+				best_loss = val_loss
+				early_stopping_counter = 0
+			else:
+				early_stopping_counter += 1
 			# if the early stopping counter has reached the patience, stop training
 			if early_stopping_counter == run_param['patience']:
 				break
-		time.sleep(2)
-	print("Finished Training and validation, now uploading to Neptune.")
-	run.stop()
+		if save_model and run_param.get('export_torchscript', False) and model_path is not None:
+			# the exported artifact holds the best weights, not the ones of the last epoch
+			X_example = next(iter(validation_dataloader))[0]
+			print(f"Exported inference model {export_inference_model(model, X_example.to(device), model_path, state_dict=torch.load(model_path))}")
+		print("Finished Training and validation, metrics are flushed in the background.")
+	finally:
+		run.stop()
 	return model_path
 
-def train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_model, run_param,Experiment_param):
-	run = neptune.init_run(
-	project="astarteam/FinalProject",
-	api_token="eyJhcGlfYWRkcmVzcyI6Imh0dHBzOi8vYXBwLm5lcHR1bmUuYWkiLCJhcGlfdXJsIjoiaHR0cHM6Ly9hcHAubmVwdHVuZS5haSIsImFwaV9rZXkiOiJhMDI5YzIxMy00NjE1LTQ2MDUtOTk3NS1jNDJhMjIzZDE0NDMifQ==")  # your credentialscredentials
+def train_and_log_multi(train_dataloader,validation_dataloader,models:dict,device,criterion,optimizers:dict,save_model,run_param,Experiment_param):
+	'''
+	train_and_log for every model of models_list on one shared data pass (see train_loop_multi).
+	Each model keeps its own tracker run, metrics, early stopping and model_<type>_.pt checkpoint,
+	a model that early stopped is dropped from the following passes.
+	Returns {model_type: path of its best checkpoint}.
+	'''
 	directory_path = f'''dataset/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/{Experiment_param['experiment state']}/'''
 	if not os.path.exists(directory_path):
 		os.makedirs(directory_path)
-	run["parameters"] = run_param
-	run['Experiment_param'] = Experiment_param
-	best_loss = np.inf
-	# define the number of epochs and early stopping patience
-	for epoch in range(run_param['epochs']):
-		#Train
-		train_loss, train_acc, train_f1_score, train_precision, train_recall, mcc_train, cohen_kappa_train = train_loop(train_dataloader, model, device, criterion, optimizer)
-		run["train/accuracy"].log(train_acc)
-		run["train/loss"].log(train_loss)
-		run["train/f1_score"].log(train_f1_score)
-		run["train/precision_score"].log(train_precision)
-		run["train/recall_score"].log(train_recall)
-		run["train/matthews_corrcoef"].log(mcc_train)
-		run["train/cohen_kappa"].log(cohen_kappa_train)
-
-		#Evaluate
-		val_loss,val_acc, val_f1_score, val_precision, val_recall, mcc_val, cohen_kappa_val = validation_loop(validation_dataloader, model, device, criterion)
-		run["validation/accuracy"].log(val_acc)
-		run["validation/loss"].log(val_loss)
-		run["validation/f1_score"].log(val_f1_score)
-		run["validation/precision_score"].log(val_precision)
-		run["validation/recall_score"].log(val_recall)
-		run["validation/matthews_corrcoef"].log(mcc_val)
-		run["validation/cohen_kappa"].log(cohen_kappa_val)
-
-		if val_loss < best_loss:
-			if save_model:
-				# save the model
-				model_path = f'''{directory_path}model_{Experiment_param["model type"]}_.pt'''
-				torch.save(model.state_dict(), model_path)
-			best_loss = val_loss
-			early_stopping_counter = 0
-		else:
-			early_stopping_counter += 1
-		# if the early stopping counter has reached the patience, stop training
-		if early_stopping_counter == run_param['patience']:
-			break
-	time.sleep(2)
-	print("Finished Training and validation, now uploading to Neptune.")
-	run.stop()
-	# return model_path
+	runs, precisions, best_loss, early_stopping_counter, model_paths = {}, {}, {}, {}, {}
+	checkpoints = CheckpointManager()
+	for name in models:
+		runs[name] = create_tracker()
+		runs[name]["parameters"] = run_param
+		runs[name]['Experiment_param'] = {**Experiment_param, 'model type': name}
+		precisions[name] = MixedPrecision(device, run_param.get('amp', False))
+		best_loss[name] = np.inf
+		early_stopping_counter[name] = 0
+		model_paths[name] = None
+	try:
+		active = dict(models)
+		for epoch in range(run_param['epochs']):
+			#Train
+			train_results = train_loop_multi(train_dataloader, active, device, criterion, {name: optimizers[name] for name in active}, precisions)
+			#Evaluate
+			val_results = validation_loop_multi(validation_dataloader, active, device, criterion, precisions)
+			for name in list(active):
+				run = runs[name]
+				for split, results in (('train', train_results[name]), ('validation', val_results[name])):
+					for metric, value in zip(['loss', 'accuracy', 'f1_score', 'precision_score', 'recall_score', 'matthews_corrcoef', 'cohen_kappa'], results):
+						run[f"{split}/{metric}"].log(value)
+
+				val_loss = val_results[name][0]
+				if val_loss < best_loss[name]:
+					if save_model:
+						# save the model
+						model_paths[name] = checkpoints.save(unwrap_model(models[name]).state_dict(), directory_path, Experiment_param, epoch, val_loss, model_type=name)
+					best_loss[name] = val_loss
+					early_stopping_counter[name] = 0
+				else:
+					early_stopping_counter[name] += 1
+				# if the early stopping counter has reached the patience, stop training this model
+				if early_stopping_counter[name] == run_param['patience']:
+					print(f"Early stopping {name} at epoch {epoch}")
+					del active[name]
+			if not active:
+				break
+		for name, model in models.items():
+			if save_model and run_param.get('export_torchscript', False) and model_paths[name] is not None:
+				X_example = next(iter(validation_dataloader))[0]
+				export_inference_model(model, X_example.to(device), model_paths[name], state_dict=torch.load(model_paths[name]))
+	finally:
+		for run in runs.values():
+			run.stop()
+	print("Finished Training and validation, metrics are flushed in the background.")
+	return model_paths
 
 # def train_and_log(train_dataloader,validation_dataloader,model,device,criterion,optimizer,save_model, run_param,Experiment_param):
 # 	run = neptune.init_run(
 # 	project="astarteam/FinalProject",
-# 	api_token="eyJhcGlfYWRkcmVzcyI6Imh0dHBzOi8vYXBwLm5lcHR1bmUuYWkiLCJhcGlfdXJsIjoiaHR0cHM6Ly9hcHAubmVwdHVuZS5haSIsImFwaV9rZXkiOiJhMDI5YzIxMy00NjE1LTQ2MDUtOTk3NS1jNDJhMjIzZDE0NDMifQ==")  # your credentialscredentials
+# 	api_token=os.environ["NEPTUNE_API_TOKEN"])  # your credentialscredentials
 # 	directory_path = f'''dataset/{Experiment_param['Dataset name']}/{Experiment_param['Experiment_id']}/{Experiment_param['experiment state']}/'''
 # 	if not os.path.exists(directory_path):
 # 		os.makedirs(directory_path)
@@ -850,48 +1179,6 @@ def train_and_log(train_dataloader,validation_dataloader,model,device,criterion,
 # 	run.stop()
 # 	return model_path
 
-def detect_file_encoding(file_path):
-    with open(file_path, 'rb') as file:
-        result = chardet.detect(file.read())
-    return result['encoding']
-
-def extract_metadata(path):
-    # Replace 'file_path' with the path to your file
-    file_path = path
-
-    encoding = detect_file_encoding(file_path)
-
-    with open(file_path, 'r', encoding=encoding) as file:
-        file_content = file.read()
-
-    # Extract the seriesLength value
-    series_length_match = re.search(r"@seriesLength (\d+)", file_content)
-    if series_length_match:
-        series_length = int(series_length_match.group(1))
-        print("Series Length:", series_length)
-    else:
-        print("Series Length not found")
-
-    # Extract the dimensions value
-    dimensions_match = re.search(r"@dimensions (\d+)", file_content)
-    if dimensions_match:
-        dimensions = int(dimensions_match.group(1))
-        print("Dimensions:", dimensions)
-    else:
-        print("Dimensions not found")
-
-    # Extract the unique labels from the @classLabel line
-    class_label_match = re.search(r"@classLabel true (.+)", file_content)
-    if class_label_match:
-        class_labels_str = class_label_match.group(1)
-        class_labels = [label for label in class_labels_str.split()]
-        print("Unique labels:", class_labels)
-    else:
-        print("Class labels not found")
-
-    return series_length,dimensions,len(class_labels)
-
-
 def read_yaml_config(CONFIG):
     with open(CONFIG, 'r') as file:
         try:
@@ -903,90 +1190,67 @@ def read_yaml_config(CONFIG):
 	
 
 def create_model_based_on_config(model_str,config_data):
-	if model_str == "GRU":   
-		model = GRU_Classifier(input_size=config_data['experiment_params']['num_features'],
-								hidden_size=config_data['pretraining']['hidden_size'],
-								num_layers=config_data['pretraining']['num_layers_stacked'], 
-								num_classes=config_data['experiment_params']['num_classes'])
-	elif model_str == "LSTM":
-		model = LSTM_Classifier(input_dim=config_data['experiment_params']['num_features'],
-								hidden_dim=config_data['pretraining']['hidden_size'],
-								num_layers=config_data['pretraining']['num_layers_stacked'], 
-								output_dim=config_data['experiment_params']['num_classes'],
-								dropout=config_data['pretraining']['dropout'])
-	elif model_str == "inceptionTime":
-		model = nn.Sequential(
-
-						Reshape((config_data['experiment_params']['num_features'],
-								config_data['experiment_params']['sequence_length'])),
-
-						InceptionBlock(
-							in_channels=config_data['experiment_params']['num_features'], 
-							n_filters=32, 
-							kernel_sizes=[5, 11, 23],
-							bottleneck_channels=32,
-							use_residual=True,
-							activation=nn.ReLU()
-						),
-						InceptionBlock(
-							in_channels=32*4, 
-							n_filters=32, 
-							kernel_sizes=[5, 11, 23],
-							bottleneck_channels=32,
-							use_residual=True,
-							activation=nn.ReLU()
-						),
-						nn.AdaptiveAvgPool1d(output_size=1),
-						Flatten(out_features=32*4*1),
-						nn.Linear(in_features=4*32*1, out_features=config_data['experiment_params']['num_classes'])
-			)
-	elif model_str == "TCN":
-		pass
-	elif model_str == "Transformer":
-		pass
-	elif model_str == "CNN":
-		pass
-	elif model_str == "RNN":
-		pass
-	elif model_str == "NN":
-		pass
+	# architectures live in the models package, see models/__init__.py to add one
+	model = build_model(model_str, config_data)
+	return compile_model(model, config_data['pretraining'].get('compile', False))
+
+def compile_model(model, mode=False, cache_dir='compile_cache'):
+	'''
+	Optional compilation stage, mode is pretraining.compile from config.yaml:
+	False (eager), True (torch.compile default mode) or a torch.compile mode name ('reduce-overhead', ...).
+	torch.compile wraps the model, checkpoints are saved from the eager module (unwrap_model),
+	so state_dict keys and saved model_*.pt files are the same with and without compilation.
+	Inductor's FX graph cache is kept in cache_dir, jobs of the grid with the same model and shape signature
+	(dataset, batch size) reuse the compiled kernels instead of compiling again.
+	'''
+	if not mode:
+		return model
+	os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.abspath(cache_dir))
+	os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+	return torch.compile(model, mode=None if mode is True else mode, dynamic=False)
+
+def unwrap_model(model):
+	# the eager module of a torch.compile'd model, the model itself otherwise
+	return getattr(model, '_orig_mod', model)
+
+def export_inference_model(model, example_input, model_path, state_dict=None):
+	'''
+	Saves a TorchScript (traced) copy of the model next to model_path, model_<type>_.pt -> model_<type>_.torchscript.
+	It is loaded with torch.jit.load and runs without the classes of this file.
+	state_dict (e.g. the best checkpoint) is loaded into the copy, the training model is left untouched.
+	'''
+	export_path = f'{os.path.splitext(model_path)[0]}.torchscript'
+	# a compiled model cannot be traced, the eager module it wraps is exported
+	inference_model = copy.deepcopy(unwrap_model(model))
+	if state_dict is not None:
+		inference_model.load_state_dict(state_dict)
+	inference_model.eval()
+	with torch.no_grad():
+		traced = torch.jit.trace(inference_model, example_input.float())
+	torch.jit.save(traced, export_path)
+	return export_path
+
+
+
+def load_checkpoint(model, model_path):
+	# model_path is None when no checkpoint was kept (save_model off, no epoch improved the validation loss,
+	# or the retention policy of the CheckpointManager dropped it), the model then keeps its in-memory weights
+	if model_path is None:
+		print("No checkpoint was kept, continuing with the in-memory weights of the model")
+		return model
+	unwrap_model(model).load_state_dict(torch.load(model_path))
 	return model
 
-
-
-def get_latest_model_path(parent_directory):
-	# Get the list of all directories
-	all_dirs = [d for d in os.listdir(parent_directory) if os.path.isdir(os.path.join(parent_directory, d))]
-
-	# Get the last modified directory
-	last_modified_dir = max(all_dirs, key=lambda d: os.path.getmtime(os.path.join(parent_directory, d)))
-
-	# Create the path for the 'pretraining' subdirectory
-	pretraining_dir = os.path.join(parent_directory, last_modified_dir, 'pretraining')
-
-	# Find all the .pt files in the 'pretraining' subdirectory
-	model_files = glob.glob(os.path.join(pretraining_dir, '*.pt'))
-
-	# Get the creation time of the first file
-	last_file = model_files[0]
-	last_created_file = last_file
-	last_created_time = os.path.getctime(os.path.join(pretraining_dir, last_created_file))
-
-	for file in model_files:
-		file_path = os.path.join(pretraining_dir, file)
-		file_creation_time = os.path.getctime(file_path)
-
-		if file_creation_time > last_created_time:
-			last_created_file = file
-			last_created_time = file_creation_time
-
-	# Return the first .pt file found (if any)
+def get_latest_model_path(parent_directory, experiment_id=None, model_type=None, phase='pretraining'):
+	# last pretraining checkpoint saved for the dataset of parent_directory (dataset/<name>), looked up in the
+	# checkpoint index instead of scanning every experiment directory, see checkpoint_manager.py
+	dataset_name = re.split(r'[\\/]', parent_directory.rstrip('\\/'))[-1]
+	last_created_file = CheckpointManager().latest(experiment_id=experiment_id, phase=phase, model_type=model_type, dataset=dataset_name)
 	if last_created_file:
 		print(f"The last modified file in the directory is: {last_created_file}")
-		return last_created_file
 	else:
 		print("The directory is empty.")
-		return None
+	return last_created_file
 
 
 	